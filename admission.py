@@ -0,0 +1,75 @@
+import time
+import threading
+from typing import Optional
+from metrics import REGISTRY
+
+ADMISSION_REQUESTS = REGISTRY.counter("localrag_admission_requests_total", "Admission decisions for rate-limited endpoints by result.")
+ADMISSION_WAIT_SECONDS = REGISTRY.histogram("localrag_admission_wait_seconds", "Time requests spent queued for a free slot.")
+
+
+class AdmissionSlot:
+    """A granted slot; release() is idempotent so it can be called from several cleanup paths."""
+    def __init__(self, controller: "AdmissionController"):
+        self._controller = controller
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._controller._release()
+
+
+class AdmissionController:
+    """
+    Bounded concurrency with a bounded wait queue. Up to max_concurrent requests run at
+    once and up to max_queued more wait (at most timeout seconds) for a slot; anything
+    beyond that is turned away immediately so the caller can answer with a fast 503.
+    """
+    def __init__(self, name: str, max_concurrent: int, max_queued: int, timeout: float):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queued = max_queued
+        self.timeout = timeout
+        self._active = 0
+        self._waiting = 0
+        self._condition = threading.Condition()
+
+    def try_acquire(self) -> Optional[AdmissionSlot]:
+        """Returns a slot to release when the work is done, or None if the request should be rejected."""
+        start = time.perf_counter()
+        with self._condition:
+            if self._active < self.max_concurrent and self._waiting == 0:
+                self._active += 1
+                ADMISSION_REQUESTS.inc(endpoint=self.name, result="admitted")
+                return AdmissionSlot(self)
+            if self._waiting >= self.max_queued:
+                ADMISSION_REQUESTS.inc(endpoint=self.name, result="rejected_queue_full")
+                return None
+
+            self._waiting += 1
+            try:
+                admitted = self._condition.wait_for(lambda: self._active < self.max_concurrent, timeout=self.timeout)
+                if admitted:
+                    self._active += 1
+            finally:
+                self._waiting -= 1
+
+        ADMISSION_WAIT_SECONDS.observe(time.perf_counter() - start, endpoint=self.name)
+        if not admitted:
+            ADMISSION_REQUESTS.inc(endpoint=self.name, result="rejected_timeout")
+            return None
+        ADMISSION_REQUESTS.inc(endpoint=self.name, result="queued")
+        return AdmissionSlot(self)
+
+    def _release(self):
+        with self._condition:
+            self._active -= 1
+            self._condition.notify()
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {"active": self._active, "waiting": self._waiting,
+                    "max_concurrent": self.max_concurrent, "max_queued": self.max_queued}
@@ -0,0 +1,138 @@
+import time
+import threading
+import logging
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+import config
+from document_registry import get_document_registry
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+ANSWER_CACHE_REQUESTS = REGISTRY.counter("localrag_answer_cache_requests_total", "Semantic answer cache lookups by result.")
+
+
+def _source_fingerprints(sources: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], Tuple]:
+    # Sources are (knowledge base, filename) pairs; a fingerprint changes whenever the source is re-ingested, modified or deleted
+    fingerprints = {}
+    for knowledge_base, source in sources:
+        document = get_document_registry(knowledge_base).get_document(source)
+        fingerprints[(knowledge_base, source)] = (document["file_hash"], document["ingested_at"]) if document else None
+    return fingerprints
+
+
+class SemanticAnswerCache:
+    """
+    Remembers final answers together with the question embedding and the IDs of the
+    chunks they were generated from. A new question is answered from the cache when it
+    is within max_distance (cosine) of a cached question AND retrieved exactly the same
+    chunks, and none of the contributing source documents changed since.
+    """
+    def __init__(self, max_entries: int, max_distance: float, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.max_distance = max_distance
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # entry id -> entry dict
+        self._next_id = 0
+        self._matrix = None # Stacked unit-length question embeddings, rebuilt lazily
+        self._matrix_ids = []
+        self._lock = threading.Lock()
+
+    def _rebuild_matrix(self):
+        # Called with _lock held
+        self._matrix_ids = list(self._entries.keys())
+        if self._matrix_ids:
+            self._matrix = np.stack([self._entries[entry_id]["embedding"] for entry_id in self._matrix_ids])
+        else:
+            self._matrix = None
+
+    def _remove(self, entry_id: int):
+        # Called with _lock held
+        self._entries.pop(entry_id, None)
+        self._matrix = None
+
+    def lookup(self, query_embedding: List[float], chunk_ids: Iterable[str]) -> Optional[str]:
+        """Returns a cached answer for an equivalent question with identical context, or None."""
+        chunk_ids = tuple(sorted(chunk_ids))
+        query = np.asarray(query_embedding, dtype=np.float32)
+        query /= (np.linalg.norm(query) or 1.0)
+
+        with self._lock:
+            if not self._entries:
+                ANSWER_CACHE_REQUESTS.inc(result="miss")
+                return None
+            if self._matrix is None:
+                self._rebuild_matrix()
+            distances = 1.0 - self._matrix @ query
+            candidates = [self._matrix_ids[i] for i in np.argsort(distances) if distances[i] <= self.max_distance]
+            now = time.time()
+            match = None
+            for entry_id in candidates:
+                entry = self._entries[entry_id]
+                if now - entry["created_at"] > self.ttl_seconds:
+                    self._remove(entry_id)
+                    continue
+                if entry["chunk_ids"] == chunk_ids:
+                    match = (entry_id, entry)
+                    break
+
+        if match is None:
+            ANSWER_CACHE_REQUESTS.inc(result="miss")
+            return None
+
+        entry_id, entry = match
+        # Re-check the contributing documents outside the lock (registry reads hit SQLite)
+        if _source_fingerprints(entry["sources"].keys()) != entry["sources"]:
+            with self._lock:
+                self._remove(entry_id)
+            ANSWER_CACHE_REQUESTS.inc(result="stale")
+            logger.info("Cached answer discarded: one of its source documents changed or was deleted.")
+            return None
+
+        with self._lock:
+            if entry_id in self._entries:
+                self._entries.move_to_end(entry_id)
+        ANSWER_CACHE_REQUESTS.inc(result="hit")
+        return entry["answer"]
+
+    def store(self, query_embedding: List[float], chunk_ids: Iterable[str], sources: Iterable[Tuple[str, str]], answer: str):
+        embedding = np.asarray(query_embedding, dtype=np.float32)
+        embedding /= (np.linalg.norm(embedding) or 1.0)
+        entry = {
+            "embedding": embedding,
+            "chunk_ids": tuple(sorted(chunk_ids)),
+            "sources": _source_fingerprints(set(sources)),
+            "answer": answer,
+            "created_at": time.time(),
+        }
+        with self._lock:
+            self._entries[self._next_id] = entry
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate_sources(self, sources: Iterable[Tuple[str, str]]):
+        """Drops every cached answer built from any of the given (knowledge base, filename) source documents."""
+        sources = set(sources)
+        with self._lock:
+            for entry_id in [entry_id for entry_id, entry in self._entries.items() if sources & entry["sources"].keys()]:
+                self._remove(entry_id)
+
+    def invalidate_knowledge_base(self, knowledge_base: str):
+        """Drops every cached answer built from any document of the given knowledge base."""
+        with self._lock:
+            for entry_id in [entry_id for entry_id, entry in self._entries.items()
+                             if any(source_kb == knowledge_base for source_kb, _ in entry["sources"])]:
+                self._remove(entry_id)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+
+# Shared cache used by /chat when config.ANSWER_CACHE_ENABLED is set
+answer_cache = SemanticAnswerCache(config.ANSWER_CACHE_MAX_ENTRIES, config.ANSWER_CACHE_MAX_DISTANCE, config.ANSWER_CACHE_TTL_SECONDS)
@@ -4,15 +4,11 @@ from flask import Flask, request, render_template, jsonify, Response, stream_wit
 import os
 import sys
 import io
-from collections import deque
-import json
 import threading
 import traceback
-import subprocess
 import time
 import re
 import logging
-import queue 
 import shutil 
 
 # FIX: Set stdout and stderr encoding to UTF-8 for consistent output, especially on Windows
@@ -20,12 +16,22 @@ sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 sys.stderr = io.TextIOWrapper(sys.stderr.buffer, encoding='utf-8')
 
 import config
-from document_processor import load_pdf_text, load_text_file_content, load_docx_text, load_xlsx_text, split_text_into_chunks
-from vector_db_manager import add_documents_to_chroma, query_chroma_for_context, get_chroma_collection, clear_all_knowledge_base, get_chunks_by_source
-from ollama_manager import get_ollama_chat_stream, get_ollama_completion
+from document_processor import is_supported_file
+from vector_db_manager import query_chroma_for_context, get_vector_store, clear_all_knowledge_base, get_chunks_by_source, delete_source_from_chroma, rebuild_document_registry, embed_query, get_knowledge_base_stats
+from knowledge_bases import normalize_knowledge_base_name, list_knowledge_bases, knowledge_base_exists, create_knowledge_base, upload_directory, done_directory
+from answer_cache import answer_cache
+from reranker import mmr_rerank
+from context_packer import pack_context
+from conversation import get_conversation_store
+from document_registry import get_document_registry
+from ollama_manager import get_ollama_chat_stream, warm_up_chat_model, warm_up_embedding_model
+from admission import AdmissionController
+from readiness import ReadinessTracker
+from ingestion_manager import submit_ingestion_job, get_job as get_ingestion_job, get_pipeline_stats
 from werkzeug.utils import secure_filename
 
-import utils
+from log_broadcaster import LogBroadcaster
+from metrics import REGISTRY as METRICS_REGISTRY, RequestTimings, CHAT_STAGE_SECONDS, CHAT_REQUESTS, CHAT_TOKENS, CHAT_TOKENS_PER_SECOND
 
 # --- Logging Configuration ---
 logger = logging.getLogger(__name__)
@@ -33,7 +39,7 @@ logger.setLevel(logging.INFO) # Set base level for the logger
 
 # Create handlers (existing ones)
 c_handler = logging.StreamHandler()
-f_handler = logging.FileHandler('app.log')
+f_handler = logging.FileHandler(config.LOG_FILE_PATH)
 c_handler.setLevel(logging.INFO)
 f_handler.setLevel(logging.INFO)
 
@@ -46,44 +52,66 @@ f_handler.setFormatter(formatter)
 logger.addHandler(c_handler)
 logger.addHandler(f_handler)
 
-# Queue for real-time log streaming to frontend
-log_queue = queue.Queue()
+# Broadcaster for real-time log streaming to frontend (every connected viewer gets every line)
+log_broadcaster = LogBroadcaster(config.LOG_STREAM_BUFFER_SIZE, config.LOG_STREAM_REPLAY_LINES)
 
 class QueueHandler(logging.Handler):
-    """Custom logging handler to push log records to a queue."""
+    """Custom logging handler to publish log records to all log stream subscribers."""
     def emit(self, record):
         log_entry = self.format(record)
-        log_queue.put(log_entry)
+        log_broadcaster.publish(log_entry)
 
 queue_handler = QueueHandler()
 queue_handler.setLevel(logging.INFO) # Log levels INFO and above will be streamed
 queue_handler.setFormatter(formatter) # Use the same formatter
 logger.addHandler(queue_handler)
 
+# Modules that log through their own logger (ingestion jobs, per-document timings, chat summaries, ...)
+# get the same handlers, so their lines also reach the console, app.log and /stream_logs.
+# Add new modules here when they get a logger.
+for module_name in ("answer_cache", "conversation", "document_registry", "embedding_batcher", "embedding_cache",
+                    "ingestion_manager", "ingestion_pipeline", "knowledge_bases", "numpy_vector_store",
+                    "vector_db_manager", "vector_store"):
+    module_logger = logging.getLogger(module_name)
+    for handler in (c_handler, f_handler, queue_handler):
+        module_logger.addHandler(handler)
+
 
 # --- Flask App Initialization ---
 app = Flask(__name__)
 app.secret_key = os.urandom(24) # Used for session management (if any)
 
-# Global flag to indicate if initial setup is complete
-initial_setup_complete = False
+# Initialization state of the vector store and models, reported by /readyz. The server
+# starts listening right away; /chat answers 503 until the vector store is open.
+readiness = ReadinessTracker(["vector_store", "embedding_model", "chat_model"])
+
+# Limits how many /chat requests run (and wait) at once
+chat_admission = AdmissionController("chat", config.CHAT_MAX_CONCURRENT_REQUESTS, config.CHAT_MAX_QUEUED_REQUESTS, config.CHAT_QUEUE_TIMEOUT_SECONDS)
 
 # --- Chat History Management ---
-chat_history = deque(maxlen=config.MAX_HISTORY_MESSAGES) # Stores recent messages
+# Conversation used by clients that don't send a conversation id (e.g. scripts calling the API directly)
+DEFAULT_CONVERSATION_ID = "default"
+_CONVERSATION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+def get_conversation(conversation_id=None):
+    """Returns the conversation for the given id (falls back to the shared default one if missing or malformed)."""
+    if not conversation_id or not _CONVERSATION_ID_PATTERN.match(str(conversation_id)):
+        conversation_id = DEFAULT_CONVERSATION_ID
+    return get_conversation_store().get(conversation_id)
 
-def add_message_to_history(role, content):
+def add_message_to_history(conversation, role, content):
     """Adds a message to the chat history."""
-    chat_history.append({"role": role, "content": content})
-    logger.info(f"Added to history: {role} - {content[:50]}...") # Log message addition
+    conversation.add_message(role, content)
+    logger.info(f"Added to history ({conversation.conversation_id}): {role} - {content[:50]}...") # Log message addition
 
-def get_chat_history():
+def get_chat_history(conversation):
     """Returns the current chat history as a list."""
-    return list(chat_history)
+    return conversation.get_messages()
 
-def clear_chat_history():
+def clear_chat_history(conversation):
     """Clears the chat history."""
-    chat_history.clear()
-    logger.info("Chat history cleared.")
+    conversation.clear()
+    logger.info(f"Chat history cleared ({conversation.conversation_id}).")
 
 # --- Routes ---
 @app.route('/')
@@ -91,92 +119,256 @@ def index():
     """Renders the main chat interface."""
     return render_template('index.html')
 
+def format_log_event(subscription, log_message):
+    """Formats one log line (or a heartbeat, for None) as Server-Sent Events, prefixed by a notice of dropped lines."""
+    events = ""
+    dropped = subscription.take_dropped()
+    if dropped:
+        events += f"data: {time.strftime('%Y-%m-%d %H:%M:%S')} - WARNING - {dropped} log lines were dropped because this log viewer fell behind.\n\n"
+    if log_message is None:
+        # SSE comment line: ignored by EventSource, keeps the connection alive
+        return events + ": heartbeat\n\n"
+    # SSE format: data: [message]\n\n (one data: field per line for multi-line records)
+    return events + "".join(f"data: {line}\n" for line in log_message.splitlines()) + "\n"
+
 # Endpoint for streaming server logs
 @app.route('/stream_logs')
 def stream_logs():
     """Streams server logs in real-time using Server-Sent Events (SSE)."""
     def generate_logs():
-        while True:
-            if not log_queue.empty():
-                log_message = log_queue.get()
-                # SSE format: data: [message]\n\n
-                yield f"data: {log_message}\n\n"
-            time.sleep(0.05) # Small delay to prevent busy-waiting and reduce CPU usage
+        subscription = log_broadcaster.subscribe()
+        try:
+            while True:
+                # Blocks without polling; wakes up on a new line or when a heartbeat is due
+                log_message = subscription.get(timeout=config.LOG_STREAM_HEARTBEAT_SECONDS)
+                yield format_log_event(subscription, log_message)
+        finally:
+            subscription.close()
 
     return Response(stream_with_context(generate_logs()), mimetype='text/event-stream')
 
 
+def _record_chat_metrics(timings, outcome, token_count, first_token_time, request_start):
+    """Records generation metrics for a finished /chat stream and logs its timing trailer."""
+    end_time = time.perf_counter()
+    CHAT_REQUESTS.inc(outcome=outcome)
+    if outcome != "cached":
+        CHAT_TOKENS.inc(token_count)
+    if first_token_time is not None and outcome != "cached":
+        generation_seconds = end_time - first_token_time
+        timings.record("generation", generation_seconds)
+        if generation_seconds > 0 and token_count > 1:
+            CHAT_TOKENS_PER_SECOND.observe((token_count - 1) / generation_seconds)
+    timings.record("total", end_time - request_start)
+    if config.METRICS_LOG_REQUEST_TIMINGS:
+        logger.info(f"Chat timings: {timings.summary()} tokens={token_count}")
+
+
+def _replay_answer(answer):
+    """Streams a cached answer in small pieces so the client renders it like a live response."""
+    for start in range(0, len(answer), config.ANSWER_CACHE_REPLAY_CHUNK_CHARS):
+        yield answer[start:start + config.ANSWER_CACHE_REPLAY_CHUNK_CHARS]
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Exposes latency histograms and counters in the Prometheus text format."""
+    return Response(METRICS_REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+
+def get_knowledge_base(name):
+    """Returns the normalized name of an existing knowledge base (the default one for None). Raises ValueError otherwise."""
+    name = normalize_knowledge_base_name(name)
+    if not knowledge_base_exists(name):
+        raise ValueError(f"Unknown knowledge base: '{name}'")
+    return name
+
+def resolve_knowledge_bases(names):
+    """
+    Validates the knowledge bases a chat is restricted to. Returns their normalized names,
+    or None (search every knowledge base) when none are given. Raises ValueError for unknown names.
+    """
+    if names is None or names == []:
+        return None
+    if isinstance(names, str):
+        names = [names]
+    if not isinstance(names, list):
+        raise ValueError("'knowledge_bases' must be a list of knowledge base names.")
+    return [get_knowledge_base(name) for name in names]
+
+
+def prepare_chat_turn(user_message, conversation, timings, knowledge_bases=None):
+    """
+    Retrieves, re-ranks and packs context for a chat message and builds the messages for
+    Ollama. Returns everything needed to stream the answer and to finish the turn afterwards.
+    knowledge_bases restricts retrieval to those knowledge bases (None searches all of them).
+    Shared by the Flask and ASGI /chat routes.
+    """
+    context_chunks = []
+    
+    logger.info("Attempting RAG query for context...")
+    query_results, query_embedding = query_chroma_for_context(user_message, n_results=config.RAG_PRE_RANK_N_RESULTS,
+                                                              timings=timings, knowledge_bases=knowledge_bases)
+    filtered_results = [
+        res for res in query_results
+        if res.get('distance', 1.0) <= config.RAG_SCORE_THRESHOLD
+    ]
+    
+    # Re-rank with MMR over the stored chunk embeddings so near-duplicate chunks aren't all sent to the LLM
+    if config.RAG_MMR_ENABLED and len(filtered_results) > 1:
+        with timings.span("rerank"):
+            selected_indices = mmr_rerank(
+                query_embedding, [res['embedding'] for res in filtered_results], config.RAG_N_RESULTS,
+                diversity_lambda=config.RAG_MMR_LAMBDA, max_similarity=config.RAG_MMR_MAX_SIMILARITY
+            )
+        selected_results = [filtered_results[i] for i in selected_indices]
+        logger.info(f"MMR re-ranking kept {len(selected_results)} of {len(filtered_results)} candidate chunks.")
+    else:
+        # Simple re-ranking: take the top N after filtering
+        selected_results = filtered_results[:config.RAG_N_RESULTS]
+
+    # Fit the context into the token budget, merging adjacent chunks of the same document
+    with timings.span("context_packing"):
+        packed_context = pack_context(selected_results)
+    selected_results = packed_context['results']
+    context_chunks = packed_context['sections']
+    
+    if context_chunks:
+        packing_stats = packed_context['stats']
+        logger.info(
+            f"RAG retrieved {packing_stats['packed_chunks']} relevant chunks in {packing_stats['sections']} sections "
+            f"(~{packing_stats['packed_tokens']} of {config.RAG_CONTEXT_TOKEN_BUDGET} context tokens, "
+            f"~{packing_stats['tokens_saved']} tokens saved by packing)."
+        )
+    else:
+        logger.info("RAG query returned no relevant chunks for the current message.")
+
+    prompt_start = time.perf_counter()
+    # Prepare messages for Ollama
+    messages = []
+
+    # Add system prompt
+    messages.append({"role": "system", "content": config.DEFAULT_SYSTEM_PROMPT})
+
+    # Add RAG context if available
+    if context_chunks:
+        context_string = "\n\n".join(context_chunks)
+        messages.append({"role": "system", "content": f"Here is some relevant information from the knowledge base:\n{context_string}\n\nBased on the above context, answer the user's question. If the information is not sufficient, state that you cannot answer from the provided context."})
+        logger.info("RAG context added to messages.")
+    else:
+        # If no context was found, inform the LLM that it should answer without external knowledge
+        messages.append({"role": "system", "content": "No additional context was retrieved from the knowledge base for this query. Answer based on your general knowledge."})
+        logger.info("No RAG context available, informing LLM to use general knowledge.")
+
+
+    # Add the running summary of older turns followed by the recent unsummarized messages
+    history_to_add = conversation.get_prompt_messages()
+    messages.extend(history_to_add)
+    logger.debug(f"Messages sent to LLM: {messages}")
+    timings.record("prompt_assembly", time.perf_counter() - prompt_start)
+
+    # Opt-in semantic answer cache: a near-identical question that retrieved the same chunks gets the stored answer
+    cached_answer = None
+    answer_cache_embedding = None
+    context_ids = [res['id'] for res in selected_results]
+    if config.ANSWER_CACHE_ENABLED:
+        # Only embedded here when retrieval searched nothing (e.g. every knowledge base is empty)
+        answer_cache_embedding = query_embedding if query_embedding is not None else embed_query(user_message)
+        cached_answer = answer_cache.lookup(answer_cache_embedding, context_ids)
+        if cached_answer is not None:
+            logger.info("Answer cache hit: replaying cached answer instead of generating.")
+
+    return {
+        "messages": messages,
+        "cached_answer": cached_answer,
+        "query_embedding": answer_cache_embedding,
+        "context_ids": context_ids,
+        "sources": {(res.get('knowledge_base'), res['metadata'].get('source')) for res in selected_results},
+    }
+
+
+def finish_chat_turn(turn, conversation, full_response_content, outcome, token_count, first_token_time, timings, request_start):
+    """Stores the assistant's answer in the conversation (and answer cache) and records the request's metrics."""
+    add_message_to_history(conversation, "assistant", full_response_content)
+    logger.info("Assistant response streamed and added to history.")
+    if conversation.schedule_summary():
+        logger.info("Summarizing older chat messages in the background.")
+    _record_chat_metrics(timings, outcome, token_count, first_token_time, request_start)
+    if (turn["query_embedding"] is not None and outcome == "completed"
+            and full_response_content and not full_response_content.startswith("ERROR:")):
+        answer_cache.store(turn["query_embedding"], turn["context_ids"], turn["sources"], full_response_content)
+
+
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handles chat messages and streams responses from Ollama."""
-    if not initial_setup_complete:
+    if not readiness.is_ready("vector_store"):
         return jsonify({"error": "System still initializing. Please wait a moment."}), 503
 
     user_message = request.json.get('message')
     if not user_message:
         return jsonify({"error": "No message provided"}), 400
-
-    add_message_to_history("user", user_message)
+    try:
+        knowledge_bases = resolve_knowledge_bases(request.json.get('knowledge_bases'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+
+    timings = RequestTimings(CHAT_STAGE_SECONDS)
+    request_start = time.perf_counter()
+
+    # Overload turns into a fast 503 instead of an ever-growing pile of threads waiting on Ollama
+    with timings.span("admission"):
+        slot = chat_admission.try_acquire()
+    if slot is None:
+        CHAT_REQUESTS.inc(outcome="rejected")
+        logger.warning(f"Chat request rejected: server busy ({chat_admission.stats()}).")
+        response = jsonify({"error": "The server is busy answering other questions. Please try again shortly."})
+        response.headers['Retry-After'] = str(config.CHAT_RETRY_AFTER_SECONDS)
+        return response, 503
+
+    conversation = get_conversation(request.json.get('conversation_id'))
+    add_message_to_history(conversation, "user", user_message)
     logger.info(f"User message received: {user_message}")
 
     try:
-        context_chunks = []
-        
-        logger.info("Attempting RAG query for context...")
-        query_results = query_chroma_for_context(user_message, n_results=config.RAG_PRE_RANK_N_RESULTS)
-        filtered_results = [
-            res for res in query_results
-            if res.get('distance', 1.0) <= config.RAG_SCORE_THRESHOLD
-        ]
-        
-        # Simple re-ranking: take the top N after filtering
-        context_chunks = [res['document'] for res in filtered_results[:config.RAG_N_RESULTS]]
-        
-        if context_chunks:
-            logger.info(f"RAG retrieved {len(context_chunks)} relevant chunks.")
-        else:
-            logger.info("RAG query returned no relevant chunks for the current message.")
-
-        # Prepare messages for Ollama
-        messages = []
-
-        # Add system prompt
-        messages.append({"role": "system", "content": config.DEFAULT_SYSTEM_PROMPT})
-
-        # Add RAG context if available
-        if context_chunks:
-            context_string = "\n\n".join(context_chunks)
-            messages.append({"role": "system", "content": f"Here is some relevant information from the knowledge base:\n{context_string}\n\nBased on the above context, answer the user's question. If the information is not sufficient, state that you cannot answer from the provided context."})
-            logger.info("RAG context added to messages.")
-        else:
-            # If no context was found, inform the LLM that it should answer without external knowledge
-            messages.append({"role": "system", "content": "No additional context was retrieved from the knowledge base for this query. Answer based on your general knowledge."})
-            logger.info("No RAG context available, informing LLM to use general knowledge.")
-
-
-        # Add recent chat history (excluding summary if current history is short)
-        history_to_add = list(chat_history)[-config.MAX_UNSUMMARIZED_MESSAGES:] # Get recent unsunmmarized messages
-        messages.extend(history_to_add)
-        logger.debug(f"Messages sent to LLM: {messages}")
-
+        turn = prepare_chat_turn(user_message, conversation, timings, knowledge_bases)
 
         def generate_response():
             full_response_content = ""
+            token_count = 0
+            outcome = "completed" if turn["cached_answer"] is None else "cached"
+            stream_start = time.perf_counter()
+            first_token_time = None
             try:
-                for chunk in get_ollama_chat_stream(messages):
+                if turn["cached_answer"] is None:
+                    response_stream = get_ollama_chat_stream(turn["messages"])
+                else:
+                    response_stream = _replay_answer(turn["cached_answer"])
+                for chunk in response_stream:
+                    if first_token_time is None:
+                        first_token_time = time.perf_counter()
+                        timings.record("time_to_first_token", first_token_time - stream_start)
+                    token_count += 1 # Ollama streams roughly one token per chunk
                     full_response_content += chunk
                     yield chunk
+            except GeneratorExit:
+                outcome = "aborted" # Client disconnected (e.g. the stop button)
+                raise
             except Exception as e:
+                outcome = "error"
                 logger.error(f"Error during streaming response: {e}")
                 traceback.print_exc()
                 yield f"ERROR: An error occurred during response generation: {e}"
             finally:
-                add_message_to_history("assistant", full_response_content)
-                logger.info("Assistant response streamed and added to history.")
+                finish_chat_turn(turn, conversation, full_response_content, outcome, token_count, first_token_time, timings, request_start)
 
-        return Response(stream_with_context(generate_response()), mimetype='text/plain')
+        response = Response(stream_with_context(generate_response()), mimetype='text/plain')
+        response.call_on_close(slot.release) # Hold the slot until the stream is finished or aborted
+        return response
 
     except Exception as e:
+        slot.release()
+        CHAT_REQUESTS.inc(outcome="failed")
         logger.error(f"Failed to get chat response: {e}")
         traceback.print_exc()
         return jsonify({"error": f"Failed to get chat response: {e}"}), 500
@@ -184,7 +376,7 @@ def chat():
 
 @app.route('/upload_pdf', methods=['POST'])
 def upload_pdf():
-    """Handles PDF file uploads, processes them, and adds to knowledge base."""
+    """Handles document uploads and queues them for background ingestion into the knowledge base."""
     if 'file' not in request.files:
         logger.warning("No file part in upload request.")
         return jsonify({"error": "No file part"}), 400
@@ -192,114 +384,131 @@ def upload_pdf():
     if file.filename == '':
         logger.warning("No selected file for upload.")
         return jsonify({"error": "No selected file"}), 400
+    try:
+        # Uploading into a knowledge base that doesn't exist yet creates it
+        knowledge_base = normalize_knowledge_base_name(request.form.get('knowledge_base'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
     if file:
         filename = secure_filename(file.filename)
-        file_path = os.path.join(config.PDF_DIRECTORY, filename)
-        
-        # Ensure the directory exists
-        os.makedirs(config.PDF_DIRECTORY, exist_ok=True)
+        file_path = os.path.join(upload_directory(knowledge_base), filename)
+
+        # Reject unsupported types before saving anything
+        file_extension = os.path.splitext(filename)[1].lower()
+        if not is_supported_file(filename):
+            logger.warning(f"Unsupported file type uploaded: {file_extension}")
+            return jsonify({"error": f"Unsupported file type: {file_extension}. Only PDF, TXT, MD, DOCX, XLSX are supported."}), 400
 
         try:
+            # Ensure the directories exist
+            create_knowledge_base(knowledge_base)
             file.save(file_path)
             logger.info(f"File saved temporarily: {file_path}")
 
-            # Determine file type and load text
-            file_extension = os.path.splitext(filename)[1].lower()
-            text_content = ""
-            if file_extension == '.pdf':
-                text_content = load_pdf_text(file_path)
-            elif file_extension == '.txt' or file_extension == '.md':
-                text_content = load_text_file_content(file_path)
-            elif file_extension == '.docx':
-                text_content = load_docx_text(file_path)
-            elif file_extension == '.xlsx':
-                text_content = load_xlsx_text(file_path)
-            else:
-                logger.warning(f"Unsupported file type uploaded: {file_extension}")
-                os.remove(file_path) # Clean up unsupported file
-                return jsonify({"error": f"Unsupported file type: {file_extension}. Only PDF, TXT, MD, DOCX, XLSX are supported."}), 400
-
-            if not text_content.strip():
-                logger.warning(f"No text extracted from file: {filename}. It might be an image-based PDF or empty.")
-                os.remove(file_path) # Clean up empty file
-                return jsonify({"message": f"Document '{filename}' uploaded, but no text could be extracted. It might be an image-based PDF or empty."}), 200
-
-
-            # Split text into chunks
-            chunks = split_text_into_chunks(text_content)
-            logger.info(f"Split '{filename}' into {len(chunks)} chunks.")
-
-            # Add chunks to ChromaDB
-            if chunks:
-                add_documents_to_chroma(chunks, filename)
-                logger.info(f"'{filename}' chunks added to ChromaDB.")
-                
-                # Move the processed file to 'done_documents' directory
-                utils.move_file_to_directory(file_path, config.DONE_DIRECTORY)
-                logger.info(f"Moved '{filename}' to done directory.")
-
-                return jsonify({"message": f"Document '{filename}' processed and added to knowledge base."}), 200
-            else:
-                os.remove(file_path) # Clean up if no chunks were generated
-                logger.warning(f"No chunks generated for '{filename}'.")
-                return jsonify({"message": f"Document '{filename}' uploaded but no content was extracted for the knowledge base."}), 200
+            # Extraction, splitting and embedding happen in the background ingestion queue
+            job_id = submit_ingestion_job(file_path, filename, knowledge_base)
+            logger.info(f"Ingestion job {job_id} queued for '{filename}'.")
+            return jsonify({
+                "message": f"Document '{filename}' uploaded to knowledge base '{knowledge_base}' and queued for processing.",
+                "knowledge_base": knowledge_base,
+                "job_id": job_id,
+                "status_url": f"/jobs/{job_id}"
+            }), 202
 
         except Exception as e:
-            logger.error(f"Error processing uploaded file '{filename}': {e}")
+            logger.error(f"Error queuing uploaded file '{filename}': {e}")
             traceback.print_exc()
-            # Attempt to clean up the partially processed file
+            # Attempt to clean up the saved file
             if os.path.exists(file_path):
                 os.remove(file_path)
             return jsonify({"error": f"Failed to process document: {e}"}), 500
     return jsonify({"error": "Unexpected error during file upload."}), 500
 
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """Reports the status and progress of a background ingestion job."""
+    job = get_ingestion_job(job_id)
+    if job is None:
+        return jsonify({"error": f"Unknown job id: {job_id}"}), 404
+    return jsonify(job), 200
+
+@app.route('/ingestion_stats', methods=['GET'])
+def ingestion_stats():
+    """Reports per-stage utilization and queue depth of the ingestion pipeline."""
+    return jsonify({"stages": get_pipeline_stats()}), 200
+
+
 @app.route('/get_uploaded_documents', methods=['GET'])
 def get_uploaded_documents():
-    """Retrieves a list of all documents currently in the knowledge base."""
+    """Retrieves one page of the documents currently in a knowledge base (?knowledge_base=, the default one if not given)."""
     try:
-        collection = get_chroma_collection()
-        # Fetch all unique source metadata values
-        results = collection.get(
-            where={}, # Get all documents
-            ids=[], # Do not query by specific IDs
-            limit=10000, # Max number of documents to return, adjust if you expect many more
-            include=['metadatas']
-        )
-        
-        unique_sources = set()
-        if 'metadatas' in results and results['metadatas']:
-            for metadata in results['metadatas']:
-                if 'source' in metadata:
-                    unique_sources.add(metadata['source'])
-        
-        return jsonify({"documents": sorted(list(unique_sources))}), 200
+        knowledge_base = get_knowledge_base(request.args.get('knowledge_base'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    try:
+        offset = max(request.args.get('offset', 0, type=int), 0)
+        limit = request.args.get('limit', config.DOCUMENT_LIST_PAGE_SIZE, type=int)
+        limit = min(max(limit, 1), config.DOCUMENT_LIST_MAX_PAGE_SIZE)
+
+        # The registry holds one row per document, so this is O(documents) rather than O(chunks)
+        documents, total = get_document_registry(knowledge_base).list_documents(offset=offset, limit=limit)
+        return jsonify({
+            "knowledge_base": knowledge_base,
+            "documents": [document["source"] for document in documents],
+            "details": documents,
+            "total": total,
+            "offset": offset,
+            "limit": limit
+        }), 200
     except Exception as e:
         logger.error(f"Error fetching uploaded documents: {e}")
         traceback.print_exc()
         return jsonify({"error": "Failed to retrieve uploaded documents."}), 500
 
 
+@app.route('/document_chunks', methods=['GET'])
+def document_chunks():
+    """Returns one page of a document's chunks in their original order."""
+    document_name = request.args.get('document_name')
+    if not document_name:
+        return jsonify({"error": "No document name provided"}), 400
+    try:
+        knowledge_base = get_knowledge_base(request.args.get('knowledge_base'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    limit = request.args.get('limit', config.CHUNK_FETCH_PAGE_SIZE, type=int)
+    limit = min(max(limit, 1), config.CHUNK_FETCH_PAGE_SIZE)
+    chunks = get_chunks_by_source(document_name, offset=offset, limit=limit, knowledge_base=knowledge_base)
+    return jsonify({"document_name": document_name, "knowledge_base": knowledge_base, "chunks": chunks, "offset": offset, "limit": limit}), 200
+
+
 @app.route('/delete_document', methods=['POST'])
 def delete_document():
     """Deletes a specific document and its associated chunks from the knowledge base."""
     document_name = request.json.get('document_name')
     if not document_name:
         return jsonify({"error": "No document name provided"}), 400
+    try:
+        knowledge_base = get_knowledge_base(request.json.get('knowledge_base'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
 
     try:
-        collection = get_chroma_collection()
         # Delete documents where the 'source' metadata matches the document_name
-        collection.delete(where={"source": document_name})
+        delete_source_from_chroma(document_name, knowledge_base)
+        answer_cache.invalidate_sources([(knowledge_base, document_name)])
         
         # Optionally, delete the physical file from the 'done_documents' directory
-        done_file_path = os.path.join(config.DONE_DIRECTORY, document_name)
+        done_file_path = os.path.join(done_directory(knowledge_base), document_name)
         if os.path.exists(done_file_path):
             os.remove(done_file_path)
             logger.info(f"Deleted physical file: {done_file_path}")
 
-        logger.info(f"Document '{document_name}' and its chunks deleted from ChromaDB.")
-        return jsonify({"message": f"Document '{document_name}' deleted from knowledge base."}), 200
+        logger.info(f"Document '{document_name}' and its chunks deleted from knowledge base '{knowledge_base}'.")
+        return jsonify({"message": f"Document '{document_name}' deleted from knowledge base '{knowledge_base}'."}), 200
     except Exception as e:
         logger.error(f"Error deleting document '{document_name}': {e}")
         traceback.print_exc()
@@ -309,61 +518,134 @@ def delete_document():
 @app.route('/clear_chat_history', methods=['POST'])
 def clear_chat_history_route():
     """Endpoint to clear the entire chat history."""
-    clear_chat_history()
+    clear_chat_history(get_conversation((request.get_json(silent=True) or {}).get('conversation_id')))
     return jsonify({"message": "Chat history cleared."}), 200
 
 @app.route('/clear_knowledge_base', methods=['POST'])
 def clear_knowledge_base_route():
-    """Endpoint to clear the entire knowledge base."""
-    success = clear_all_knowledge_base()
+    """Endpoint to clear one entire knowledge base (the default one unless 'knowledge_base' is given); the others are untouched."""
+    try:
+        knowledge_base = get_knowledge_base((request.get_json(silent=True) or {}).get('knowledge_base'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 404
+    success = clear_all_knowledge_base(knowledge_base)
     if success:
+        answer_cache.invalidate_knowledge_base(knowledge_base)
         # Also clear the 'done_documents' directory
-        if os.path.exists(config.DONE_DIRECTORY):
+        knowledge_base_done_directory = done_directory(knowledge_base)
+        if os.path.exists(knowledge_base_done_directory):
             try:
-                shutil.rmtree(config.DONE_DIRECTORY)
-                os.makedirs(config.DONE_DIRECTORY) # Recreate the empty directory
-                logger.info("Cleared 'done_documents' directory.")
+                shutil.rmtree(knowledge_base_done_directory)
+                os.makedirs(knowledge_base_done_directory) # Recreate the empty directory
+                logger.info(f"Cleared '{knowledge_base_done_directory}' directory.")
             except Exception as e:
-                logger.error(f"Error clearing 'done_documents' directory: {e}")
+                logger.error(f"Error clearing '{knowledge_base_done_directory}' directory: {e}")
                 return jsonify({"error": f"Knowledge base cleared, but failed to clear document directory: {e}"}), 500
 
-        return jsonify({"message": "Knowledge base cleared successfully."}), 200
+        return jsonify({"message": f"Knowledge base '{knowledge_base}' cleared successfully."}), 200
     else:
         return jsonify({"error": "Failed to clear knowledge base."}), 500
 
 
+@app.route('/knowledge_bases', methods=['GET'])
+def knowledge_bases_route():
+    """Lists every knowledge base with its chunk and document counts."""
+    try:
+        return jsonify({
+            "default": config.DEFAULT_KNOWLEDGE_BASE,
+            "knowledge_bases": [get_knowledge_base_stats(name) for name in list_knowledge_bases()]
+        }), 200
+    except Exception as e:
+        logger.error(f"Error fetching knowledge base stats: {e}")
+        traceback.print_exc()
+        return jsonify({"error": "Failed to retrieve knowledge bases."}), 500
+
+@app.route('/knowledge_bases', methods=['POST'])
+def create_knowledge_base_route():
+    """Creates an empty knowledge base (uploading into a new one creates it too)."""
+    try:
+        knowledge_base = normalize_knowledge_base_name((request.get_json(silent=True) or {}).get('name'))
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    created = create_knowledge_base(knowledge_base)
+    return jsonify(get_knowledge_base_stats(knowledge_base)), 201 if created else 200
+
+
+# --- Health Checks ---
+@app.route('/healthz', methods=['GET'])
+def healthz():
+    """Liveness: the process is up and serving requests (whether or not setup has finished)."""
+    return jsonify({"status": "ok", "uptime_seconds": readiness.snapshot()["uptime_seconds"]}), 200
+
+@app.route('/readyz', methods=['GET'])
+def readyz():
+    """Readiness: 200 once the vector store and models are initialized, 503 before; includes per-component timings."""
+    snapshot = readiness.snapshot()
+    return jsonify(snapshot), 200 if snapshot["ready"] else 503
+
+
 # --- Initial Setup for Application Start ---
-def _initial_setup_thread():
+def _open_vector_store():
+    # Ensure directories exist
+    os.makedirs(config.PDF_DIRECTORY, exist_ok=True)
+    os.makedirs(config.CHROMA_DB_DIRECTORY, exist_ok=True)
+    os.makedirs(config.DONE_DIRECTORY, exist_ok=True)
+
+    for knowledge_base in list_knowledge_bases():
+        store = get_vector_store(knowledge_base) # Open the knowledge base's vector store (ChromaDB or NumPy, per config)
+        logger.info(f"Vector store '{store.name}' of knowledge base '{knowledge_base}' initialized successfully.")
+
+        # Knowledge bases created before the document registry existed need it backfilled once
+        if get_document_registry(knowledge_base).count_documents() == 0 and store.count() > 0:
+            logger.info(f"Document registry of '{knowledge_base}' is empty but the vector store has chunks; rebuilding registry...")
+            rebuild_document_registry(knowledge_base=knowledge_base)
+
+def _initialize_component(name, initialize):
+    """Runs one startup step and records its outcome and duration. Returns True if it succeeded."""
+    start = time.perf_counter()
+    try:
+        initialize()
+    except Exception as e:
+        readiness.mark_failed(name, str(e), time.perf_counter() - start)
+        logger.error(f"Failed to initialize {name}: {e}")
+        return False
+    elapsed = time.perf_counter() - start
+    readiness.mark_ready(name, elapsed)
+    logger.info(f"Initialized {name} in {elapsed:.1f}s.")
+    return True
+
+def _initial_setup_thread(retry_failed=False):
     """
-    Performs initial setup tasks in a separate thread.
+    Performs initial setup tasks (normally in a background thread while the server is already listening).
+    With retry_failed, failed steps are retried every STARTUP_RETRY_SECONDS until they succeed.
     """
-    global initial_setup_complete
     logger.info("Running initial setup...")
 
-    try:
-        # Ensure directories exist
-        os.makedirs(config.PDF_DIRECTORY, exist_ok=True)
-        os.makedirs(config.CHROMA_DB_DIRECTORY, exist_ok=True)
-        os.makedirs(config.DONE_DIRECTORY, exist_ok=True)
+    steps = [("vector_store", _open_vector_store)]
+    # Load the models now so the first chat doesn't pay the model load time
+    if config.OLLAMA_WARM_UP_ON_STARTUP:
+        steps += [("embedding_model", warm_up_embedding_model), ("chat_model", warm_up_chat_model)]
+    else:
+        readiness.mark_skipped("embedding_model", "OLLAMA_WARM_UP_ON_STARTUP is disabled")
+        readiness.mark_skipped("chat_model", "OLLAMA_WARM_UP_ON_STARTUP is disabled")
 
-        get_chroma_collection() # Initialize the single ChromaDB collection
-        logger.info("ChromaDB initialized successfully.")
-    except Exception as e:
-        logger.error(f"Failed to initialize ChromaDB: {e}")
+    # The default system prompt is added to every request in /chat, so conversations start out empty
+    get_conversation_store()
 
-    add_message_to_history("system", config.DEFAULT_SYSTEM_PROMPT)
-    logger.info("Default system message added to chat history.")
+    pending = [(name, step) for name, step in steps if not _initialize_component(name, step)]
+    while pending and retry_failed:
+        logger.warning(f"Retrying {', '.join(name for name, _ in pending)} in {config.STARTUP_RETRY_SECONDS}s...")
+        time.sleep(config.STARTUP_RETRY_SECONDS)
+        pending = [(name, step) for name, step in pending if not _initialize_component(name, step)]
 
-    initial_setup_complete = True
-    logger.info("Initial setup complete.")
+    logger.info(f"Initial setup complete (ready: {readiness.all_ready()}).")
 
 
 if __name__ == '__main__':
     logger.info("--- Initializing BreezeAI Assistant Backend ---")
 
-    setup_thread = threading.Thread(target=_initial_setup_thread)
+    # Listen right away; /healthz answers immediately and /readyz reports when setup has finished
+    setup_thread = threading.Thread(target=_initial_setup_thread, kwargs={"retry_failed": True}, daemon=True)
     setup_thread.start()
-    setup_thread.join() # Wait for the setup to complete before starting the Flask app
 
-    logger.info("--- BreezeAI Assistant Backend Ready ---")
-    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
\ No newline at end of file
+    app.run(debug=False, host='0.0.0.0', port=5000, threaded=True)
@@ -0,0 +1,167 @@
+"""
+Optional async serving mode.
+
+Usage:
+    uvicorn asgi_app:app --host 0.0.0.0 --port 5000
+    python asgi_app.py
+
+Serves the same routes as app.py, but the long-lived streams run on an event loop instead
+of holding one thread each: /chat streams tokens from the async Ollama client and
+/stream_logs waits on the log broadcaster without blocking a thread. Every other route is
+the unchanged Flask app, mounted through a WSGI adapter. Retrieval and the other blocking
+work of a chat turn run in a thread pool, so the response format seen by script.js is the
+same as with `python app.py`.
+"""
+import time
+import asyncio
+import threading
+import traceback
+from contextlib import asynccontextmanager
+import anyio
+from asgiref.wsgi import WsgiToAsgi
+from starlette.applications import Starlette
+from starlette.concurrency import run_in_threadpool
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+import config
+import app as flask_backend
+from app import logger, log_broadcaster, chat_admission
+from ollama_manager import get_ollama_chat_stream_async
+from metrics import RequestTimings, CHAT_STAGE_SECONDS, CHAT_REQUESTS
+
+
+class AdmissionStreamingResponse(StreamingResponse):
+    """StreamingResponse that holds a chat admission slot until the stream is finished or aborted."""
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # Make sure the generator's cleanup (history, metrics) runs even if the client went away mid-stream
+            with anyio.CancelScope(shield=True):
+                await self.body_iterator.aclose()
+            self.slot.release()
+
+
+async def _replay_answer_async(answer):
+    for piece in flask_backend._replay_answer(answer):
+        yield piece
+
+
+async def chat(request):
+    """Handles chat messages and streams responses from Ollama (async counterpart of app.chat)."""
+    if not flask_backend.readiness.is_ready("vector_store"):
+        return JSONResponse({"error": "System still initializing. Please wait a moment."}, status_code=503)
+
+    try:
+        body = await request.json()
+    except Exception:
+        body = None
+    user_message = body.get('message') if isinstance(body, dict) else None
+    if not user_message:
+        return JSONResponse({"error": "No message provided"}, status_code=400)
+    try:
+        knowledge_bases = flask_backend.resolve_knowledge_bases(body.get('knowledge_bases'))
+    except ValueError as e:
+        return JSONResponse({"error": str(e)}, status_code=400)
+
+    timings = RequestTimings(CHAT_STAGE_SECONDS)
+    request_start = time.perf_counter()
+
+    # Waiting for a slot blocks (up to the queue timeout), so it happens off the event loop
+    with timings.span("admission"):
+        slot = await run_in_threadpool(chat_admission.try_acquire)
+    if slot is None:
+        CHAT_REQUESTS.inc(outcome="rejected")
+        logger.warning(f"Chat request rejected: server busy ({chat_admission.stats()}).")
+        return JSONResponse(
+            {"error": "The server is busy answering other questions. Please try again shortly."},
+            status_code=503, headers={"Retry-After": str(config.CHAT_RETRY_AFTER_SECONDS)}
+        )
+
+    try:
+        conversation = await run_in_threadpool(flask_backend.get_conversation, body.get('conversation_id'))
+        await run_in_threadpool(flask_backend.add_message_to_history, conversation, "user", user_message)
+        logger.info(f"User message received: {user_message}")
+        turn = await run_in_threadpool(flask_backend.prepare_chat_turn, user_message, conversation, timings, knowledge_bases)
+    except Exception as e:
+        slot.release()
+        CHAT_REQUESTS.inc(outcome="failed")
+        logger.error(f"Failed to get chat response: {e}")
+        traceback.print_exc()
+        return JSONResponse({"error": f"Failed to get chat response: {e}"}, status_code=500)
+
+    async def generate_response():
+        full_response_content = ""
+        token_count = 0
+        outcome = "completed" if turn["cached_answer"] is None else "cached"
+        stream_start = time.perf_counter()
+        first_token_time = None
+        try:
+            if turn["cached_answer"] is None:
+                response_stream = get_ollama_chat_stream_async(turn["messages"])
+            else:
+                response_stream = _replay_answer_async(turn["cached_answer"])
+            async for chunk in response_stream:
+                if first_token_time is None:
+                    first_token_time = time.perf_counter()
+                    timings.record("time_to_first_token", first_token_time - stream_start)
+                token_count += 1 # Ollama streams roughly one token per chunk
+                full_response_content += chunk
+                yield chunk
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "aborted" # Client disconnected (e.g. the stop button)
+            raise
+        except Exception as e:
+            outcome = "error"
+            logger.error(f"Error during streaming response: {e}")
+            traceback.print_exc()
+            yield f"ERROR: An error occurred during response generation: {e}"
+        finally:
+            # Saves history and answer cache entries (SQLite), so it runs in the thread pool; shielded so a
+            # client disconnect (which cancels this stream) still records the aborted turn
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(flask_backend.finish_chat_turn, turn, conversation, full_response_content, outcome,
+                                        token_count, first_token_time, timings, request_start)
+
+    return AdmissionStreamingResponse(generate_response(), slot, media_type='text/plain')
+
+
+async def stream_logs(request):
+    """Streams server logs in real-time using Server-Sent Events (SSE), one coroutine per viewer."""
+    async def generate_logs():
+        subscription = log_broadcaster.subscribe_async()
+        try:
+            while True:
+                log_message = await subscription.get(timeout=config.LOG_STREAM_HEARTBEAT_SECONDS)
+                yield flask_backend.format_log_event(subscription, log_message)
+        finally:
+            subscription.close()
+
+    return StreamingResponse(generate_logs(), media_type='text/event-stream')
+
+
+@asynccontextmanager
+async def lifespan(_app):
+    logger.info("--- Initializing BreezeAI Assistant Backend (async mode) ---")
+    # /chat answers 503 until the setup thread has opened the vector store; /readyz reports the rest
+    threading.Thread(target=flask_backend._initial_setup_thread, kwargs={"retry_failed": True}, daemon=True).start()
+    yield
+
+
+app = Starlette(
+    routes=[
+        Route('/chat', chat, methods=['POST']),
+        Route('/stream_logs', stream_logs),
+        Mount('/', app=WsgiToAsgi(flask_backend.app)),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == '__main__':
+    import uvicorn
+    uvicorn.run(app, host='0.0.0.0', port=5000)
@@ -0,0 +1,14 @@
+"""
+Offline benchmark harness for LocalRag.
+
+Usage (from the repository root):
+    python -m benchmarks [--documents N] [--size-kb N] [--concurrency N] [--scenarios ingest,retrieval,chat] [--json FILE]
+
+Generates a synthetic corpus (PDF/DOCX/XLSX/TXT), starts a local stand-in for the Ollama
+HTTP API with deterministic embeddings and configurable token latency, serves the real app
+on a loopback port against a throwaway data directory, and reports ingestion chunks/s,
+retrieval p50/p99, chat time-to-first-token and peak RSS. Nothing leaves the machine.
+
+The Ollama stand-in can also be run on its own to point a normal app instance at it:
+    python -m benchmarks.fake_ollama --port 11435 --token-latency-ms 20
+"""
@@ -0,0 +1,142 @@
+import os
+import sys
+import json
+import shutil
+import argparse
+import tempfile
+
+import config
+from benchmarks.corpus import SUPPORTED_FORMATS, generate_corpus
+from benchmarks.fake_ollama import FakeOllamaServer
+from benchmarks import scenarios
+
+SCENARIOS = ("ingest", "retrieval", "chat")
+
+
+def _ms(seconds):
+    return f"{seconds * 1000:8.1f}ms" if seconds is not None else "       n/a"
+
+def _mb(megabytes):
+    return f"{megabytes:.0f} MB" if megabytes is not None else "n/a"
+
+def print_report(report: dict):
+    print("\n--- Benchmark report ---")
+    settings = report["settings"]
+    print(f"Corpus: {settings['documents']} documents x {settings['size_kb']} KB ({', '.join(settings['formats'])}), "
+          f"concurrency {settings['concurrency']}, vector store {settings['vector_store']}")
+    ingest = report.get("ingest")
+    if ingest:
+        print(f"Ingestion:  {ingest['chunks']} chunks from {ingest['files']} files in {ingest['elapsed_seconds']:.2f}s "
+              f"-> {ingest['chunks_per_second']:.1f} chunks/s, {ingest['files_per_second']:.2f} files/s")
+        print(f"            job latency p50 {_ms(ingest['job_seconds']['p50'])}  p99 {_ms(ingest['job_seconds']['p99'])}")
+        for failure in ingest["failed"]:
+            print(f"            FAILED: {failure}")
+        if config.METRICS_LOG_REQUEST_TIMINGS:
+            print(f"            timing lines in app.log: {ingest['timing_trailers_logged']}/{ingest['ingested_files']} documents")
+    retrieval = report.get("retrieval")
+    if retrieval:
+        latency = retrieval["latency_seconds"]
+        print(f"Retrieval:  {retrieval['queries']} queries, {retrieval['queries_per_second']:.1f} q/s, "
+              f"{retrieval['mean_results']:.1f} results/query")
+        print(f"            p50 {_ms(latency['p50'])}  p95 {_ms(latency['p95'])}  p99 {_ms(latency['p99'])}  max {_ms(latency['max'])}")
+    chat = report.get("chat")
+    if chat:
+        print(f"Chat:       {chat['completed']}/{chat['requests']} completed ({chat['rejected']} rejected, {chat['errors']} errors)")
+        print(f"            TTFT p50 {_ms(chat['ttft_seconds']['p50'])}  p99 {_ms(chat['ttft_seconds']['p99'])}   "
+              f"total p50 {_ms(chat['total_seconds']['p50'])}  p99 {_ms(chat['total_seconds']['p99'])}")
+    for name in SCENARIOS:
+        if name in report.get("peak_rss_mb", {}):
+            rss = report["peak_rss_mb"][name]
+            print(f"Peak RSS after {name:<9}: {_mb(rss['self'])} (worker processes: {_mb(rss['children'])})")
+    print(f"Ollama stand-in requests: {report['ollama_requests']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark ingestion, retrieval and chat against a local Ollama stand-in.")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help=f"Comma-separated subset of {', '.join(SCENARIOS)}")
+    parser.add_argument("--documents", type=int, default=8, help="Number of generated documents")
+    parser.add_argument("--size-kb", type=int, default=64, help="Approximate text size of each document in KB")
+    parser.add_argument("--formats", default=",".join(SUPPORTED_FORMATS), help="Comma-separated document formats to cycle through")
+    parser.add_argument("--concurrency", type=int, default=4, help="Concurrent uploads, queries and chats")
+    parser.add_argument("--queries", type=int, default=200, help="Number of retrieval queries")
+    parser.add_argument("--chats", type=int, default=16, help="Number of /chat requests")
+    parser.add_argument("--vector-store", choices=("chroma", "numpy"), help="Vector store backend (default: config.VECTOR_STORE_BACKEND)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the synthetic corpus and queries")
+    parser.add_argument("--embedding-dimensions", type=int, default=768)
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="Fake Ollama delay between streamed tokens")
+    parser.add_argument("--first-token-latency-ms", type=float, default=100.0, help="Fake Ollama delay before the first token")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Tokens in every fake chat answer")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Fake Ollama delay per embedding request")
+    parser.add_argument("--embed-latency-per-text-ms", type=float, default=0.0, help="Fake Ollama delay per embedded text")
+    parser.add_argument("--workdir", help="Directory for the corpus and throwaway knowledge base (default: a temporary directory)")
+    parser.add_argument("--keep-workdir", action="store_true", help="Don't delete the working directory afterwards")
+    parser.add_argument("--json", dest="json_path", help="Also write the full report as JSON to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the app's INFO logs")
+    args = parser.parse_args()
+
+    selected = [name.strip() for name in args.scenarios.split(",") if name.strip()]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        print(f"Error: unknown scenarios: {', '.join(sorted(unknown))}")
+        return 2
+    formats = tuple(name.strip() for name in args.formats.split(",") if name.strip())
+    concurrency = max(1, args.concurrency)
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix="localrag-bench-")
+    os.makedirs(workdir, exist_ok=True)
+    fake_ollama = FakeOllamaServer(
+        embedding_dimensions=args.embedding_dimensions, token_latency=args.token_latency_ms / 1000,
+        first_token_latency=args.first_token_latency_ms / 1000, response_tokens=args.response_tokens,
+        embed_latency=args.embed_latency_ms / 1000, embed_latency_per_text=args.embed_latency_per_text_ms / 1000,
+    ).start()
+    scenarios.configure_isolated_environment(workdir, fake_ollama.url)
+    if args.vector_store:
+        config.VECTOR_STORE_BACKEND = args.vector_store
+
+    report = {
+        "settings": {"documents": args.documents, "size_kb": args.size_kb, "formats": list(formats),
+                     "concurrency": concurrency, "embedding_dimensions": args.embedding_dimensions,
+                     "vector_store": config.VECTOR_STORE_BACKEND},
+        "peak_rss_mb": {},
+    }
+    try:
+        print(f"Generating {args.documents} documents in '{workdir}'...")
+        generated = generate_corpus(os.path.join(workdir, "corpus"), args.documents, args.size_kb, formats, args.seed)
+        corpus, documents = generated["corpus"], generated["documents"]
+
+        with scenarios.AppServer(verbose=args.verbose) as app_server:
+            if "ingest" in selected:
+                print("Running ingestion scenario...")
+                report["ingest"] = scenarios.run_ingestion(app_server.url, [document["path"] for document in documents], concurrency)
+                report["peak_rss_mb"]["ingest"] = scenarios.peak_rss_mb()
+            if "retrieval" in selected:
+                print("Running retrieval scenario...")
+                report["retrieval"] = scenarios.run_retrieval(corpus.queries(documents, args.queries), concurrency)
+                report["peak_rss_mb"]["retrieval"] = scenarios.peak_rss_mb()
+            if "chat" in selected:
+                print("Running chat scenario...")
+                report["chat"] = scenarios.run_chat(app_server.url, corpus.queries(documents, args.chats), concurrency)
+                report["peak_rss_mb"]["chat"] = scenarios.peak_rss_mb()
+        report["ollama_requests"] = dict(fake_ollama.request_counts)
+    finally:
+        fake_ollama.stop()
+        if not args.keep_workdir and not args.workdir:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Report written to '{args.json_path}'.")
+    sys.stdout.flush()
+    ingest = report.get("ingest", {})
+    if ingest.get("failed"):
+        return 1
+    if config.METRICS_LOG_REQUEST_TIMINGS and ingest and ingest["timing_trailers_logged"] < ingest["ingested_files"]:
+        print("Error: per-document timing lines are missing from app.log.")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
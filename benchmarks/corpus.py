@@ -0,0 +1,117 @@
+import os
+import random
+from typing import List
+
+import fitz
+from docx import Document as DocxDocument # To avoid naming conflict with fitz.Document
+import openpyxl
+
+SUPPORTED_FORMATS = ("pdf", "docx", "xlsx", "txt")
+
+_SYLLABLES = ("ka", "lo", "mi", "ra", "ten", "vo", "su", "bel", "dra", "qui", "nor", "pe", "zan", "ti", "gor", "fa", "lu", "shi", "mon", "ex")
+_PDF_PAGE_CHARS = 2500 # Roughly one page of 10pt text
+_XLSX_CELL_CHARS = 200
+
+
+def _make_words(rng: random.Random, count: int, min_syllables: int, max_syllables: int) -> List[str]:
+    words = set()
+    while len(words) < count:
+        words.add("".join(rng.choice(_SYLLABLES) for _ in range(rng.randint(min_syllables, max_syllables))))
+    return sorted(words)
+
+
+class SyntheticCorpus:
+    """
+    Deterministic pseudo-text: every document mixes a shared filler vocabulary with a few
+    topic words of its own, so generated queries about a topic retrieve that document.
+    """
+    def __init__(self, seed: int = 0, vocabulary_size: int = 2000, topic_count: int = 200):
+        self.rng = random.Random(seed)
+        self.vocabulary = _make_words(self.rng, vocabulary_size, 1, 3)
+        self.topics = [f"{word}ium" for word in _make_words(self.rng, topic_count, 2, 4)]
+
+    def sentence(self, topic_words: List[str]) -> str:
+        words = self.rng.choices(self.vocabulary, k=self.rng.randint(8, 20))
+        for _ in range(self.rng.randint(1, 2)):
+            words.insert(self.rng.randrange(len(words)), self.rng.choice(topic_words))
+        return " ".join(words).capitalize() + "."
+
+    def text(self, size_bytes: int, topic_words: List[str]) -> List[str]:
+        """Returns paragraphs of pseudo-text totalling about size_bytes characters."""
+        paragraphs, total = [], 0
+        while total < size_bytes:
+            paragraph = " ".join(self.sentence(topic_words) for _ in range(self.rng.randint(3, 7)))
+            paragraphs.append(paragraph)
+            total += len(paragraph) + 2
+        return paragraphs
+
+    def queries(self, documents: List[dict], count: int) -> List[str]:
+        """Questions about the topics of the generated documents (all distinct, so none is a cache hit)."""
+        queries = []
+        for i in range(count):
+            document = documents[i % len(documents)]
+            topic = self.rng.choice(document["topics"])
+            filler = " ".join(self.rng.choices(self.vocabulary, k=3))
+            queries.append(f"What does the knowledge base say about {topic} and {filler}? (#{i})")
+        return queries
+
+
+def _write_txt(path: str, paragraphs: List[str]):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("\n\n".join(paragraphs))
+
+def _write_pdf(path: str, paragraphs: List[str]):
+    pages, current = [], ""
+    for paragraph in paragraphs:
+        if current and len(current) + len(paragraph) > _PDF_PAGE_CHARS:
+            pages.append(current)
+            current = ""
+        current += paragraph + "\n\n"
+    if current:
+        pages.append(current)
+    with fitz.open() as document:
+        for page_text in pages:
+            page = document.new_page()
+            page.insert_textbox(page.rect + (50, 50, -50, -50), page_text, fontsize=8)
+        document.save(path)
+
+def _write_docx(path: str, paragraphs: List[str]):
+    document = DocxDocument()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+def _write_xlsx(path: str, paragraphs: List[str]):
+    workbook = openpyxl.Workbook()
+    sheet = workbook.active
+    sheet.title = "Data"
+    sheet.append(["Row", "Category", "Description"])
+    row = 1
+    for paragraph in paragraphs:
+        for start in range(0, len(paragraph), _XLSX_CELL_CHARS):
+            sheet.append([row, paragraph.split(" ", 1)[0], paragraph[start:start + _XLSX_CELL_CHARS]])
+            row += 1
+    workbook.save(path)
+
+_WRITERS = {"pdf": _write_pdf, "docx": _write_docx, "xlsx": _write_xlsx, "txt": _write_txt}
+
+
+def generate_corpus(directory: str, documents: int, size_kb: int, formats=SUPPORTED_FORMATS, seed: int = 0) -> dict:
+    """
+    Writes `documents` files of about size_kb KB of text each into directory, cycling through formats.
+    Returns {"documents": [{"path", "format", "topics", "chars"}], "corpus": SyntheticCorpus}.
+    """
+    unknown = set(formats) - set(SUPPORTED_FORMATS)
+    if unknown:
+        raise ValueError(f"Unsupported corpus formats: {', '.join(sorted(unknown))}")
+    os.makedirs(directory, exist_ok=True)
+    corpus = SyntheticCorpus(seed)
+    generated = []
+    for i in range(documents):
+        file_format = formats[i % len(formats)]
+        topics = corpus.rng.sample(corpus.topics, 3)
+        paragraphs = corpus.text(size_kb * 1024, topics)
+        path = os.path.join(directory, f"bench_{i:04d}.{file_format}")
+        _WRITERS[file_format](path, paragraphs)
+        generated.append({"path": path, "format": file_format, "topics": topics, "chars": sum(len(p) for p in paragraphs)})
+    return {"documents": generated, "corpus": corpus}
@@ -0,0 +1,211 @@
+"""
+Local stand-in for the parts of the Ollama HTTP API that LocalRag uses (/api/embed,
+/api/embeddings, /api/chat, /api/generate). Embeddings are deterministic bag-of-words
+hashes, so texts sharing words are close and retrieval behaves sensibly; chat responses
+stream a fixed number of tokens with configurable latency.
+
+Usage:
+    python -m benchmarks.fake_ollama [--port 11435] [--token-latency-ms 20] [--first-token-latency-ms 100]
+"""
+import re
+import sys
+import json
+import math
+import time
+import hashlib
+import argparse
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+_WORD_PATTERN = re.compile(r"\w+")
+
+
+def deterministic_embedding(text: str, dimensions: int) -> list:
+    """Hashes every word of text into a signed bucket and L2-normalizes the result."""
+    vector = [0.0] * dimensions
+    for word in _WORD_PATTERN.findall(text.lower()):
+        digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+        bucket = int.from_bytes(digest[:4], "little") % dimensions
+        vector[bucket] += 1.0 if digest[4] & 1 else -1.0
+    norm = math.sqrt(sum(value * value for value in vector))
+    if norm == 0:
+        vector[0] = 1.0
+        return vector
+    return [value / norm for value in vector]
+
+
+class FakeOllamaServer:
+    """Threaded HTTP server answering like Ollama. Use start()/stop() or as a context manager."""
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, embedding_dimensions: int = 768,
+                 token_latency: float = 0.02, first_token_latency: float = 0.1, response_tokens: int = 64,
+                 embed_latency: float = 0.0, embed_latency_per_text: float = 0.0):
+        self.embedding_dimensions = embedding_dimensions
+        self.token_latency = token_latency
+        self.first_token_latency = first_token_latency
+        self.response_tokens = response_tokens
+        self.embed_latency = embed_latency
+        self.embed_latency_per_text = embed_latency_per_text
+        self.request_counts = Counter()
+        self.embedded_texts = 0
+        self._counts_lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), _make_handler(self))
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOllamaServer":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-ollama", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def _count(self, endpoint: str, texts: int = 0):
+        with self._counts_lock:
+            self.request_counts[endpoint] += 1
+            self.embedded_texts += texts
+
+    def embed(self, texts: list) -> list:
+        self._count("embed", len(texts))
+        delay = self.embed_latency + self.embed_latency_per_text * len(texts)
+        if delay > 0:
+            time.sleep(delay)
+        return [deterministic_embedding(text, self.embedding_dimensions) for text in texts]
+
+    def answer_tokens(self, messages: list) -> list:
+        self._count("chat")
+        question = messages[-1].get("content", "") if messages else ""
+        words = _WORD_PATTERN.findall(question) or ["answer"]
+        return [f"{words[i % len(words)]} " for i in range(self.response_tokens)]
+
+
+def _make_handler(server: FakeOllamaServer):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1" # Keep-alive, like the real server, so client connection pooling is exercised
+        # Headers and body go out in separate writes; with Nagle on, each response stalls ~40ms on delayed ACKs
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):
+            pass # Silence per-request logging
+
+        def _send_json(self, payload: dict, status: int = 200):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _stream_ndjson(self, payloads):
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            for payload in payloads:
+                line = (json.dumps(payload) + "\n").encode("utf-8")
+                self.wfile.write(f"{len(line):x}\r\n".encode("ascii") + line + b"\r\n")
+                self.wfile.flush()
+            self.wfile.write(b"0\r\n\r\n")
+
+        def do_GET(self):
+            if self.path == "/api/version":
+                self._send_json({"version": "0.0.0-fake"})
+            elif self.path == "/api/tags":
+                self._send_json({"models": []})
+            else:
+                self._send_json({"status": "Ollama is running"})
+
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            try:
+                request = json.loads(self.rfile.read(length) or b"{}")
+            except ValueError:
+                self._send_json({"error": "invalid JSON body"}, 400)
+                return
+            model = request.get("model", "")
+            if self.path == "/api/embed":
+                texts = request.get("input", [])
+                texts = [texts] if isinstance(texts, str) else texts
+                self._send_json({"model": model, "embeddings": server.embed(texts)})
+            elif self.path == "/api/embeddings":
+                self._send_json({"embedding": server.embed([request.get("prompt", "")])[0]})
+            elif self.path in ("/api/chat", "/api/generate"):
+                self._chat(request, model, is_chat=self.path == "/api/chat")
+            else:
+                self._send_json({"error": f"unknown endpoint {self.path}"}, 404)
+
+        def _chat(self, request: dict, model: str, is_chat: bool):
+            messages = request.get("messages") if is_chat else [{"content": request.get("prompt", "")}]
+            if not messages:
+                # Model load request (what warm-up sends)
+                self._send_json(self._message(model, "", is_chat, done=True))
+                return
+            tokens = server.answer_tokens(messages)
+            if not request.get("stream", True):
+                time.sleep(server.first_token_latency + server.token_latency * (len(tokens) - 1))
+                self._send_json(self._message(model, "".join(tokens), is_chat, done=True))
+                return
+
+            def stream():
+                time.sleep(server.first_token_latency)
+                for i, token in enumerate(tokens):
+                    if i:
+                        time.sleep(server.token_latency)
+                    yield self._message(model, token, is_chat, done=False)
+                yield self._message(model, "", is_chat, done=True)
+            self._stream_ndjson(stream())
+
+        @staticmethod
+        def _message(model: str, content: str, is_chat: bool, done: bool) -> dict:
+            payload = {"model": model, "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()), "done": done}
+            if is_chat:
+                payload["message"] = {"role": "assistant", "content": content}
+            else:
+                payload["response"] = content
+            if done:
+                payload["done_reason"] = "stop"
+            return payload
+
+    return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local stand-in for the Ollama HTTP API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11435)
+    parser.add_argument("--embedding-dimensions", type=int, default=768)
+    parser.add_argument("--token-latency-ms", type=float, default=20.0, help="Delay between streamed tokens")
+    parser.add_argument("--first-token-latency-ms", type=float, default=100.0, help="Delay before the first token (prompt processing)")
+    parser.add_argument("--response-tokens", type=int, default=64, help="Number of tokens in every chat answer")
+    parser.add_argument("--embed-latency-ms", type=float, default=0.0, help="Fixed delay per embedding request")
+    parser.add_argument("--embed-latency-per-text-ms", type=float, default=0.0, help="Additional delay per embedded text")
+    args = parser.parse_args()
+
+    server = FakeOllamaServer(args.host, args.port, args.embedding_dimensions, args.token_latency_ms / 1000,
+                              args.first_token_latency_ms / 1000, args.response_tokens, args.embed_latency_ms / 1000,
+                              args.embed_latency_per_text_ms / 1000)
+    print(f"Fake Ollama listening on {server.url} (set OLLAMA_HOST={server.url}). Ctrl+C to stop.")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._server.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,234 @@
+import os
+import sys
+import json
+import time
+import uuid
+import logging
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+try:
+    import resource # Unix only
+except ImportError:
+    resource = None
+
+import config
+
+
+def percentile(values: list, fraction: float):
+    """Nearest-rank percentile of values (None for an empty list)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+def latency_summary(values: list) -> dict:
+    return {
+        "count": len(values),
+        "mean": sum(values) / len(values) if values else None,
+        "p50": percentile(values, 0.50),
+        "p95": percentile(values, 0.95),
+        "p99": percentile(values, 0.99),
+        "max": max(values) if values else None,
+    }
+
+def peak_rss_mb() -> dict:
+    """Peak resident set size so far of this process and of its (finished or running) child processes."""
+    if resource is None:
+        return {"self": None, "children": None}
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {
+        "self": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale,
+        "children": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale,
+    }
+
+
+def configure_isolated_environment(workdir: str, ollama_url: str):
+    """
+    Points every data path at workdir and the Ollama client at ollama_url. Must run before
+    the app modules create their clients, so the real knowledge base is never touched.
+    """
+    config.PDF_DIRECTORY = os.path.join(workdir, "documents")
+    config.DONE_DIRECTORY = os.path.join(workdir, "done_documents")
+    config.CHROMA_DB_DIRECTORY = os.path.join(workdir, "chroma_db")
+    config.NUMPY_STORE_DIRECTORY = os.path.join(workdir, "vector_store")
+    config.KNOWLEDGE_BASES_DIRECTORY = os.path.join(workdir, "knowledge_bases")
+    config.EMBEDDING_CACHE_PATH = os.path.join(workdir, "embedding_cache.sqlite3")
+    config.DOCUMENT_REGISTRY_PATH = os.path.join(workdir, "document_registry.sqlite3")
+    config.CONVERSATION_STORE_PATH = os.path.join(workdir, "conversations.sqlite3")
+    config.LOG_FILE_PATH = os.path.join(workdir, "app.log")
+    config.CONVERSATION_PERSISTENCE_ENABLED = False
+    config.OLLAMA_HOST = ollama_url
+    os.environ["OLLAMA_HOST"] = ollama_url # For worker processes started with spawn
+
+
+class AppServer:
+    """Serves the Flask app on a loopback port in a background thread (threaded, like app.run)."""
+    def __init__(self, verbose: bool = False):
+        from werkzeug.serving import make_server
+        import app as flask_backend
+        if not verbose:
+            # Quiet the console only: app.log (in the workdir) keeps the INFO lines the ingestion check reads
+            flask_backend.c_handler.setLevel(logging.WARNING)
+            logging.getLogger("werkzeug").setLevel(logging.WARNING)
+        flask_backend._initial_setup_thread()
+        self._server = make_server("127.0.0.1", 0, flask_backend.app, threaded=True)
+        self._thread = threading.Thread(target=self._server.serve_forever, name="bench-app", daemon=True)
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+
+
+def _connection(base_url: str, timeout: float = 600) -> http.client.HTTPConnection:
+    parts = urlsplit(base_url)
+    return http.client.HTTPConnection(parts.hostname, parts.port, timeout=timeout)
+
+def _request_json(base_url: str, method: str, path: str, body: bytes = None, headers: dict = None):
+    connection = _connection(base_url)
+    try:
+        connection.request(method, path, body=body, headers=headers or {})
+        response = connection.getresponse()
+        return response.status, json.loads(response.read() or b"{}")
+    finally:
+        connection.close()
+
+def _upload_file(base_url: str, file_path: str):
+    boundary = uuid.uuid4().hex
+    with open(file_path, "rb") as f:
+        content = f.read()
+    body = (
+        f"--{boundary}\r\nContent-Disposition: form-data; name=\"file\"; filename=\"{os.path.basename(file_path)}\"\r\n"
+        f"Content-Type: application/octet-stream\r\n\r\n"
+    ).encode("utf-8") + content + f"\r\n--{boundary}--\r\n".encode("utf-8")
+    return _request_json(base_url, "POST", "/upload_pdf", body, {"Content-Type": f"multipart/form-data; boundary={boundary}"})
+
+
+def count_logged_timing_trailers(log_path: str, filenames: list) -> int:
+    """Number of filenames whose per-document timing line (see ingestion_pipeline) made it into the log file."""
+    if not os.path.exists(log_path):
+        return 0
+    with open(log_path, "r", encoding="utf-8", errors="replace") as f:
+        log_text = f.read()
+    return sum(1 for filename in filenames if f"'{filename}' timings: total=" in log_text)
+
+
+def run_ingestion(base_url: str, file_paths: list, concurrency: int, poll_interval: float = 0.05) -> dict:
+    """Uploads every file through /upload_pdf (concurrency uploads at a time) and waits for all jobs to finish."""
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        uploads = list(executor.map(lambda path: (path, time.perf_counter(), _upload_file(base_url, path)), file_paths))
+
+    jobs, failed_uploads = {}, []
+    for path, submitted_at, (status, payload) in uploads:
+        if status == 202:
+            jobs[payload["job_id"]] = submitted_at
+        else:
+            failed_uploads.append(f"{os.path.basename(path)}: {payload.get('error')}")
+
+    finished, job_seconds = {}, []
+    while len(finished) < len(jobs):
+        for job_id, submitted_at in jobs.items():
+            if job_id in finished:
+                continue
+            status, job = _request_json(base_url, "GET", f"/jobs/{job_id}")
+            if status == 200 and job["status"] in ("completed", "failed"):
+                finished[job_id] = job
+                job_seconds.append(time.perf_counter() - submitted_at)
+        time.sleep(poll_interval)
+    elapsed = time.perf_counter() - start_time
+
+    chunks = sum(job.get("chunks_done") or 0 for job in finished.values())
+    ingested = [job["filename"] for job in finished.values() if job["status"] == "completed" and job.get("chunks_done")]
+    return {
+        "files": len(file_paths),
+        "failed": failed_uploads + [f"{job['filename']}: {job['error']}" for job in finished.values() if job["status"] == "failed"],
+        "chunks": chunks,
+        "elapsed_seconds": elapsed,
+        "chunks_per_second": chunks / elapsed if elapsed > 0 else None,
+        "files_per_second": len(file_paths) / elapsed if elapsed > 0 else None,
+        "job_seconds": latency_summary(job_seconds),
+        "ingested_files": len(ingested),
+        "timing_trailers_logged": count_logged_timing_trailers(config.LOG_FILE_PATH, ingested),
+    }
+
+
+def run_retrieval(queries: list, concurrency: int, n_results: int = None) -> dict:
+    """Calls query_chroma_for_context directly for every query (concurrency at a time)."""
+    from vector_db_manager import query_chroma_for_context
+    n_results = n_results or config.RAG_PRE_RANK_N_RESULTS
+    latencies, hits = [], []
+
+    def run_query(query):
+        query_start = time.perf_counter()
+        results, _ = query_chroma_for_context(query, n_results=n_results)
+        return time.perf_counter() - query_start, len(results)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for latency, result_count in executor.map(run_query, queries):
+            latencies.append(latency)
+            hits.append(result_count)
+    elapsed = time.perf_counter() - start_time
+    return {
+        "queries": len(queries),
+        "queries_per_second": len(queries) / elapsed if elapsed > 0 else None,
+        "mean_results": sum(hits) / len(hits) if hits else 0,
+        "latency_seconds": latency_summary(latencies),
+    }
+
+
+def _chat_once(base_url: str, message: str, conversation_id: str) -> dict:
+    connection = _connection(base_url)
+    try:
+        request_start = time.perf_counter()
+        connection.request("POST", "/chat", body=json.dumps({"message": message, "conversation_id": conversation_id}),
+                           headers={"Content-Type": "application/json"})
+        response = connection.getresponse()
+        if response.status != 200:
+            response.read()
+            return {"status": response.status}
+        first_chunk_at, text = None, b""
+        while True:
+            chunk = response.read1(65536)
+            if not chunk:
+                break
+            if first_chunk_at is None:
+                first_chunk_at = time.perf_counter()
+            text += chunk
+        end_time = time.perf_counter()
+        return {
+            "status": 200,
+            "ttft": (first_chunk_at or end_time) - request_start,
+            "total": end_time - request_start,
+            "error": text.startswith(b"ERROR:"),
+        }
+    finally:
+        connection.close()
+
+def run_chat(base_url: str, queries: list, concurrency: int) -> dict:
+    """Sends every query to /chat (concurrency at a time, each in its own conversation) and times the stream."""
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda item: _chat_once(base_url, item[1], f"bench-{item[0]}"), enumerate(queries)))
+    elapsed = time.perf_counter() - start_time
+    completed = [result for result in results if result["status"] == 200]
+    return {
+        "requests": len(queries),
+        "completed": len(completed),
+        "rejected": sum(1 for result in results if result["status"] == 503),
+        "errors": sum(1 for result in results if result["status"] not in (200, 503) or result.get("error")),
+        "requests_per_second": len(completed) / elapsed if elapsed > 0 else None,
+        "ttft_seconds": latency_summary([result["ttft"] for result in completed]),
+        "total_seconds": latency_summary([result["total"] for result in completed]),
+    }
@@ -0,0 +1,169 @@
+"""
+Bulk ingestion of a whole directory of documents into the knowledge base.
+
+Usage:
+    python bulk_ingest.py [directory] [--workers N] [--batch-size N] [--keep-files] [--knowledge-base NAME] [--stall-timeout SECONDS]
+
+Walks the directory (config.PDF_DIRECTORY by default) and feeds every supported file
+through the ingestion pipeline: parallel worker processes extract and split, while
+earlier files are already being embedded and written to ChromaDB in large batches.
+Each file is stored under its path relative to the directory (e.g. 'contracts/2024/a.pdf'),
+so files with the same name in different subdirectories stay separate documents.
+Each finished file is moved to the same relative path in the knowledge base's
+done-documents directory (config.DONE_DIRECTORY for the default one). Files that are
+unchanged since their last ingest are skipped, and changed files only embed their new chunks.
+If no file makes progress for --stall-timeout seconds (e.g. a worker process hangs) or a
+pipeline stage dies, the unfinished files are reported as lost and the command exits non-zero.
+
+Stop the server first: its vector store doesn't see writes made by another process,
+so it would keep serving (and caching) the old knowledge base.
+"""
+import os
+import sys
+import time
+import argparse
+import threading
+import multiprocessing
+import config
+from document_processor import is_supported_file
+from ingestion_pipeline import IngestionPipeline, DocumentTask
+from knowledge_bases import normalize_knowledge_base_name, create_knowledge_base
+
+
+def find_supported_files(directory: str) -> list[str]:
+    """Recursively lists every file under directory that document_processor can handle."""
+    file_paths = []
+    for root, _, file_names in os.walk(directory):
+        for file_name in sorted(file_names):
+            if is_supported_file(file_name):
+                file_paths.append(os.path.join(root, file_name))
+    return file_paths
+
+
+def source_name(directory: str, file_path: str) -> str:
+    """The document name a file is ingested under: its path relative to directory, with '/' separators."""
+    return os.path.relpath(file_path, directory).replace(os.sep, "/")
+
+
+def bulk_ingest(directory: str, workers: int, batch_size: int, move_files: bool = True, knowledge_base: str = None,
+                stall_timeout: float = None) -> dict:
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    create_knowledge_base(knowledge_base)
+    file_paths = find_supported_files(directory)
+    print(f"Found {len(file_paths)} supported files in '{directory}' (knowledge base '{knowledge_base}').")
+
+    stall_timeout = config.BULK_INGEST_STALL_TIMEOUT_SECONDS if stall_timeout is None else stall_timeout
+    stats = {"files": 0, "chunks": 0, "embedded": 0, "removed": 0, "unchanged": [], "empty": [], "failed": [], "lost": []}
+    stats_lock = threading.Lock()
+    remaining = [len(file_paths)]
+    all_done = threading.Event()
+    finished = set()
+    last_progress = [time.perf_counter()]
+
+    def on_progress(task, **fields):
+        last_progress[0] = time.perf_counter()
+
+    def on_finish(task):
+        last_progress[0] = time.perf_counter()
+        with stats_lock:
+            finished.add(task.file_path)
+            if task.outcome == "completed":
+                stats["files"] += 1
+                stats["chunks"] += task.chunks_done
+                stats["embedded"] += len(task.added_ids)
+                stats["removed"] += task.chunks_removed
+            elif task.outcome == "failed":
+                print(f"Error processing '{task.file_path}': {task.error}")
+                stats["failed"].append(task.file_path)
+            elif task.outcome == "empty":
+                print(f"No text extracted from '{task.file_path}'. It might be an image-based PDF or empty.")
+                stats["empty"].append(task.file_path)
+            else:
+                stats["unchanged"].append(task.file_path)
+            remaining[0] -= 1
+            if remaining[0] == 0:
+                all_done.set()
+
+    # Failed and empty files are left where they are so they can be fixed and retried
+    pipeline = IngestionPipeline(workers, batch_size, move_files=move_files, delete_failed_files=False)
+    start_time = time.perf_counter()
+    pipeline.start()
+    for file_path in file_paths:
+        pipeline.submit(DocumentTask(file_path, source_name(directory, file_path), on_progress=on_progress, on_finish=on_finish,
+                                     knowledge_base=knowledge_base))
+    while file_paths and not all_done.wait(timeout=1.0):
+        if not pipeline.is_alive():
+            reason = "an ingestion pipeline stage stopped unexpectedly"
+        elif time.perf_counter() - last_progress[0] > stall_timeout:
+            reason = f"no file made progress for {stall_timeout:.0f}s (a worker process may be hung)"
+        else:
+            continue
+        with stats_lock:
+            stats["lost"] = [file_path for file_path in file_paths if file_path not in finished]
+        print(f"Error: {reason}; giving up on {len(stats['lost'])} unfinished files.")
+        # The stages can't be shut down cleanly now; kill the worker processes so nothing is left running
+        for process in multiprocessing.active_children():
+            process.terminate()
+        break
+    stats["elapsed"] = time.perf_counter() - start_time
+    stats["stages"] = pipeline.stats()
+    if not stats["lost"]:
+        pipeline.shutdown()
+    return stats
+
+
+def print_summary(stats: dict):
+    elapsed = max(stats["elapsed"], 1e-9)
+    print("\n--- Bulk ingestion summary ---")
+    print(f"Files ingested:   {stats['files']}")
+    print(f"Chunks:           {stats['chunks']} ({stats['embedded']} embedded, {stats['removed']} stale removed)")
+    print(f"Unchanged files:  {len(stats['unchanged'])}")
+    print(f"Empty files:      {len(stats['empty'])}")
+    print(f"Failed files:     {len(stats['failed'])}")
+    if stats["lost"]:
+        print(f"Lost files:       {len(stats['lost'])} (never finished)")
+    print(f"Elapsed:          {stats['elapsed']:.1f}s")
+    print(f"Throughput:       {stats['files'] / elapsed:.2f} files/s, {stats['chunks'] / elapsed:.1f} chunks/s")
+    print("Pipeline stages:")
+    for name, stage in stats.get("stages", {}).items():
+        print(f"  {name:<8} workers={stage['workers']:<3} items={stage['items']:<6} "
+              f"utilization={stage['utilization'] * 100:5.1f}%  blocked={stage['blocked_seconds']:.1f}s")
+    for file_path in stats["failed"]:
+        print(f"  FAILED: {file_path}")
+    for file_path in stats["lost"]:
+        print(f"  LOST: {file_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bulk-ingest a directory of documents into the knowledge base.")
+    parser.add_argument("directory", nargs="?", default=config.PDF_DIRECTORY,
+                        help="Directory to ingest (default: config.PDF_DIRECTORY)")
+    parser.add_argument("--workers", type=int, default=config.MAX_PROCESS_WORKERS,
+                        help="Number of extraction worker processes (default: config.MAX_PROCESS_WORKERS)")
+    parser.add_argument("--batch-size", type=int, default=config.BULK_INGEST_WRITE_BATCH_SIZE,
+                        help="Number of chunks per embedding/ChromaDB write batch (default: config.BULK_INGEST_WRITE_BATCH_SIZE)")
+    parser.add_argument("--keep-files", action="store_true",
+                        help="Leave ingested files in place instead of moving them to the done-documents directory")
+    parser.add_argument("--knowledge-base", default=None,
+                        help="Knowledge base to ingest into, created if needed (default: config.DEFAULT_KNOWLEDGE_BASE)")
+    parser.add_argument("--stall-timeout", type=float, default=config.BULK_INGEST_STALL_TIMEOUT_SECONDS,
+                        help="Give up if no file makes progress for this many seconds (default: config.BULK_INGEST_STALL_TIMEOUT_SECONDS)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.directory):
+        print(f"Error: '{args.directory}' is not a directory.")
+        return 1
+    try:
+        knowledge_base = normalize_knowledge_base_name(args.knowledge_base)
+    except ValueError as e:
+        print(f"Error: {e}")
+        return 1
+
+    stats = bulk_ingest(args.directory, max(1, args.workers), max(1, args.batch_size), move_files=not args.keep_files,
+                        knowledge_base=knowledge_base, stall_timeout=args.stall_timeout)
+    print_summary(stats)
+    return 1 if stats["failed"] or stats["lost"] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
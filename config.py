@@ -12,9 +12,28 @@ CHROMA_DB_DIRECTORY = os.path.join(BASE_DIR, "chroma_db")
 # Path for curated knowledge JSON file
 CURATED_KNOWLEDGE_FILE = os.path.join(BASE_DIR, "curated_knowledge.json")
 
+# SQLite file for the persistent embedding cache (lives next to the ChromaDB directory)
+EMBEDDING_CACHE_PATH = os.path.join(BASE_DIR, "embedding_cache.sqlite3")
+
+# SQLite registry of ingested documents (content hash, chunk count, size, ingest time per source file)
+DOCUMENT_REGISTRY_PATH = os.path.join(BASE_DIR, "document_registry.sqlite3")
+
+# SQLite file for saved chat conversations (only used when CONVERSATION_PERSISTENCE_ENABLED is set)
+CONVERSATION_STORE_PATH = os.path.join(BASE_DIR, "conversations.sqlite3")
+
 # Directory for storing processed files (after RAG/summary generation)
 DONE_DIRECTORY = os.path.join(BASE_DIR, "done_documents")
 
+# Application log file (relative paths are resolved against the working directory)
+LOG_FILE_PATH = "app.log"
+
+# Directory for the NumPy vector store (only used when VECTOR_STORE_BACKEND is "numpy")
+NUMPY_STORE_DIRECTORY = os.path.join(BASE_DIR, "vector_store")
+
+# Directory for the named knowledge bases other than the default one (one subdirectory each with
+# its uploads, done documents, document registry and NumPy store; ChromaDB collections stay in CHROMA_DB_DIRECTORY)
+KNOWLEDGE_BASES_DIRECTORY = os.path.join(BASE_DIR, "knowledge_bases")
+
 
 # --- Ollama Model Configurations ---
 # The large language model (LLM) used for chat responses
@@ -23,6 +42,44 @@ OLLAMA_CHAT_MODEL = "goekdenizguelmez/JOSIEFIED-Qwen3:8b" # Your preferred chat
 # The embedding model used for converting text into vectors for the vector database
 OLLAMA_EMBEDDING_MODEL = "nomic-embed-text" # Your preferred embedding model
 
+# The model used to summarize older chat messages in the background (a smaller model works fine here)
+CONVERSATION_SUMMARY_MODEL = OLLAMA_CHAT_MODEL
+
+# --- Ollama Connection Settings ---
+# Address of the Ollama server (the OLLAMA_HOST environment variable overrides the default)
+OLLAMA_HOST = os.environ.get("OLLAMA_HOST", "http://localhost:11434")
+
+# Seconds to wait for Ollama to respond (or send the next streamed token) before giving up
+OLLAMA_REQUEST_TIMEOUT_SECONDS = 300 # Generous: CPU-only generation and model loading can be slow
+
+# Seconds to wait when opening a connection to Ollama
+OLLAMA_CONNECT_TIMEOUT_SECONDS = 5
+
+# Maximum number of pooled HTTP connections to Ollama (kept open and reused between requests)
+OLLAMA_MAX_CONNECTIONS = 16
+
+# How long Ollama keeps a model loaded after its last request (e.g. "30m", "24h", or -1 for forever)
+OLLAMA_KEEP_ALIVE = "30m"
+
+# Load the chat and embedding models during startup so the first request doesn't wait for them
+OLLAMA_WARM_UP_ON_STARTUP = True
+
+# Seconds between retries of a startup step that failed (e.g. Ollama not running yet); /readyz reports not ready until it succeeds
+STARTUP_RETRY_SECONDS = 10
+
+# --- Admission Control ---
+# Maximum number of /chat requests generating at the same time; more just queue inside Ollama anyway
+CHAT_MAX_CONCURRENT_REQUESTS = 4
+
+# Number of /chat requests allowed to wait for a free slot; beyond this requests are rejected with a 503
+CHAT_MAX_QUEUED_REQUESTS = 16
+
+# Seconds a queued /chat request waits for a slot before it is rejected with a 503
+CHAT_QUEUE_TIMEOUT_SECONDS = 30
+
+# Retry-After value (in seconds) sent with 503 responses when the server is overloaded
+CHAT_RETRY_AFTER_SECONDS = 5
+
 # --- Application Settings ---
 # Maximum number of messages to keep in the chat history
 MAX_HISTORY_MESSAGES = 20 # Keep recent context, adjust as needed
@@ -30,9 +87,63 @@ MAX_HISTORY_MESSAGES = 20 # Keep recent context, adjust as needed
 # Number of most recent messages to keep unsummarized
 MAX_UNSUMMARIZED_MESSAGES = 10 # Keep this many recent messages unsummarized
 
+# Fold older messages into a running summary in the background once MAX_UNSUMMARIZED_MESSAGES is exceeded
+CONVERSATION_SUMMARY_ENABLED = True
+
+# Number of most recent messages left verbatim after a summarization pass
+CONVERSATION_SUMMARY_KEEP_RECENT = 4
+
+# Target length of the running summary (in words), so it stays small in every prompt
+CONVERSATION_SUMMARY_MAX_WORDS = 200
+
+# With summarization on, messages beyond MAX_HISTORY_MESSAGES are kept until they are folded into the summary
+# (e.g. while a summary is pending or Ollama is failing); past this hard limit the oldest are dropped unsummarized
+CONVERSATION_MAX_UNFOLDED_MESSAGES = 100
+
+# Every browser session gets its own conversation. Maximum number of conversations kept in memory;
+# beyond this the least recently used ones are evicted.
+CONVERSATION_MAX_SESSIONS = 500
+
+# Seconds without activity after which a conversation is evicted from memory
+CONVERSATION_IDLE_TTL_SECONDS = 3600
+
+# Save conversations to CONVERSATION_STORE_PATH so they survive eviction and server restarts
+CONVERSATION_PERSISTENCE_ENABLED = False
+
+# Seconds after which an inactive saved conversation is deleted from disk
+CONVERSATION_PERSIST_TTL_SECONDS = 7 * 24 * 3600
+
 # ChromaDB Collection Name
 CHROMA_COLLECTION_NAME = "breezeai_knowledge"
 
+# --- Vector Store Settings ---
+# Where chunks and their embeddings are stored and searched:
+#   "chroma" - ChromaDB collection in CHROMA_DB_DIRECTORY (approximate HNSW search)
+#   "numpy"  - memory-mapped embedding matrix in NUMPY_STORE_DIRECTORY with exact brute-force search;
+#              faster to open and to query for small to mid-sized knowledge bases (up to ~1M chunks)
+# Switching backends starts from an empty knowledge base; documents have to be ingested again.
+VECTOR_STORE_BACKEND = "chroma"
+
+# Storage precision of the NumPy store's embeddings: "float16" halves disk and memory use, "float32" is exact
+NUMPY_STORE_DTYPE = "float16"
+
+# Rows per append-only segment of the NumPy store; a new segment file is started when the last one is full
+NUMPY_STORE_SEGMENT_MAX_ROWS = 100000
+
+# A segment is rewritten without its deleted rows once more than this fraction of it is deleted
+NUMPY_STORE_COMPACT_RATIO = 0.25
+
+# Rows scored per step of a NumPy store search (bounds the temporary float32 copy of the matrix)
+NUMPY_STORE_SEARCH_BLOCK_ROWS = 65536
+
+# --- Knowledge Bases ---
+# Knowledge base used when a request doesn't name one. It keeps the original locations above
+# (CHROMA_COLLECTION_NAME, DOCUMENT_REGISTRY_PATH, DONE_DIRECTORY, ...), so existing data stays in it.
+DEFAULT_KNOWLEDGE_BASE = "default"
+
+# Threads searching knowledge bases in parallel when a chat query spans several of them
+KNOWLEDGE_BASE_SEARCH_WORKERS = 8
+
 # Default system prompt for the Ollama model
 DEFAULT_SYSTEM_PROMPT = """You are an great AI  Assistant."""
 
@@ -40,6 +151,35 @@ DEFAULT_SYSTEM_PROMPT = """You are an great AI  Assistant."""
 # Maximum number of worker processes for parallel tasks (e.g., document processing)
 MAX_PROCESS_WORKERS = 6 # Adjust based on your CPU cores and available memory
 
+# Number of chunks embedded and written to ChromaDB per step of an ingestion job (drives progress reporting)
+INGESTION_WRITE_BATCH_SIZE = 256
+
+# Maximum number of chunk batches a worker process may extract ahead of the embedder (bounds memory per job)
+INGESTION_QUEUE_MAX_BATCHES = 4
+
+# Ingestion runs as a pipeline: extract/split (worker processes) -> embed (Ollama) -> write (ChromaDB).
+# Maximum number of chunk batches waiting between two stages; a full queue pauses the stage before it.
+INGESTION_PIPELINE_QUEUE_SIZE = 8
+
+# Number of threads embedding chunk batches at the same time (each batch is further split per EMBEDDING_BATCH_SIZE)
+INGESTION_EMBED_WORKERS = 2
+
+# Number of chunks per batch flowing through the embed and write stages during bulk ingestion
+BULK_INGEST_WRITE_BATCH_SIZE = 1024
+
+# bulk_ingest.py gives up (and exits non-zero) when no file has made progress for this long, e.g. a hung worker process
+BULK_INGEST_STALL_TIMEOUT_SECONDS = 600
+
+# Default and maximum page size for listing documents in the knowledge base
+DOCUMENT_LIST_PAGE_SIZE = 100
+DOCUMENT_LIST_MAX_PAGE_SIZE = 1000
+
+# Number of chunks fetched from ChromaDB per request when reading a document's chunks in order
+CHUNK_FETCH_PAGE_SIZE = 500
+
+# Number of finished ingestion jobs kept in memory so their status can still be queried
+INGESTION_JOB_HISTORY_LIMIT = 500
+
 # --- RAG (Retrieval Augmented Generation) Settings ---
 # Number of top relevant results to retrieve from ChromaDB for initial context
 RAG_PRE_RANK_N_RESULTS = 50 # Increased from 10: Retrieve more chunks initially for better filtering
@@ -52,10 +192,94 @@ RAG_N_RESULTS = 24 # Increased from 4: Pass more top relevant chunks to the LLM
 # Increased from 0.5 to 0.75: Less strict, allows for slightly less perfect matches, which can be useful
 RAG_SCORE_THRESHOLD = 0.95 # Adjust based on your embedding model and desired strictness.... i think this is too strict dude
 
+# Re-rank the filtered candidates with maximal marginal relevance (MMR) instead of taking the top N,
+# so overlapping / repeated chunks don't crowd out new information in the prompt
+RAG_MMR_ENABLED = True
+
+# Trade-off between relevance and diversity: 1.0 = pure relevance order, 0.0 = pure diversity
+RAG_MMR_LAMBDA = 0.5
+
+# Candidates whose cosine similarity to an already selected chunk is above this are dropped as duplicates
+RAG_MMR_MAX_SIMILARITY = 0.95
+
+# Maximum size (in estimated tokens) of the retrieved context added to the prompt.
+# Adjacent chunks of the same document are merged first, so their overlap doesn't count twice.
+RAG_CONTEXT_TOKEN_BUDGET = 2048 # Smaller prompts mean a faster time-to-first-token, especially on CPU
+
+# Characters per token used to estimate prompt size (about 4 for English text)
+RAG_CONTEXT_CHARS_PER_TOKEN = 4
+
+
+# Cache query embeddings and retrieval results for repeated questions (invalidated whenever the knowledge base changes)
+QUERY_CACHE_ENABLED = True
+
+# Maximum number of cached query embeddings and cached retrieval results
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+RETRIEVAL_CACHE_SIZE = 256
+
+# Seconds after which a cached query embedding or retrieval result expires
+QUERY_CACHE_TTL_SECONDS = 600
+
+# Opt-in semantic answer cache: replay a stored answer when a new question is within
+# ANSWER_CACHE_MAX_DISTANCE (cosine) of a cached one AND retrieves exactly the same chunks.
+# Cached answers ignore earlier conversation turns, so only enable this for FAQ-style usage.
+ANSWER_CACHE_ENABLED = False
+ANSWER_CACHE_MAX_DISTANCE = 0.05
+ANSWER_CACHE_MAX_ENTRIES = 512
+ANSWER_CACHE_TTL_SECONDS = 3600
+
+# Size (in characters) of the pieces a cached answer is streamed back in
+ANSWER_CACHE_REPLAY_CHUNK_CHARS = 64
+
 
 # --- Text Splitting for RAG ---
 # Size of text chunks for the vector database (in characters)
 TEXT_CHUNK_SIZE = 1000
 
 # Overlap between consecutive text chunks (in characters)
-TEXT_CHUNK_OVERLAP = 200
\ No newline at end of file
+TEXT_CHUNK_OVERLAP = 200
+
+# --- Embedding Settings ---
+# Number of chunks sent to Ollama in a single embedding request
+EMBEDDING_BATCH_SIZE = 32 # Larger batches mean fewer round trips, but more memory per request
+
+# Maximum number of embedding batches in flight at the same time
+EMBEDDING_MAX_WORKERS = 4 # Keep this close to the number of parallel requests your Ollama server handles (OLLAMA_NUM_PARALLEL)
+
+# Number of attempts for a single embedding batch before the whole call fails
+EMBEDDING_MAX_RETRIES = 3
+
+# Delay (in seconds) before the first retry of a failed batch; doubled after every further attempt
+EMBEDDING_RETRY_BACKOFF_SECONDS = 1.0
+
+# Reuse embeddings of previously seen chunk texts instead of asking Ollama again
+EMBEDDING_CACHE_ENABLED = True
+
+# Maximum number of cached embeddings; least recently used entries are evicted beyond this
+EMBEDDING_CACHE_MAX_ENTRIES = 200000 # Roughly 600 MB for 768-dimensional embeddings
+
+# Merge single-text embedding calls that arrive at almost the same time (e.g. concurrent chat queries)
+# into one batched Ollama request
+EMBEDDING_COALESCING_ENABLED = True
+
+# How long (in seconds) the first waiting call holds its batch open for others to join; only used under
+# concurrency (a lone call with no request in flight is sent immediately)
+EMBEDDING_COALESCE_WINDOW_SECONDS = 0.005 # A few milliseconds: negligible next to the embedding itself
+
+# Maximum number of calls merged into one request, and number of merged requests in flight at once
+EMBEDDING_COALESCE_MAX_BATCH_SIZE = 64
+EMBEDDING_COALESCE_MAX_IN_FLIGHT = 2
+
+# --- Log Streaming Settings ---
+# Maximum number of log lines buffered per connected log viewer before the oldest are dropped
+LOG_STREAM_BUFFER_SIZE = 1000
+
+# Number of recent log lines replayed to a log viewer when it connects
+LOG_STREAM_REPLAY_LINES = 200
+
+# Seconds of silence after which a heartbeat is sent to keep idle log streams alive
+LOG_STREAM_HEARTBEAT_SECONDS = 15
+
+# --- Metrics Settings ---
+# Log a one-line per-stage timing trailer for every chat request and ingestion job
+METRICS_LOG_REQUEST_TIMINGS = True
@@ -0,0 +1,81 @@
+from typing import Any, Dict, List
+import config
+
+# Shortest suffix/prefix match treated as real chunk overlap rather than a coincidence
+MIN_OVERLAP_CHARS = 10
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (characters / RAG_CONTEXT_CHARS_PER_TOKEN), good enough for budgeting."""
+    return -(-len(text) // config.RAG_CONTEXT_CHARS_PER_TOKEN)
+
+def merge_adjacent_text(previous: str, following: str, max_overlap: int = None) -> str:
+    """Joins two consecutive chunks of the same document, keeping the text they share only once."""
+    max_overlap = config.TEXT_CHUNK_OVERLAP if max_overlap is None else max_overlap
+    for size in range(min(max_overlap, len(previous), len(following)), MIN_OVERLAP_CHARS - 1, -1):
+        if previous.endswith(following[:size]):
+            return previous + following[size:]
+    return previous + "\n" + following
+
+def _build_sections(results: List[Dict[str, Any]]) -> List[str]:
+    """
+    Groups results by source (within their knowledge base), orders each source's chunks by position
+    and merges runs of consecutive chunk_index values into one section. Sources keep the rank of their best chunk.
+    """
+    by_source = {}
+    for rank, res in enumerate(results):
+        by_source.setdefault((res.get('knowledge_base'), res['metadata'].get('source')), []).append((rank, res))
+
+    sections = []
+    for entries in by_source.values():
+        # Chunks stored before chunk_index existed can't be placed, so they keep their rank order
+        entries.sort(key=lambda entry: (entry[1]['metadata'].get('chunk_index') is None, entry[1]['metadata'].get('chunk_index', 0), entry[0]))
+        text, last_index = None, None
+        for _, res in entries:
+            chunk_index = res['metadata'].get('chunk_index')
+            if text is not None and chunk_index is not None and last_index is not None and chunk_index == last_index + 1:
+                text = merge_adjacent_text(text, res['document'])
+            else:
+                if text is not None:
+                    sections.append(text)
+                text = res['document']
+            last_index = chunk_index
+        if text is not None:
+            sections.append(text)
+    return sections
+
+def pack_context(results: List[Dict[str, Any]], token_budget: int = None) -> Dict[str, Any]:
+    """
+    Packs ranked retrieval results into prompt context within token_budget. Chunks are
+    taken in rank order while the packed context (after merging adjacent chunks) still
+    fits; one that doesn't is skipped in favour of smaller or adjacent lower-ranked ones.
+    Returns the context sections, the results that made it in and token counts.
+    """
+    token_budget = config.RAG_CONTEXT_TOKEN_BUDGET if token_budget is None else token_budget
+    input_tokens = sum(estimate_tokens(res['document']) for res in results)
+
+    included, sections, packed_tokens = [], [], 0
+    for res in results:
+        candidate_sections = _build_sections(included + [res])
+        candidate_tokens = sum(estimate_tokens(section) for section in candidate_sections)
+        if candidate_tokens > token_budget:
+            continue
+        included.append(res)
+        sections, packed_tokens = candidate_sections, candidate_tokens
+
+    if not included and results:
+        # Not even the best chunk fits: send a truncated copy of it rather than nothing
+        best = results[0]
+        sections = [best['document'][:token_budget * config.RAG_CONTEXT_CHARS_PER_TOKEN]]
+        included = [best]
+        packed_tokens = estimate_tokens(sections[0])
+
+    stats = {
+        "input_chunks": len(results),
+        "input_tokens": input_tokens,
+        "packed_chunks": len(included),
+        "sections": len(sections),
+        "packed_tokens": packed_tokens,
+        "tokens_saved": input_tokens - packed_tokens,
+    }
+    return {"sections": sections, "results": included, "stats": stats}
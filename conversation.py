@@ -0,0 +1,287 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import threading
+import logging
+import traceback
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+import config
+from ollama_manager import get_ollama_completion
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+CONVERSATION_SUMMARIES = REGISTRY.counter("localrag_conversation_summaries_total", "Background conversation summarizations by outcome.")
+CONVERSATION_SUMMARY_SECONDS = REGISTRY.histogram("localrag_conversation_summary_seconds", "Time taken to fold older messages into the running summary.")
+
+# Reasoning models (e.g. Qwen3) may wrap their thoughts in <think> tags; those don't belong in a summary
+_THINK_BLOCK = re.compile(r"<think>.*?</think>", re.DOTALL)
+
+# Single background worker: summaries are low priority and shouldn't compete with chat for Ollama
+_summary_executor = None
+_summary_executor_lock = threading.Lock()
+
+# Global conversation store, created on first use
+_conversation_store = None
+_conversation_store_lock = threading.Lock()
+
+
+def _get_summary_executor() -> ThreadPoolExecutor:
+    global _summary_executor
+    with _summary_executor_lock:
+        if _summary_executor is None:
+            _summary_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summarizer")
+    return _summary_executor
+
+
+class Conversation:
+    """
+    Chat history made of a running summary of older turns plus the most recent messages
+    verbatim. Once more than MAX_UNSUMMARIZED_MESSAGES are unsummarized, a background
+    task folds all but the last CONVERSATION_SUMMARY_KEEP_RECENT of them into the summary.
+    Prompts get the summary and at most the last MAX_UNSUMMARIZED_MESSAGES messages.
+    """
+    def __init__(self, conversation_id: str = None, on_change: Callable[["Conversation"], None] = None):
+        self.conversation_id = conversation_id
+        self.on_change = on_change # Called (without the lock held) after every change, e.g. to persist it
+        self.summary = ""
+        self._messages = deque() # (sequence number, message) pairs not folded into the summary yet
+        self._next_seq = 0
+        self._generation = 0 # Bumped by clear() so an in-flight summary of old messages is discarded
+        self._summary_pending = False
+        self._lock = threading.Lock()
+        self.last_active = time.time()
+
+    def add_message(self, role: str, content: str):
+        with self._lock:
+            self._messages.append((self._next_seq, {"role": role, "content": content}))
+            self._next_seq += 1
+            self.last_active = time.time()
+            dropped = self._trim()
+        if dropped:
+            logger.warning(f"Conversation '{self.conversation_id}' dropped {dropped} old messages that could not be summarized yet.")
+        self._changed()
+
+    def _trim(self) -> int:
+        # Called with _lock held. Without summarization the oldest messages simply fall off; with it they
+        # stay until _summarize folds them in, up to a hard limit. Returns how many messages were dropped.
+        if config.CONVERSATION_SUMMARY_ENABLED:
+            limit = max(config.MAX_HISTORY_MESSAGES, config.CONVERSATION_MAX_UNFOLDED_MESSAGES)
+        else:
+            limit = config.MAX_HISTORY_MESSAGES
+        dropped = 0
+        while len(self._messages) > limit:
+            self._messages.popleft()
+            dropped += 1
+        return dropped if config.CONVERSATION_SUMMARY_ENABLED else 0
+
+    def get_messages(self) -> List[Dict[str, str]]:
+        """Returns the unsummarized messages, oldest first."""
+        with self._lock:
+            return [message for _, message in self._messages]
+
+    def get_prompt_messages(self) -> List[Dict[str, str]]:
+        """Returns the history to send to the LLM: the running summary (if any) followed by the recent messages."""
+        with self._lock:
+            summary = self.summary
+            recent = [message for _, message in self._messages][-config.MAX_UNSUMMARIZED_MESSAGES:]
+        if summary:
+            return [{"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}] + recent
+        return recent
+
+    def clear(self):
+        with self._lock:
+            self._messages.clear()
+            self.summary = ""
+            self._generation += 1
+            self.last_active = time.time()
+        self._changed()
+
+    def _changed(self):
+        if self.on_change is not None:
+            self.on_change(self)
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            return {"summary": self.summary, "messages": [message for _, message in self._messages], "last_active": self.last_active}
+
+    @classmethod
+    def from_dict(cls, conversation_id: str, data: dict, on_change: Callable[["Conversation"], None] = None) -> "Conversation":
+        conversation = cls(conversation_id)
+        conversation.summary = data.get("summary", "")
+        for message in data.get("messages", []):
+            conversation._messages.append((conversation._next_seq, message))
+            conversation._next_seq += 1
+        conversation.last_active = data.get("last_active", time.time())
+        conversation.on_change = on_change
+        return conversation
+
+    def schedule_summary(self) -> bool:
+        """Queues a background summarization if enough messages piled up. Returns True if one was queued."""
+        if not config.CONVERSATION_SUMMARY_ENABLED:
+            return False
+        with self._lock:
+            if self._summary_pending or len(self._messages) <= config.MAX_UNSUMMARIZED_MESSAGES:
+                return False
+            self._summary_pending = True
+        _get_summary_executor().submit(self._summarize)
+        return True
+
+    def _summarize(self):
+        start = time.perf_counter()
+        try:
+            with self._lock:
+                generation = self._generation
+                previous_summary = self.summary
+                keep = max(0, config.CONVERSATION_SUMMARY_KEEP_RECENT)
+                to_fold = list(self._messages)[:len(self._messages) - keep]
+            if not to_fold:
+                return
+
+            transcript = "\n".join(f"{message['role'].upper()}: {message['content']}" for _, message in to_fold)
+            prompt = (
+                f"Update the running summary of a conversation between a user and an AI assistant.\n"
+                f"Keep every fact, name, number, decision and open question that later turns may refer to. "
+                f"Write at most {config.CONVERSATION_SUMMARY_MAX_WORDS} words of plain prose and output only the summary.\n\n"
+                f"Current summary:\n{previous_summary or '(none)'}\n\n"
+                f"New messages:\n{transcript}"
+            )
+            summary = get_ollama_completion(
+                [{"role": "user", "content": prompt}], model=config.CONVERSATION_SUMMARY_MODEL
+            )
+            summary = _THINK_BLOCK.sub("", summary).strip()
+            if not summary or summary.startswith("ERROR:"):
+                # Keep the messages; the next assistant turn will retry
+                CONVERSATION_SUMMARIES.inc(outcome="failed")
+                logger.warning(f"Conversation summarization failed: {summary[:200]}")
+                return
+
+            last_folded_seq = to_fold[-1][0]
+            with self._lock:
+                if generation != self._generation:
+                    CONVERSATION_SUMMARIES.inc(outcome="discarded") # History was cleared meanwhile
+                    return
+                self.summary = summary
+                while self._messages and self._messages[0][0] <= last_folded_seq:
+                    self._messages.popleft()
+            self._changed()
+            CONVERSATION_SUMMARIES.inc(outcome="completed")
+            CONVERSATION_SUMMARY_SECONDS.observe(time.perf_counter() - start)
+            logger.info(f"Folded {len(to_fold)} messages into the conversation summary ({len(summary)} chars) in {time.perf_counter() - start:.1f}s.")
+        except Exception as e:
+            CONVERSATION_SUMMARIES.inc(outcome="failed")
+            logger.error(f"Error summarizing conversation: {e}")
+            traceback.print_exc()
+        finally:
+            with self._lock:
+                self._summary_pending = False
+
+
+class ConversationStore:
+    """
+    Per-session conversations keyed by the conversation id the browser sends. Memory is
+    bounded: conversations idle for longer than idle_ttl_seconds are evicted, and beyond
+    max_sessions the least recently used ones go first. With a path, conversations are
+    also saved to SQLite so they survive eviction and restarts.
+    """
+    def __init__(self, max_sessions: int, idle_ttl_seconds: float, path: str = None):
+        self.max_sessions = max_sessions
+        self.idle_ttl_seconds = idle_ttl_seconds
+        self.path = path
+        self._conversations = OrderedDict() # conversation id -> Conversation, least recently used first
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._conn = None
+        if path:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS conversations (
+                    conversation_id TEXT PRIMARY KEY,
+                    data TEXT NOT NULL,
+                    updated_at REAL NOT NULL
+                )
+            """)
+            self._conn.commit()
+
+    def get(self, conversation_id: str) -> Conversation:
+        """Returns the conversation with this id, loading or creating it if necessary."""
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is not None:
+                self._conversations.move_to_end(conversation_id)
+                return conversation
+
+        conversation = self._load(conversation_id) or Conversation(conversation_id, on_change=self._save if self._conn else None)
+        with self._lock:
+            # Another request for the same id may have won the race while we were loading
+            conversation = self._conversations.setdefault(conversation_id, conversation)
+            self._conversations.move_to_end(conversation_id)
+            self._evict()
+        return conversation
+
+    def delete(self, conversation_id: str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+        if self._conn is not None:
+            with self._db_lock:
+                self._conn.execute("DELETE FROM conversations WHERE conversation_id = ?", (conversation_id,))
+                self._conn.commit()
+
+    def _evict(self):
+        # Called with _lock held. Evicted conversations stay on disk when persistence is on.
+        cutoff = time.time() - self.idle_ttl_seconds
+        for conversation_id in [cid for cid, conversation in self._conversations.items() if conversation.last_active < cutoff]:
+            del self._conversations[conversation_id]
+        while len(self._conversations) > self.max_sessions:
+            self._conversations.popitem(last=False)
+
+    def _load(self, conversation_id: str) -> Optional[Conversation]:
+        if self._conn is None:
+            return None
+        with self._db_lock:
+            row = self._conn.execute("SELECT data FROM conversations WHERE conversation_id = ?", (conversation_id,)).fetchone()
+        if row is None:
+            return None
+        try:
+            return Conversation.from_dict(conversation_id, json.loads(row[0]), on_change=self._save)
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable saved conversation '{conversation_id}': {e}")
+            return None
+
+    def _save(self, conversation: Conversation):
+        try:
+            data = json.dumps(conversation.to_dict())
+            with self._db_lock:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO conversations (conversation_id, data, updated_at) VALUES (?, ?, ?)",
+                    (conversation.conversation_id, data, time.time())
+                )
+                # Persisted conversations expire too, just much later than in-memory ones
+                self._conn.execute("DELETE FROM conversations WHERE updated_at < ?", (time.time() - config.CONVERSATION_PERSIST_TTL_SECONDS,))
+                self._conn.commit()
+        except Exception as e:
+            logger.error(f"Error saving conversation '{conversation.conversation_id}': {e}")
+            traceback.print_exc()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._conversations)
+
+
+def get_conversation_store() -> ConversationStore:
+    """Returns the shared conversation store configured in config.py."""
+    global _conversation_store
+    with _conversation_store_lock:
+        if _conversation_store is None:
+            _conversation_store = ConversationStore(
+                config.CONVERSATION_MAX_SESSIONS, config.CONVERSATION_IDLE_TTL_SECONDS,
+                config.CONVERSATION_STORE_PATH if config.CONVERSATION_PERSISTENCE_ENABLED else None
+            )
+    return _conversation_store
@@ -1,59 +1,30 @@
-import fitz
-from typing import List
-from langchain_text_splitters import RecursiveCharacterTextSplitter
-import config 
+from typing import Iterator, Tuple
+import config
 import os
+import time
 import traceback
 
-from docx import Document as DocxDocument # To avoid naming conflict with fitz.Document
-import openpyxl # For reading .xlsx files
+# The format libraries (fitz, python-docx, openpyxl) and the text splitter are slow to import,
+# so they are imported on first use; only ingestion needs them, not server startup.
 
 
-def load_pdf_text(pdf_path: str) -> str:
-    text = ""
-    try:
-        document = fitz.open(pdf_path)
+def iter_pdf_pages(pdf_path: str) -> Iterator[str]:
+    # Yields the text of one page at a time so only a single page is held in memory
+    import fitz
+    with fitz.open(pdf_path) as document:
         for page_num in range(document.page_count):
             page = document.load_page(page_num)
             # Directly extract text; no fallback to OCR
-            page_text = page.get_text()
-            text += page_text + "\n\n" # Add a separator between pages
-        document.close()
-    except Exception as e:
-        print(f"Error loading PDF text from {os.path.basename(pdf_path)}: {e}")
-        traceback.print_exc()
-        return ""
-    return text
-
-def load_text_file_content(file_path: str) -> str:
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            content = f.read()
-        return content
-    except Exception as e:
-        print(f"Error loading text file content from {os.path.basename(file_path)}: {e}")
-        traceback.print_exc()
-        return ""
-
-def load_docx_text(docx_path: str) -> str:
-    text = ""
-    try:
-        document = DocxDocument(docx_path)
-        for paragraph in document.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        print(f"Error loading DOCX text from {os.path.basename(docx_path)}: {e}")
-        traceback.print_exc()
-        return ""
+            yield page.get_text()
 
-def load_xlsx_text(xlsx_path: str) -> str:
-    text = ""
+def iter_xlsx_sheets(xlsx_path: str) -> Iterator[str]:
+    # Yields the text of one sheet at a time
+    import openpyxl # For reading .xlsx files
+    workbook = openpyxl.load_workbook(xlsx_path, read_only=True)
     try:
-        workbook = openpyxl.load_workbook(xlsx_path)
         for sheet_name in workbook.sheetnames:
             sheet = workbook[sheet_name]
-            text += f"--- Sheet: {sheet_name} ---\n" # Header for each sheet
+            lines = [f"--- Sheet: {sheet_name} ---\n"] # Header for each sheet
             for row in sheet.iter_rows():
                 row_values = []
                 for cell in row:
@@ -61,24 +32,158 @@ def load_xlsx_text(xlsx_path: str) -> str:
                         # Convert all cell values to string
                         row_values.append(str(cell.value).strip())
                 if row_values:
-                    text += "\t".join(row_values) + "\n" # Use tab for column separation
-            text += "\n" # Add a newline between sheets
-        return text
-    except Exception as e:
-        print(f"Error loading XLSX text from {os.path.basename(xlsx_path)}: {e}")
-        traceback.print_exc()
-        return ""
+                    lines.append("\t".join(row_values) + "\n") # Use tab for column separation
+            lines.append("\n") # Add a newline between sheets
+            yield "".join(lines)
+    finally:
+        workbook.close()
 
-def split_text_into_chunks(text: str) -> List[str]:
-    if not text.strip(): # Check for empty or whitespace-only text
-        return []
-
-    text_splitter = RecursiveCharacterTextSplitter(
+def _get_text_splitter(add_start_index: bool = False):
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    return RecursiveCharacterTextSplitter(
         # Use values from config.py
         chunk_size=config.TEXT_CHUNK_SIZE,
         chunk_overlap=config.TEXT_CHUNK_OVERLAP,
         length_function=len,
         is_separator_regex=False, # Use standard separators
+        add_start_index=add_start_index,
     )
-    chunks = text_splitter.split_text(text)
-    return chunks
\ No newline at end of file
+
+
+# File extensions we know how to extract text from
+SUPPORTED_EXTENSIONS = ('.pdf', '.txt', '.md', '.docx', '.xlsx')
+
+def is_supported_file(file_path: str) -> bool:
+    return os.path.splitext(file_path)[1].lower() in SUPPORTED_EXTENSIONS
+
+def count_document_pages(file_path: str) -> int:
+    # PDFs report their real page count, XLSX files count sheets; every other format is a single page
+    file_extension = os.path.splitext(file_path)[1].lower()
+    try:
+        if file_extension == '.pdf':
+            import fitz
+            with fitz.open(file_path) as document:
+                return document.page_count
+        elif file_extension == '.xlsx':
+            import openpyxl
+            workbook = openpyxl.load_workbook(file_path, read_only=True)
+            try:
+                return len(workbook.sheetnames)
+            finally:
+                workbook.close()
+        return 1
+    except Exception as e:
+        print(f"Error counting pages in {os.path.basename(file_path)}: {e}")
+        return 0
+
+def iter_document_pages(file_path: str) -> Iterator[str]:
+    """
+    Yields a document's text page by page (PDF pages, XLSX sheets). Formats without
+    pages are yielded as a single page. Errors are raised rather than swallowed.
+    """
+    file_extension = os.path.splitext(file_path)[1].lower()
+    if file_extension == '.pdf':
+        for page_text in iter_pdf_pages(file_path):
+            yield page_text + "\n\n" # Add a separator between pages
+    elif file_extension == '.xlsx':
+        yield from iter_xlsx_sheets(file_path)
+    elif file_extension == '.txt' or file_extension == '.md':
+        with open(file_path, 'r', encoding='utf-8') as f:
+            yield f.read()
+    elif file_extension == '.docx':
+        from docx import Document as DocxDocument
+        document = DocxDocument(file_path)
+        yield "".join(paragraph.text + "\n" for paragraph in document.paragraphs)
+    else:
+        raise ValueError(f"Unsupported file type: {file_extension}")
+
+def _timed_iter(iterator: Iterator, stage_seconds: dict, stage: str) -> Iterator:
+    # Re-yields items from iterator, adding the time spent producing them to stage_seconds[stage]
+    while True:
+        start = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            stage_seconds[stage] = stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+        yield item
+
+def iter_document_chunks(file_path: str, stage_seconds: dict = None) -> Iterator[Tuple[str, int]]:
+    """
+    Splits a document incrementally, yielding (chunk, page_number) pairs with 1-based
+    page numbers. Only the current page plus the unfinished tail of the previous one
+    is held in memory, and chunk overlap is carried across page boundaries.
+    Time spent extracting and splitting is added to stage_seconds['extract'] / ['split'] if given.
+    """
+    stage_seconds = {} if stage_seconds is None else stage_seconds
+    text_splitter = _get_text_splitter(add_start_index=True)
+    buffer = ""
+    page_starts = [] # (offset in buffer, page number) for every page that overlaps the buffer
+
+    def split(text: str):
+        start = time.perf_counter()
+        documents = text_splitter.create_documents([text])
+        stage_seconds["split"] = stage_seconds.get("split", 0.0) + time.perf_counter() - start
+        return documents
+
+    def page_at(offset: int) -> int:
+        page_number = page_starts[0][1]
+        for start, number in page_starts:
+            if start > offset:
+                break
+            page_number = number
+        return page_number
+
+    pages = _timed_iter(iter_document_pages(file_path), stage_seconds, "extract")
+    for page_number, page_text in enumerate(pages, start=1):
+        page_starts.append((len(buffer), page_number))
+        buffer += page_text
+        if not buffer.strip():
+            continue
+
+        documents = split(buffer)
+        # The last chunk may continue on the next page, so it is re-split together with it
+        for document in documents[:-1]:
+            yield document.page_content, page_at(document.metadata["start_index"])
+
+        if documents:
+            tail_start = max(documents[-1].metadata["start_index"], 0)
+            buffer = buffer[tail_start:]
+            page_starts = [(0, page_at(tail_start))] + [
+                (start - tail_start, number) for start, number in page_starts if start > tail_start
+            ]
+
+    if buffer.strip():
+        for document in split(buffer):
+            yield document.page_content, page_at(document.metadata["start_index"])
+
+def stream_document_chunks(file_path: str, out_queue, batch_size: int):
+    """
+    Runs inside an ingestion worker process. Streams a document's chunks to out_queue in
+    batches so neither process ever holds the whole document. Messages are tuples:
+      ("pages", pages_total)
+      ("chunks", pages_done, [(chunk, page_number, chunk_index), ...])
+      ("done", pages_done, chunks_total, stage_seconds)
+      ("error", message)
+    stage_seconds holds the time spent in the 'extract' and 'split' stages.
+    A bounded out_queue gives backpressure: extraction pauses while the embedder catches up.
+    """
+    try:
+        out_queue.put(("pages", count_document_pages(file_path)))
+        batch = []
+        chunk_index = 0
+        page_number = 0
+        stage_seconds = {}
+        for chunk, page_number in iter_document_chunks(file_path, stage_seconds):
+            batch.append((chunk, page_number, chunk_index))
+            chunk_index += 1
+            if len(batch) >= batch_size:
+                out_queue.put(("chunks", page_number, batch))
+                batch = []
+        if batch:
+            out_queue.put(("chunks", page_number, batch))
+        out_queue.put(("done", page_number, chunk_index, stage_seconds))
+    except Exception as e:
+        traceback.print_exc()
+        out_queue.put(("error", f"Error extracting text from {os.path.basename(file_path)}: {e}"))
@@ -0,0 +1,112 @@
+import os
+import time
+import sqlite3
+import threading
+import logging
+from typing import List, Optional, Tuple
+from knowledge_bases import normalize_knowledge_base_name, document_registry_path
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+# Registry per knowledge base name, each opened on first use
+_registries = {}
+_registry_lock = threading.Lock()
+
+
+class DocumentRegistry:
+    """
+    Persistent per-document index of the knowledge base: one row per source file with
+    its content hash, chunk count, byte size and ingest time. Listing documents reads
+    this table instead of scanning chunk metadata in ChromaDB.
+    It also holds the knowledge-base version counter, bumped on every write to the
+    vector store, which query caches use to know when their entries are stale.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                source TEXT PRIMARY KEY,
+                file_hash TEXT,
+                chunk_count INTEGER NOT NULL DEFAULT 0,
+                byte_size INTEGER,
+                ingested_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self._conn.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('kb_version', 0)")
+        self._conn.commit()
+
+    def get_document(self, source: str) -> Optional[dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone()
+        return dict(row) if row else None
+
+    def get_file_hash(self, source: str) -> Optional[str]:
+        document = self.get_document(source)
+        return document["file_hash"] if document else None
+
+    def record_document(self, source: str, file_hash: Optional[str], chunk_count: int, byte_size: Optional[int], ingested_at: float = None):
+        """Inserts or replaces the registry row of a fully ingested document."""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (source, file_hash, chunk_count, byte_size, ingested_at) VALUES (?, ?, ?, ?, ?)",
+                (source, file_hash, chunk_count, byte_size, ingested_at or time.time())
+            )
+            self._conn.commit()
+
+    def remove_document(self, source: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents WHERE source = ?", (source,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM documents")
+            self._conn.commit()
+
+    def get_kb_version(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'kb_version'").fetchone()[0]
+
+    def bump_kb_version(self) -> int:
+        """
+        Marks the knowledge base as changed. Only writes made through this process's vector store
+        are seen by its caches: the server's vector store doesn't pick up another process's writes,
+        so bulk ingestion and snapshot imports must run while the server is stopped.
+        """
+        with self._lock:
+            self._conn.execute("UPDATE meta SET value = value + 1 WHERE key = 'kb_version'")
+            self._conn.commit()
+            return self._conn.execute("SELECT value FROM meta WHERE key = 'kb_version'").fetchone()[0]
+
+    def count_documents(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+
+    def list_documents(self, offset: int = 0, limit: int = 100) -> Tuple[List[dict], int]:
+        """Returns one page of documents ordered by name, plus the total number of documents."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM documents ORDER BY source LIMIT ? OFFSET ?", (limit, offset)
+            ).fetchall()
+            total = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return [dict(row) for row in rows], total
+
+
+def get_document_registry(knowledge_base: str = None) -> DocumentRegistry:
+    """Returns the shared document registry of a knowledge base (the default one if not given)."""
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    with _registry_lock:
+        registry = _registries.get(knowledge_base)
+        if registry is None:
+            path = document_registry_path(knowledge_base)
+            logger.info(f"Opening document registry of knowledge base '{knowledge_base}' at '{path}'...")
+            registry = _registries[knowledge_base] = DocumentRegistry(path)
+    return registry
@@ -0,0 +1,101 @@
+import time
+import threading
+import logging
+import traceback
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, List
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+EMBEDDING_BATCH_SIZE = REGISTRY.histogram(
+    "localrag_embedding_coalesced_batch_size", "Number of single-text embedding calls merged into one Ollama request.",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_COALESCE_WAIT_SECONDS = REGISTRY.histogram(
+    "localrag_embedding_coalesce_wait_seconds", "Time a single-text embedding call waited before its batch was sent.",
+    buckets=(0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0)
+)
+
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding calls. Calls arriving within max_wait_seconds
+    of the first waiting one (or until max_batch_size is reached) are sent to Ollama as one
+    batched request, and each caller gets its own embedding back. While max_in_flight
+    batches are already running, new calls keep accumulating into the next batch.
+    A lone call with no batch in flight is sent right away, so there is no added latency without concurrency.
+    """
+    def __init__(self, embed_many: Callable[[List[str]], List[List[float]]], max_wait_seconds: float,
+                 max_batch_size: int, max_in_flight: int = 1):
+        self.embed_many = embed_many
+        self.max_wait_seconds = max_wait_seconds
+        self.max_batch_size = max_batch_size
+        self._pending = [] # (text, future, enqueued_at)
+        self._running = 0 # Batches submitted and not finished yet; guarded by _condition
+        self._condition = threading.Condition()
+        self._in_flight = threading.BoundedSemaphore(max_in_flight)
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="embed-batch")
+        self._dispatcher = threading.Thread(target=self._dispatch_loop, name="embed-coalescer", daemon=True)
+        self._dispatcher.start()
+
+    def embed(self, text: str) -> List[float]:
+        """Returns the embedding of text, possibly computed together with other concurrent calls."""
+        future = Future()
+        with self._condition:
+            self._pending.append((text, future, time.perf_counter()))
+            self._condition.notify()
+        return future.result()
+
+    def _dispatch_loop(self):
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending)
+                # Give concurrent callers a short window to join this batch, unless nothing else is going on
+                concurrent = self._running > 0 or len(self._pending) > 1
+                deadline = self._pending[0][2] + self.max_wait_seconds
+                while concurrent and len(self._pending) < self.max_batch_size:
+                    remaining = deadline - time.perf_counter()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+            # Wait for a free in-flight slot outside the lock, so more calls can pile up meanwhile
+            self._in_flight.acquire()
+            with self._condition:
+                batch = self._pending[:self.max_batch_size]
+                del self._pending[:self.max_batch_size]
+                self._running += 1
+            self._executor.submit(self._run_batch, batch)
+
+    def _run_batch(self, batch):
+        try:
+            dispatched_at = time.perf_counter()
+            for _, _, enqueued_at in batch:
+                EMBEDDING_COALESCE_WAIT_SECONDS.observe(dispatched_at - enqueued_at)
+            EMBEDDING_BATCH_SIZE.observe(len(batch))
+
+            # Identical texts in the same batch are embedded once
+            distinct_texts = list(dict.fromkeys(text for text, _, _ in batch))
+            try:
+                embeddings = dict(zip(distinct_texts, self.embed_many(distinct_texts)))
+            except Exception as e:
+                logger.error(f"Coalesced embedding request for {len(distinct_texts)} texts failed: {e}")
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                return
+            for text, future, _ in batch:
+                future.set_result(embeddings[text])
+            if len(batch) > 1:
+                logger.debug(f"Coalesced {len(batch)} embedding calls into one request.")
+        except Exception as e:
+            logger.error(f"Error dispatching coalesced embedding batch: {e}")
+            traceback.print_exc()
+            for _, future, _ in batch:
+                if not future.done():
+                    future.set_exception(e)
+        finally:
+            with self._condition:
+                self._running -= 1
+            self._in_flight.release()
@@ -0,0 +1,167 @@
+import sqlite3
+import hashlib
+import threading
+import time
+import os
+import logging
+from array import array
+from typing import List, Optional
+import config
+from metrics import REGISTRY
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+EMBEDDING_CACHE_LOOKUPS = REGISTRY.counter("localrag_embedding_cache_lookups_total", "Embedding cache lookups by result (hit or miss).")
+EMBEDDING_CACHE_EVICTIONS = REGISTRY.counter("localrag_embedding_cache_evictions_total", "Embeddings evicted from the cache to stay under its size limit.")
+EMBEDDING_CACHE_ENTRIES = REGISTRY.gauge("localrag_embedding_cache_entries", "Number of embeddings currently in the cache.")
+
+# Global cache instance, opened on first use
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def hash_text(text: str) -> str:
+    """Returns the content hash used as the cache key for a chunk of text."""
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    On-disk, content-addressed embedding cache keyed by (embedding model, text hash).
+    Entries are evicted least-recently-used first once max_entries is exceeded.
+    """
+    def __init__(self, path: str, max_entries: int):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                embedding BLOB NOT NULL,
+                last_used REAL NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used)")
+        self._conn.commit()
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        EMBEDDING_CACHE_ENTRIES.set(self._size)
+
+    def get_many(self, model: str, texts: List[str]) -> List[Optional[List[float]]]:
+        """Looks up embeddings for texts; missing entries are returned as None."""
+        hashes = [hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for i in range(0, len(hashes), 500):
+                chunk = list(set(hashes[i:i + 500]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, embedding FROM embeddings WHERE model = ? AND text_hash IN ({placeholders})",
+                    [model] + chunk
+                ).fetchall()
+                for text_hash, blob in rows:
+                    found[text_hash] = blob
+
+            if found:
+                # Touch the entries we served so eviction stays least-recently-used
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE model = ? AND text_hash = ?",
+                    [(now, model, text_hash) for text_hash in found]
+                )
+                self._conn.commit()
+
+            # Counted under the lock: concurrent lookups would otherwise lose increments
+            hits = sum(1 for text_hash in hashes if text_hash in found)
+            self.hits += hits
+            self.misses += len(hashes) - hits
+        EMBEDDING_CACHE_LOOKUPS.inc(hits, result="hit")
+        EMBEDDING_CACHE_LOOKUPS.inc(len(hashes) - hits, result="miss")
+
+        results = []
+        for text_hash in hashes:
+            blob = found.get(text_hash)
+            if blob is None:
+                results.append(None)
+            else:
+                vector = array('f')
+                vector.frombytes(blob)
+                results.append(vector.tolist())
+        return results
+
+    def put_many(self, model: str, texts: List[str], embeddings: List[List[float]]):
+        """Stores embeddings for texts, evicting old entries if the cache is full."""
+        now = time.time()
+        rows = [
+            (model, hash_text(text), array('f', embedding).tobytes(), now)
+            for text, embedding in zip(texts, embeddings)
+        ]
+        with self._lock:
+            cursor = self._conn.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, text_hash, embedding, last_used) VALUES (?, ?, ?, ?)",
+                rows
+            )
+            self._size += max(cursor.rowcount, 0)
+            if self._size > self.max_entries:
+                self._evict()
+            self._conn.commit()
+            EMBEDDING_CACHE_ENTRIES.set(self._size)
+
+    def _evict(self):
+        # Trim to 90% of the limit so we don't evict again on the very next insert
+        target = int(self.max_entries * 0.9)
+        excess = self._size - target
+        self._conn.execute(
+            "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+            (excess,)
+        )
+        self._size = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        self.evictions += excess
+        EMBEDDING_CACHE_EVICTIONS.inc(excess)
+        logger.info(f"Embedding cache evicted {excess} least recently used entries ({self._size} remaining).")
+
+    def clear(self):
+        """Removes every cached embedding."""
+        with self._lock:
+            self._conn.execute("DELETE FROM embeddings")
+            self._conn.commit()
+            self._size = 0
+            EMBEDDING_CACHE_ENTRIES.set(0)
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the current number of entries."""
+        with self._lock:
+            hits, misses, evictions, size = self.hits, self.misses, self.evictions, self._size
+        lookups = hits + misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "hits": hits,
+            "misses": misses,
+            "evictions": evictions,
+            "hit_rate": (hits / lookups) if lookups else 0.0,
+        }
+
+
+def get_embedding_cache() -> Optional[EmbeddingCache]:
+    """Returns the shared embedding cache, or None if caching is disabled."""
+    global _cache
+    if not config.EMBEDDING_CACHE_ENABLED:
+        return None
+    with _cache_lock:
+        if _cache is None:
+            logger.info(f"Opening embedding cache at '{config.EMBEDDING_CACHE_PATH}'...")
+            _cache = EmbeddingCache(config.EMBEDDING_CACHE_PATH, config.EMBEDDING_CACHE_MAX_ENTRIES)
+            logger.info(f"Embedding cache ready with {_cache.stats()['entries']} entries.")
+    return _cache
@@ -0,0 +1,124 @@
+import time
+import uuid
+import threading
+import logging
+from typing import Optional
+import config
+from ingestion_pipeline import IngestionPipeline, DocumentTask
+from knowledge_bases import normalize_knowledge_base_name
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+# Job states reported by /jobs/<id>
+JOB_QUEUED = "queued"
+JOB_EXTRACTING = "extracting"
+JOB_EMBEDDING = "embedding"
+JOB_COMPLETED = "completed"
+JOB_FAILED = "failed"
+
+_FINISHED_STATES = (JOB_COMPLETED, JOB_FAILED)
+
+# Job records keyed by job id, oldest first
+_jobs = {}
+_jobs_lock = threading.Lock()
+
+# Uploads flow through one shared pipeline: worker processes extract and split, while
+# embedding and ChromaDB writes stay in this process because the ChromaDB client must
+# not be shared across processes. Extraction of the next upload overlaps with embedding
+# and writing of the previous one.
+_pipeline = None
+_pipeline_lock = threading.Lock()
+
+
+def get_ingestion_pipeline() -> IngestionPipeline:
+    """Returns the shared ingestion pipeline used for uploads, starting it on first use."""
+    global _pipeline
+    with _pipeline_lock:
+        if _pipeline is None:
+            _pipeline = IngestionPipeline(config.MAX_PROCESS_WORKERS, config.INGESTION_WRITE_BATCH_SIZE)
+            _pipeline.start()
+    return _pipeline
+
+
+def _update_job(job_id: str, **fields):
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        if job is not None:
+            job.update(fields)
+
+def _prune_finished_jobs():
+    # Called with _jobs_lock held; drops the oldest finished jobs beyond the history limit
+    finished = [job_id for job_id, job in _jobs.items() if job["status"] in _FINISHED_STATES]
+    for job_id in finished[:max(0, len(finished) - config.INGESTION_JOB_HISTORY_LIMIT)]:
+        del _jobs[job_id]
+
+
+def submit_ingestion_job(file_path: str, source_filename: str, knowledge_base: str = None) -> str:
+    """Queues a saved file for background ingestion into a knowledge base (the default one if not given) and returns its job id."""
+    job_id = uuid.uuid4().hex
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    with _jobs_lock:
+        _prune_finished_jobs()
+        _jobs[job_id] = {
+            "job_id": job_id,
+            "filename": source_filename,
+            "knowledge_base": knowledge_base,
+            "status": JOB_QUEUED,
+            "pages_total": None,
+            "pages_done": 0,
+            "chunks_total": None,
+            "chunks_done": 0,
+            "chunks_added": 0,
+            "chunks_removed": 0,
+            "message": f"Document '{source_filename}' queued for processing.",
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+    task = DocumentTask(file_path, source_filename, job_id, on_progress=_on_task_progress, on_finish=_on_task_finish,
+                        knowledge_base=knowledge_base)
+    get_ingestion_pipeline().submit(task)
+    logger.info(f"Queued ingestion job {job_id} for '{source_filename}' (knowledge base '{knowledge_base}').")
+    return job_id
+
+def get_job(job_id: str) -> Optional[dict]:
+    """Returns a snapshot of a job's status, or None if the job id is unknown."""
+    with _jobs_lock:
+        job = _jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+
+def get_pipeline_stats() -> dict:
+    """Per-stage utilization and queue depth of the upload pipeline (empty until the first upload)."""
+    with _pipeline_lock:
+        return _pipeline.stats() if _pipeline is not None else {}
+
+
+def _on_task_progress(task: DocumentTask, status: str = None, **fields):
+    if status == "extracting":
+        fields.update(status=JOB_EXTRACTING, started_at=time.time())
+    elif status == "embedding":
+        fields["status"] = JOB_EMBEDDING
+    _update_job(task.job_id, **fields)
+
+def _on_task_finish(task: DocumentTask):
+    source_filename = task.source_filename
+    if task.outcome == "unchanged":
+        message = f"Document '{source_filename}' is unchanged since it was last added; skipped."
+    elif task.outcome == "empty":
+        message = f"Document '{source_filename}' uploaded, but no text could be extracted. It might be an image-based PDF or empty."
+    elif task.outcome == "completed":
+        added = len(task.added_ids)
+        message = (f"Document '{source_filename}' processed and added to knowledge base '{task.knowledge_base}' "
+                   f"({added} new, {task.chunks_done - added} unchanged, {task.chunks_removed} removed chunks).")
+    else:
+        message = f"Failed to process document '{source_filename}': {task.error}"
+
+    if task.outcome == "failed":
+        _update_job(task.job_id, status=JOB_FAILED, finished_at=time.time(), error=task.error, message=message)
+        logger.error(f"Job {task.job_id}: {message}")
+    else:
+        _update_job(task.job_id, status=JOB_COMPLETED, finished_at=time.time(), chunks_removed=task.chunks_removed, message=message)
+        logger.info(f"Job {task.job_id}: {message}")
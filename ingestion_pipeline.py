@@ -0,0 +1,479 @@
+import os
+import time
+import queue
+import threading
+import multiprocessing
+import traceback
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Iterable, List
+import config
+import utils
+from document_processor import stream_document_chunks
+from vector_db_manager import (
+    ollama_ef, make_chunk_ids, get_chunk_ids_by_source, add_chunks_to_chroma,
+    update_chunk_metadatas, delete_chunks_from_chroma
+)
+from document_registry import get_document_registry
+from knowledge_bases import normalize_knowledge_base_name, done_directory
+from metrics import (
+    INGEST_STAGE_SECONDS, INGEST_DOCUMENTS, INGEST_CHUNKS, INGEST_CHUNKS_PER_SECOND,
+    INGEST_PIPELINE_BUSY_SECONDS, INGEST_PIPELINE_BLOCKED_SECONDS, INGEST_PIPELINE_ITEMS
+)
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+# Sentinel telling a stage worker thread to exit
+_STOP = object()
+
+# One lock per (knowledge base, source filename) so two ingests of the same file never interleave
+_source_locks = {}
+_source_locks_lock = threading.Lock()
+
+
+def _get_source_lock(knowledge_base: str, source_filename: str) -> threading.Lock:
+    with _source_locks_lock:
+        return _source_locks.setdefault((knowledge_base, source_filename), threading.Lock())
+
+
+class PipelineStage:
+    """
+    A pool of worker threads reading items from a bounded input queue. The handler turns
+    one input item into zero or more output items, which are put on the next stage's
+    queue; a full downstream queue blocks the worker (backpressure). Time spent working
+    and time spent blocked on the next stage are tracked separately for utilization stats.
+    If the handler raises, on_error(item, error) may return outputs to pass on instead, so
+    the item's document still reaches the end of the pipeline.
+    """
+    def __init__(self, name: str, handler: Callable[[Any], Iterable[Any]], workers: int, queue_size: int = 0,
+                 on_error: Callable[[Any, Exception], Iterable[Any]] = None):
+        self.name = name
+        self.handler = handler
+        self.on_error = on_error
+        self.workers = max(1, workers)
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.next_stage = None
+        self._threads = []
+        self._stats_lock = threading.Lock()
+        self._busy_seconds = 0.0
+        self._blocked_seconds = 0.0
+        self._items = 0
+        self._started_at = None
+
+    def start(self):
+        self._started_at = time.perf_counter()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._work, name=f"ingest-{self.name}-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def put(self, item):
+        self.queue.put(item)
+
+    def is_alive(self) -> bool:
+        return bool(self._threads) and all(thread.is_alive() for thread in self._threads)
+
+    def stop(self):
+        for _ in self._threads:
+            self.queue.put(_STOP)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def _work(self):
+        while True:
+            item = self.queue.get()
+            if item is _STOP:
+                return
+            busy, blocked = 0.0, 0.0
+            last = time.perf_counter()
+            try:
+                for output in self.handler(item):
+                    now = time.perf_counter()
+                    busy += now - last
+                    if self.next_stage is not None:
+                        self.next_stage.put(output)
+                    last = time.perf_counter()
+                    blocked += last - now
+            except Exception as e:
+                # Handlers deal with their own failures; this only catches bugs so the worker survives
+                logger.error(f"Unexpected error in ingestion stage '{self.name}': {e}")
+                traceback.print_exc()
+                if self.on_error is not None:
+                    try:
+                        for output in self.on_error(item, e):
+                            if self.next_stage is not None:
+                                self.next_stage.put(output)
+                    except Exception as recovery_error:
+                        logger.error(f"Failed to recover from the error in ingestion stage '{self.name}': {recovery_error}")
+            busy += time.perf_counter() - last
+            with self._stats_lock:
+                self._busy_seconds += busy
+                self._blocked_seconds += blocked
+                self._items += 1
+            INGEST_PIPELINE_BUSY_SECONDS.inc(busy, stage=self.name)
+            INGEST_PIPELINE_BLOCKED_SECONDS.inc(blocked, stage=self.name)
+            INGEST_PIPELINE_ITEMS.inc(stage=self.name)
+
+    def stats(self) -> dict:
+        """Utilization is the share of worker time spent working since the stage started."""
+        with self._stats_lock:
+            busy, blocked, items = self._busy_seconds, self._blocked_seconds, self._items
+        capacity = max((time.perf_counter() - self._started_at) * self.workers, 1e-9) if self._started_at else 1e-9
+        return {
+            "workers": self.workers,
+            "items": items,
+            "queued": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "busy_seconds": round(busy, 3),
+            "blocked_seconds": round(blocked, 3),
+            "utilization": round(min(1.0, busy / capacity), 3),
+        }
+
+
+class DocumentTask:
+    """
+    One document travelling through the pipeline. Its chunk batches may be embedded
+    out of order by parallel workers, so the task counts batches emitted by extraction
+    and batches finished by the writer, and is finalized once both agree.
+    """
+    def __init__(self, file_path: str, source_filename: str, job_id: str = None,
+                 on_progress: Callable[..., None] = None, on_finish: Callable[["DocumentTask"], None] = None,
+                 knowledge_base: str = None):
+        self.file_path = file_path
+        self.job_id = job_id
+        self.source_filename = source_filename
+        self.knowledge_base = normalize_knowledge_base_name(knowledge_base)
+        self.on_progress = on_progress
+        self.on_finish = on_finish
+        self.file_hash = None
+        self.existing_ids = set()
+        self.seen_ids = set()
+        self.added_ids = []
+        self.occurrences = {}
+        self.stage_seconds = {} # extract/split come from the worker process, embed/write are measured by the stages
+        self.pages_total = None
+        self.chunks_done = 0
+        self.chunks_removed = 0
+        self.batches_emitted = 0
+        self.batches_finished = 0
+        self.extraction_done = False
+        self.error = None
+        self.outcome = None # "completed", "unchanged", "empty" or "failed" once finished
+        self.started_at = None
+        self.lock = threading.Lock()
+        self._source_lock = None
+
+    def progress(self, **fields):
+        if self.on_progress is not None:
+            self.on_progress(self, **fields)
+
+    def fail(self, error: Exception):
+        with self.lock:
+            if self.error is None:
+                self.error = str(error)
+
+    def add_stage_time(self, stage: str, seconds: float):
+        with self.lock:
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + seconds
+
+
+class ChunkBatch:
+    """A batch of a document's chunks; embeddings are filled in by the embed stage for chunks not stored yet."""
+    def __init__(self, task: DocumentTask, chunks: List[str], metadatas: List[Dict[str, Any]], ids: List[str]):
+        self.task = task
+        self.chunks = chunks
+        self.metadatas = metadatas
+        self.ids = ids
+        self.new_indices = [i for i, chunk_id in enumerate(ids) if chunk_id not in task.existing_ids]
+        self.embeddings = None
+
+
+class DocumentEnd:
+    """Marks the end of a document's batches (sent after extraction finished or failed)."""
+    def __init__(self, task: DocumentTask):
+        self.task = task
+
+
+class IngestionPipeline:
+    """
+    Staged ingestion: extract (worker processes extract and split, streaming chunk
+    batches back) -> embed (Ollama) -> write (ChromaDB, single writer). Bounded queues
+    between the stages let extraction of the next document overlap with embedding and
+    writing of the previous one, while stopping any stage from running far ahead.
+    """
+    def __init__(self, extract_workers: int, batch_size: int, embed_workers: int = None,
+                 queue_size: int = None, move_files: bool = True, delete_failed_files: bool = True):
+        self.batch_size = max(1, batch_size)
+        self.move_files = move_files # Move ingested (and unchanged) files to their knowledge base's done-documents directory
+        self.delete_failed_files = delete_failed_files # Delete files that failed or had no text (e.g. temporary uploads)
+        self.extract_workers = max(1, extract_workers)
+        queue_size = config.INGESTION_PIPELINE_QUEUE_SIZE if queue_size is None else queue_size
+        self.extract_stage = PipelineStage("extract", self._extract, self.extract_workers, # Unbounded: it is the job queue
+                                           on_error=self._recover_extract)
+        self.embed_stage = PipelineStage("embed", self._embed, embed_workers or config.INGESTION_EMBED_WORKERS, queue_size,
+                                         on_error=self._recover_embed)
+        self.write_stage = PipelineStage("write", self._write, 1, queue_size) # ChromaDB writes are serialized anyway
+        self.extract_stage.next_stage = self.embed_stage
+        self.embed_stage.next_stage = self.write_stage
+        self.stages = [self.extract_stage, self.embed_stage, self.write_stage]
+        self._process_pool = None
+        self._manager = None
+        self._pools_lock = threading.Lock()
+        self._started = False
+
+    def start(self):
+        with self._pools_lock:
+            if self._started:
+                return
+            self._started = True
+        for stage in self.stages:
+            stage.start()
+        logger.info(f"Ingestion pipeline started: " + ", ".join(f"{stage.name} x{stage.workers}" for stage in self.stages))
+
+    def submit(self, task: DocumentTask):
+        """Queues a document; returns immediately (extraction workers pick it up in order)."""
+        self.start()
+        self.extract_stage.put(task)
+
+    def shutdown(self):
+        """Stops the stages in order once everything queued has been processed."""
+        for stage in self.stages:
+            stage.stop()
+        with self._pools_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown()
+                self._process_pool = None
+            if self._manager is not None:
+                self._manager.shutdown()
+                self._manager = None
+            self._started = False
+
+    def stats(self) -> Dict[str, dict]:
+        return {stage.name: stage.stats() for stage in self.stages}
+
+    def is_alive(self) -> bool:
+        """False once any stage lost a worker thread; documents waiting on that stage would never finish."""
+        return all(stage.is_alive() for stage in self.stages)
+
+    # --- Worker processes ---
+    def _get_process_pool(self) -> ProcessPoolExecutor:
+        with self._pools_lock:
+            if self._process_pool is None:
+                logger.info(f"Starting ingestion process pool with {self.extract_workers} workers.")
+                self._process_pool = ProcessPoolExecutor(max_workers=self.extract_workers)
+            return self._process_pool
+
+    def _get_manager(self):
+        with self._pools_lock:
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager
+
+    def _reset_process_pool(self):
+        # A worker died (e.g. out of memory on a huge file); start over with a fresh pool
+        with self._pools_lock:
+            if self._process_pool is not None:
+                self._process_pool.shutdown(wait=False)
+                self._process_pool = None
+
+    def _iter_worker_messages(self, chunk_queue, future):
+        # Yields messages from a worker until it reports "done" or "error"
+        while True:
+            try:
+                message = chunk_queue.get(timeout=1)
+            except queue.Empty:
+                if not future.done():
+                    continue
+                if isinstance(future.exception(), BrokenProcessPool):
+                    self._reset_process_pool()
+                    raise RuntimeError("The ingestion worker process crashed while extracting this document.")
+                if future.exception() is not None:
+                    raise future.exception()
+                if chunk_queue.empty():
+                    raise RuntimeError("The ingestion worker process stopped without finishing the document.")
+                continue
+            yield message
+            if message[0] in ("done", "error"):
+                return
+
+    @staticmethod
+    def _drain_worker(chunk_queue, future):
+        # Unblocks a worker stuck on a full queue after the document gave up, so it can exit
+        future.cancel()
+        while not future.done():
+            try:
+                chunk_queue.get(timeout=0.1)
+            except queue.Empty:
+                pass
+
+    # --- Stages ---
+    def _extract(self, task: DocumentTask):
+        chunk_queue = None
+        future = None
+        try:
+            source_lock = _get_source_lock(task.knowledge_base, task.source_filename)
+            source_lock.acquire()
+            task._source_lock = source_lock # Released when the document is finalized by the write stage
+            task.started_at = time.perf_counter()
+            task.progress(status="extracting", message=f"Extracting text from '{task.source_filename}'...")
+            task.file_hash = utils.hash_file(task.file_path)
+            if get_document_registry(task.knowledge_base).get_file_hash(task.source_filename) == task.file_hash:
+                # Same content as the last ingest: nothing to extract, embed or write
+                task.outcome = "unchanged"
+            else:
+                task.existing_ids = get_chunk_ids_by_source(task.source_filename, task.knowledge_base)
+                chunk_queue = self._get_manager().Queue(maxsize=config.INGESTION_QUEUE_MAX_BATCHES)
+                try:
+                    future = self._get_process_pool().submit(stream_document_chunks, task.file_path, chunk_queue, self.batch_size)
+                except BrokenProcessPool:
+                    self._reset_process_pool()
+                    raise RuntimeError("The ingestion worker pool is unavailable; please retry the upload.")
+
+                for message in self._iter_worker_messages(chunk_queue, future):
+                    kind = message[0]
+                    if kind == "pages":
+                        task.pages_total = message[1]
+                        task.progress(pages_total=message[1])
+                    elif kind == "chunks":
+                        _, pages_done, batch = message
+                        chunks = [chunk for chunk, _, _ in batch]
+                        metadatas = [
+                            {"source": task.source_filename, "page": page_number, "chunk_index": chunk_index}
+                            for _, page_number, chunk_index in batch
+                        ]
+                        ids = make_chunk_ids(chunks, task.source_filename, task.occurrences)
+                        task.seen_ids.update(ids)
+                        with task.lock:
+                            task.batches_emitted += 1
+                        task.progress(pages_done=pages_done)
+                        yield ChunkBatch(task, chunks, metadatas, ids)
+                    elif kind == "done":
+                        task.progress(pages_done=message[1], chunks_total=message[2])
+                        for stage, seconds in message[3].items():
+                            task.add_stage_time(stage, seconds)
+                    elif kind == "error":
+                        raise RuntimeError(message[1])
+        except Exception as e:
+            logger.error(f"Error extracting '{task.source_filename}': {e}")
+            traceback.print_exc()
+            task.fail(e)
+            if future is not None:
+                self._drain_worker(chunk_queue, future)
+        yield DocumentEnd(task) # The write stage finalizes the document and releases its source lock
+
+    @staticmethod
+    def _recover_extract(task: DocumentTask, error: Exception):
+        # Extraction broke off before DocumentEnd; send it anyway so the document is still finalized
+        task.fail(error)
+        yield DocumentEnd(task)
+
+    @staticmethod
+    def _recover_embed(item, error: Exception):
+        # Pass the item on so the write stage still counts the batch (or sees the DocumentEnd)
+        item.task.fail(error)
+        yield item
+
+    def _embed(self, item):
+        if isinstance(item, ChunkBatch) and item.task.error is None and item.new_indices:
+            task = item.task
+            task.progress(status="embedding", message=f"Embedding '{task.source_filename}'...")
+            start = time.perf_counter()
+            try:
+                item.embeddings = ollama_ef([item.chunks[i] for i in item.new_indices])
+            except Exception as e:
+                logger.error(f"Error embedding a batch of '{task.source_filename}': {e}")
+                task.fail(e)
+            task.add_stage_time("embed", time.perf_counter() - start)
+        yield item
+
+    def _write(self, item):
+        task = item.task
+        if isinstance(item, ChunkBatch):
+            if task.error is None:
+                try:
+                    # Chunks we already have only need their position refreshed; the rest are added with their embeddings
+                    new = set(item.new_indices)
+                    known = [i for i in range(len(item.ids)) if i not in new]
+                    stage_seconds = {}
+                    update_chunk_metadatas([item.ids[i] for i in known], [item.metadatas[i] for i in known], stage_seconds,
+                                           knowledge_base=task.knowledge_base)
+                    added = add_chunks_to_chroma(
+                        [item.chunks[i] for i in item.new_indices], [item.metadatas[i] for i in item.new_indices],
+                        [item.ids[i] for i in item.new_indices], stage_seconds, embeddings=item.embeddings,
+                        knowledge_base=task.knowledge_base
+                    )
+                    for stage, seconds in stage_seconds.items():
+                        task.add_stage_time(stage, seconds)
+                    task.added_ids.extend(added)
+                    task.chunks_done += len(item.ids)
+                    task.progress(chunks_done=task.chunks_done, chunks_added=len(task.added_ids))
+                except Exception as e:
+                    logger.error(f"Error writing a batch of '{task.source_filename}': {e}")
+                    task.fail(e)
+        with task.lock:
+            if isinstance(item, ChunkBatch):
+                task.batches_finished += 1
+            else:
+                task.extraction_done = True
+            finished = task.extraction_done and task.batches_finished == task.batches_emitted
+        if finished:
+            self._finalize(task)
+        return []
+
+    def _finalize(self, task: DocumentTask):
+        try:
+            if task.outcome == "unchanged":
+                if self.move_files:
+                    utils.move_file_to_directory(task.file_path, done_directory(task.knowledge_base), task.source_filename)
+                INGEST_DOCUMENTS.inc(status="unchanged")
+            elif task.error is not None:
+                task.outcome = "failed"
+                # Don't leave a half-ingested document behind; chunks that existed before are kept
+                try:
+                    delete_chunks_from_chroma(task.added_ids, task.knowledge_base)
+                except Exception as cleanup_error:
+                    logger.error(f"Failed to remove partially added chunks of '{task.source_filename}': {cleanup_error}")
+                if self.delete_failed_files and os.path.exists(task.file_path):
+                    os.remove(task.file_path) # Clean up the partially processed upload
+                INGEST_DOCUMENTS.inc(status="failed")
+            elif not task.chunks_done:
+                task.outcome = "empty"
+                if self.delete_failed_files and os.path.exists(task.file_path):
+                    os.remove(task.file_path) # Clean up if no chunks were generated
+                INGEST_DOCUMENTS.inc(status="empty")
+            else:
+                # Chunks of the previous version that no longer exist in this one
+                stale_ids = list(task.existing_ids - task.seen_ids)
+                delete_chunks_from_chroma(stale_ids, task.knowledge_base)
+                task.chunks_removed = len(stale_ids)
+                get_document_registry(task.knowledge_base).record_document(task.source_filename, task.file_hash, task.chunks_done, os.path.getsize(task.file_path))
+                if self.move_files:
+                    utils.move_file_to_directory(task.file_path, done_directory(task.knowledge_base), task.source_filename)
+                task.outcome = "completed"
+                _record_ingest_metrics(task.source_filename, task.chunks_done, time.perf_counter() - task.started_at, task.stage_seconds)
+        except Exception as e:
+            logger.error(f"Error finalizing '{task.source_filename}': {e}")
+            traceback.print_exc()
+            task.fail(e)
+            task.outcome = "failed"
+            INGEST_DOCUMENTS.inc(status="failed")
+        finally:
+            if task._source_lock is not None:
+                task._source_lock.release()
+            if task.on_finish is not None:
+                task.on_finish(task)
+
+
+def _record_ingest_metrics(source_filename: str, chunk_count: int, elapsed: float, stage_seconds: dict):
+    INGEST_DOCUMENTS.inc(status="completed")
+    INGEST_CHUNKS.inc(chunk_count)
+    for stage in ("extract", "split", "embed", "write"):
+        INGEST_STAGE_SECONDS.observe(stage_seconds.get(stage, 0.0), stage=stage)
+    if elapsed > 0:
+        INGEST_CHUNKS_PER_SECOND.observe(chunk_count / elapsed)
+    if config.METRICS_LOG_REQUEST_TIMINGS:
+        stages = " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in stage_seconds.items())
+        logger.info(f"'{source_filename}' timings: total={elapsed * 1000:.1f}ms {stages} ({chunk_count / max(elapsed, 1e-9):.1f} chunks/s)")
@@ -0,0 +1,232 @@
+"""
+Export and import knowledge-base snapshots without re-embedding anything.
+
+Usage:
+    python kb_snapshot.py export <snapshot_dir> [--page-size N] [--dtype float32|float16] [--knowledge-base NAME]
+    python kb_snapshot.py import <snapshot_dir> [--batch-size N] [--replace] [--knowledge-base NAME]
+
+A snapshot is a directory with:
+    manifest.json    format version, embedding model, dimensions, dtype and counts
+    embeddings.npy   one row per chunk (memory-mapped on import)
+    chunks.jsonl     {"id", "document", "metadata"} per chunk, in the same order as the matrix rows
+    documents.jsonl  the document registry rows (file hashes, so unchanged files are still skipped)
+
+A snapshot holds one knowledge base (the default one unless --knowledge-base is given)
+and can be imported into any knowledge base, e.g. to split or rename one.
+Chunks are streamed from and to the vector store in pages, so memory stays bounded.
+A snapshot made with a different config.OLLAMA_EMBEDDING_MODEL is refused, because its
+vectors would not be comparable with new query embeddings. Stop the server while
+exporting or importing: the vector store must not be opened by two processes at once.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import numpy as np
+import config
+from document_registry import get_document_registry
+from vector_db_manager import get_vector_store, add_chunks_to_chroma, clear_all_knowledge_base
+from knowledge_bases import normalize_knowledge_base_name, knowledge_base_exists
+
+SNAPSHOT_FORMAT_VERSION = 1
+MANIFEST_FILE = "manifest.json"
+EMBEDDINGS_FILE = "embeddings.npy"
+CHUNKS_FILE = "chunks.jsonl"
+DOCUMENTS_FILE = "documents.jsonl"
+
+
+def export_snapshot(directory: str, page_size: int = 1000, dtype: str = "float32", knowledge_base: str = None) -> dict:
+    """Writes a whole knowledge base to directory (which must be empty or missing)."""
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    if not knowledge_base_exists(knowledge_base):
+        raise ValueError(f"Unknown knowledge base: '{knowledge_base}'")
+    if os.path.isdir(directory) and os.listdir(directory):
+        raise ValueError(f"Snapshot directory '{directory}' is not empty.")
+    os.makedirs(directory, exist_ok=True)
+    dtype = np.dtype(dtype)
+    start_time = time.perf_counter()
+
+    # The .npy header needs the final row count, so rows are streamed to a raw file first
+    raw_path = os.path.join(directory, EMBEDDINGS_FILE + ".part")
+    chunk_count, dimensions = 0, None
+    with open(raw_path, 'wb') as raw_file, open(os.path.join(directory, CHUNKS_FILE), 'w', encoding='utf-8') as chunks_file:
+        for page in get_vector_store(knowledge_base).iter_chunks(page_size):
+            embeddings = page["embeddings"]
+            if dimensions is None:
+                dimensions = int(embeddings.shape[1])
+            raw_file.write(np.ascontiguousarray(embeddings, dtype=dtype).tobytes())
+            for chunk_id, document, metadata in zip(page["ids"], page["documents"], page["metadatas"]):
+                chunks_file.write(json.dumps({"id": chunk_id, "document": document, "metadata": metadata}, ensure_ascii=False) + "\n")
+            chunk_count += len(page["ids"])
+            print(f"Exported {chunk_count} chunks...", end="\r")
+
+    with open(os.path.join(directory, EMBEDDINGS_FILE), 'wb') as npy_file, open(raw_path, 'rb') as raw_file:
+        header = {"descr": np.lib.format.dtype_to_descr(dtype), "fortran_order": False, "shape": (chunk_count, dimensions or 0)}
+        np.lib.format.write_array_header_1_0(npy_file, header)
+        shutil.copyfileobj(raw_file, npy_file, 16 * 1024 * 1024)
+    os.remove(raw_path)
+
+    registry = get_document_registry(knowledge_base)
+    document_count, offset = 0, 0
+    with open(os.path.join(directory, DOCUMENTS_FILE), 'w', encoding='utf-8') as documents_file:
+        while True:
+            documents, _ = registry.list_documents(offset=offset, limit=page_size)
+            if not documents:
+                break
+            for document in documents:
+                documents_file.write(json.dumps(document, ensure_ascii=False) + "\n")
+            document_count += len(documents)
+            offset += len(documents)
+
+    manifest = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "embedding_model": config.OLLAMA_EMBEDDING_MODEL,
+        "dimensions": dimensions,
+        "dtype": dtype.name,
+        "chunks": chunk_count,
+        "documents": document_count,
+        "vector_store_backend": config.VECTOR_STORE_BACKEND,
+        "knowledge_base": knowledge_base,
+        "created_at": time.time(),
+    }
+    with open(os.path.join(directory, MANIFEST_FILE), 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, indent=2)
+    return {**manifest, "elapsed": time.perf_counter() - start_time}
+
+
+def read_manifest(directory: str) -> dict:
+    """Loads and validates a snapshot's manifest against this installation."""
+    manifest_path = os.path.join(directory, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        raise ValueError(f"'{directory}' is not a snapshot (no {MANIFEST_FILE}).")
+    with open(manifest_path, 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(f"Unsupported snapshot format version {manifest.get('format_version')}.")
+    if manifest.get("embedding_model") != config.OLLAMA_EMBEDDING_MODEL:
+        raise ValueError(
+            f"Snapshot was built with embedding model '{manifest.get('embedding_model')}', but this installation uses "
+            f"'{config.OLLAMA_EMBEDDING_MODEL}'. Its vectors can't be searched with this model; re-ingest the documents instead."
+        )
+    return manifest
+
+
+def validate_chunks_file(directory: str, expected_chunks: int):
+    """
+    Checks chunks.jsonl before anything is written: every line must parse and have an id,
+    ids must be unique, and the line count must match the manifest (and so the embedding rows).
+    """
+    seen_ids = set()
+    with open(os.path.join(directory, CHUNKS_FILE), 'r', encoding='utf-8') as chunks_file:
+        for line_number, line in enumerate(chunks_file, start=1):
+            try:
+                chunk = json.loads(line)
+            except ValueError:
+                chunk = None
+            if not isinstance(chunk, dict) or not {"id", "document", "metadata"} <= chunk.keys():
+                raise ValueError(f"Snapshot is corrupt: {CHUNKS_FILE} line {line_number} is not a valid chunk record.")
+            chunk_id = chunk["id"]
+            if chunk_id in seen_ids:
+                raise ValueError(f"Snapshot is corrupt: chunk id '{chunk_id}' appears more than once in {CHUNKS_FILE}.")
+            seen_ids.add(chunk_id)
+    if len(seen_ids) != expected_chunks:
+        raise ValueError(f"Snapshot is incomplete: {CHUNKS_FILE} has {len(seen_ids)} chunks, manifest expects {expected_chunks}.")
+
+
+def import_snapshot(directory: str, batch_size: int = 1000, replace: bool = False, knowledge_base: str = None) -> dict:
+    """Bulk-loads a snapshot into a knowledge base (created if needed). Without replace, the knowledge base must be empty."""
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    manifest = read_manifest(directory)
+    embeddings = np.load(os.path.join(directory, EMBEDDINGS_FILE), mmap_mode='r')
+    if embeddings.shape[0] != manifest["chunks"] or (manifest["chunks"] and embeddings.shape[1] != manifest["dimensions"]):
+        raise ValueError(f"Snapshot is incomplete: {EMBEDDINGS_FILE} has shape {embeddings.shape}, manifest expects {manifest['chunks']} x {manifest['dimensions']}.")
+    # Validate everything up front: a bad snapshot must not leave a cleared or half-filled knowledge base behind
+    validate_chunks_file(directory, manifest["chunks"])
+
+    store = get_vector_store(knowledge_base)
+    if store.count():
+        if not replace:
+            raise ValueError(f"Knowledge base '{knowledge_base}' already holds {store.count()} chunks. Use --replace to clear it before importing.")
+        print(f"Clearing knowledge base '{knowledge_base}'...")
+        if not clear_all_knowledge_base(knowledge_base):
+            raise RuntimeError("Failed to clear the existing knowledge base.")
+
+    start_time = time.perf_counter()
+    imported = 0
+    batch_ids, batch_documents, batch_metadatas = [], [], []
+
+    def flush():
+        nonlocal imported
+        if not batch_ids:
+            return
+        batch_embeddings = np.asarray(embeddings[imported:imported + len(batch_ids)], dtype=np.float32)
+        if len(batch_embeddings) != len(batch_ids):
+            raise ValueError(f"Snapshot is incomplete: {EMBEDDINGS_FILE} has fewer rows than {CHUNKS_FILE} has chunks.")
+        add_chunks_to_chroma(batch_documents, batch_metadatas, batch_ids, embeddings=batch_embeddings.tolist(), knowledge_base=knowledge_base)
+        imported += len(batch_ids)
+        batch_ids.clear()
+        batch_documents.clear()
+        batch_metadatas.clear()
+        print(f"Imported {imported}/{manifest['chunks']} chunks...", end="\r")
+
+    with open(os.path.join(directory, CHUNKS_FILE), 'r', encoding='utf-8') as chunks_file:
+        for line in chunks_file:
+            chunk = json.loads(line)
+            batch_ids.append(chunk["id"])
+            batch_documents.append(chunk["document"])
+            batch_metadatas.append(chunk["metadata"])
+            if len(batch_ids) >= batch_size:
+                flush()
+        flush()
+
+    registry = get_document_registry(knowledge_base)
+    document_count = 0
+    documents_path = os.path.join(directory, DOCUMENTS_FILE)
+    if os.path.exists(documents_path):
+        with open(documents_path, 'r', encoding='utf-8') as documents_file:
+            for line in documents_file:
+                document = json.loads(line)
+                registry.record_document(document["source"], document.get("file_hash"), document.get("chunk_count", 0),
+                                         document.get("byte_size"), document.get("ingested_at"))
+                document_count += 1
+    registry.bump_kb_version()
+    return {"chunks": imported, "documents": document_count, "knowledge_base": knowledge_base, "elapsed": time.perf_counter() - start_time}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export or import a knowledge-base snapshot (chunks, metadata and embeddings).")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    export_parser = subparsers.add_parser("export", help="Write the knowledge base to a snapshot directory")
+    export_parser.add_argument("directory", help="Snapshot directory to create (must be empty or missing)")
+    export_parser.add_argument("--page-size", type=int, default=1000, help="Chunks read from the vector store per page (default: 1000)")
+    export_parser.add_argument("--dtype", choices=("float32", "float16"), default="float32",
+                               help="Precision of the stored embeddings; float16 halves the snapshot size (default: float32)")
+    export_parser.add_argument("--knowledge-base", default=None, help="Knowledge base to export (default: config.DEFAULT_KNOWLEDGE_BASE)")
+    import_parser = subparsers.add_parser("import", help="Load a snapshot into the knowledge base")
+    import_parser.add_argument("directory", help="Snapshot directory written by 'export'")
+    import_parser.add_argument("--batch-size", type=int, default=config.BULK_INGEST_WRITE_BATCH_SIZE,
+                               help="Chunks written to the vector store per batch (default: config.BULK_INGEST_WRITE_BATCH_SIZE)")
+    import_parser.add_argument("--replace", action="store_true", help="Clear a non-empty knowledge base before importing")
+    import_parser.add_argument("--knowledge-base", default=None,
+                               help="Knowledge base to import into, created if needed (default: config.DEFAULT_KNOWLEDGE_BASE)")
+    args = parser.parse_args()
+
+    try:
+        if args.command == "export":
+            stats = export_snapshot(args.directory, max(1, args.page_size), args.dtype, knowledge_base=args.knowledge_base)
+            print(f"Exported {stats['chunks']} chunks and {stats['documents']} documents of knowledge base '{stats['knowledge_base']}' "
+                  f"(model '{stats['embedding_model']}', {stats['dimensions']} dimensions) to '{args.directory}' in {stats['elapsed']:.1f}s.")
+        else:
+            stats = import_snapshot(args.directory, max(1, args.batch_size), replace=args.replace, knowledge_base=args.knowledge_base)
+            print(f"Imported {stats['chunks']} chunks and {stats['documents']} documents from '{args.directory}' "
+                  f"into knowledge base '{stats['knowledge_base']}' in {stats['elapsed']:.1f}s.")
+    except (ValueError, RuntimeError, OSError) as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
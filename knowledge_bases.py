@@ -0,0 +1,72 @@
+import os
+import re
+import logging
+from typing import List
+import config
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+# Lowercase letters, digits, '-' and '_', starting and ending with a letter or digit; the name
+# becomes part of a ChromaDB collection name and a directory name, so it must be safe for both
+_NAME_PATTERN = re.compile(r"^[a-z0-9](?:[a-z0-9_-]{0,38}[a-z0-9])?$")
+
+
+def normalize_knowledge_base_name(name: str = None) -> str:
+    """Returns the knowledge base name to use (the default one for None or ""). Raises ValueError for invalid names."""
+    if name is None or name == "":
+        return config.DEFAULT_KNOWLEDGE_BASE
+    name = str(name).strip().lower()
+    if not _NAME_PATTERN.match(name):
+        raise ValueError(
+            f"Invalid knowledge base name '{name}': use 1-40 lowercase letters, digits, '-' or '_', "
+            "starting and ending with a letter or digit."
+        )
+    return name
+
+def is_default(name: str) -> bool:
+    return name == config.DEFAULT_KNOWLEDGE_BASE
+
+
+# --- Storage locations ---
+# The default knowledge base keeps the original locations from config, so existing data stays where it is.
+# Every other knowledge base is self-contained in KNOWLEDGE_BASES_DIRECTORY/<name> (plus its ChromaDB collection).
+def knowledge_base_directory(name: str) -> str:
+    return config.BASE_DIR if is_default(name) else os.path.join(config.KNOWLEDGE_BASES_DIRECTORY, name)
+
+def upload_directory(name: str) -> str:
+    return config.PDF_DIRECTORY if is_default(name) else os.path.join(knowledge_base_directory(name), "documents")
+
+def done_directory(name: str) -> str:
+    return config.DONE_DIRECTORY if is_default(name) else os.path.join(knowledge_base_directory(name), "done_documents")
+
+def document_registry_path(name: str) -> str:
+    return config.DOCUMENT_REGISTRY_PATH if is_default(name) else os.path.join(knowledge_base_directory(name), "document_registry.sqlite3")
+
+def numpy_store_directory(name: str) -> str:
+    return config.NUMPY_STORE_DIRECTORY if is_default(name) else os.path.join(knowledge_base_directory(name), "vector_store")
+
+def chroma_collection_name(name: str) -> str:
+    return config.CHROMA_COLLECTION_NAME if is_default(name) else f"{config.CHROMA_COLLECTION_NAME}-{name}"
+
+
+def list_knowledge_bases() -> List[str]:
+    """Names of every knowledge base, the default one first."""
+    names = []
+    if os.path.isdir(config.KNOWLEDGE_BASES_DIRECTORY):
+        for entry in sorted(os.listdir(config.KNOWLEDGE_BASES_DIRECTORY)):
+            if _NAME_PATTERN.match(entry) and not is_default(entry) and os.path.isdir(os.path.join(config.KNOWLEDGE_BASES_DIRECTORY, entry)):
+                names.append(entry)
+    return [config.DEFAULT_KNOWLEDGE_BASE] + names
+
+def knowledge_base_exists(name: str) -> bool:
+    return is_default(name) or os.path.isdir(knowledge_base_directory(name))
+
+def create_knowledge_base(name: str) -> bool:
+    """Creates the directories of a knowledge base. Returns True if it didn't exist before."""
+    created = not knowledge_base_exists(name)
+    os.makedirs(upload_directory(name), exist_ok=True)
+    os.makedirs(done_directory(name), exist_ok=True)
+    if created:
+        logger.info(f"Created knowledge base '{name}'.")
+    return created
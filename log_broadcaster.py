@@ -0,0 +1,130 @@
+import asyncio
+import threading
+from collections import deque
+from typing import Optional
+
+
+class LogSubscription:
+    """
+    One subscriber's view of the log stream: a bounded ring buffer that drops the
+    oldest lines (and counts them) when the subscriber falls behind.
+    """
+    def __init__(self, broadcaster: "LogBroadcaster", buffer_size: int):
+        self._broadcaster = broadcaster
+        self._buffer = deque(maxlen=buffer_size)
+        self._condition = threading.Condition()
+        self._dropped = 0
+        self.total_dropped = 0
+
+    def _push(self, message: str):
+        with self._condition:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+                self.total_dropped += 1
+            self._buffer.append(message)
+            self._condition.notify()
+
+    def get(self, timeout: float) -> Optional[str]:
+        """Blocks until a line is available or the timeout expires (then returns None)."""
+        with self._condition:
+            if not self._buffer:
+                self._condition.wait(timeout)
+            return self._buffer.popleft() if self._buffer else None
+
+    def take_dropped(self) -> int:
+        """Returns how many lines were dropped since the last call, and resets the count."""
+        with self._condition:
+            dropped, self._dropped = self._dropped, 0
+            return dropped
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+class AsyncLogSubscription:
+    """
+    LogSubscription for asyncio consumers (the ASGI log stream): publishing threads wake
+    the event loop instead of a blocked thread, so an open log stream costs a coroutine.
+    """
+    def __init__(self, broadcaster: "LogBroadcaster", buffer_size: int, loop: asyncio.AbstractEventLoop):
+        self._broadcaster = broadcaster
+        self._buffer = deque(maxlen=buffer_size)
+        self._lock = threading.Lock()
+        self._loop = loop
+        self._ready = asyncio.Event()
+        self._dropped = 0
+        self.total_dropped = 0
+
+    def _push(self, message: str):
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen:
+                self._dropped += 1
+                self.total_dropped += 1
+            self._buffer.append(message)
+        try:
+            self._loop.call_soon_threadsafe(self._ready.set)
+        except RuntimeError:
+            pass # Event loop already closed; the subscription is about to go away
+
+    async def get(self, timeout: float) -> Optional[str]:
+        """Waits until a line is available or the timeout expires (then returns None)."""
+        if not self._buffer:
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        with self._lock:
+            message = self._buffer.popleft() if self._buffer else None
+            if not self._buffer:
+                self._ready.clear() # A push racing with this schedules another set() on the loop
+        return message
+
+    def take_dropped(self) -> int:
+        """Returns how many lines were dropped since the last call, and resets the count."""
+        with self._lock:
+            dropped, self._dropped = self._dropped, 0
+            return dropped
+
+    def close(self):
+        self._broadcaster.unsubscribe(self)
+
+
+class LogBroadcaster:
+    """
+    Fans every published log line out to all subscribers, so each open log stream
+    sees the complete log. Keeps the last few lines to replay to new subscribers.
+    """
+    def __init__(self, buffer_size: int, replay_size: int):
+        self._buffer_size = buffer_size
+        self._history = deque(maxlen=replay_size)
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def publish(self, message: str):
+        with self._lock:
+            self._history.append(message)
+            for subscriber in self._subscribers:
+                subscriber._push(message)
+
+    def subscribe(self, replay: bool = True) -> LogSubscription:
+        return self._add(LogSubscription(self, self._buffer_size), replay)
+
+    def subscribe_async(self, replay: bool = True) -> AsyncLogSubscription:
+        """Subscribes from a coroutine; lines are delivered on the running event loop."""
+        return self._add(AsyncLogSubscription(self, self._buffer_size, asyncio.get_running_loop()), replay)
+
+    def _add(self, subscription, replay: bool):
+        with self._lock:
+            if replay:
+                for message in self._history:
+                    subscription._push(message)
+            self._subscribers.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: LogSubscription):
+        with self._lock:
+            self._subscribers.discard(subscription)
+
+    def subscriber_count(self) -> int:
+        with self._lock:
+            return len(self._subscribers)
@@ -0,0 +1,201 @@
+import time
+import bisect
+import threading
+from collections import deque
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+# Default latency buckets (seconds), from a few milliseconds up to slow CPU-bound generations
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+# Quantiles reported for every histogram, computed over a window of recent observations
+REPORTED_QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _format_labels(label_items: Tuple[Tuple[str, str], ...], extra: Dict[str, str] = None) -> str:
+    items = list(label_items) + list((extra or {}).items())
+    if not items:
+        return ""
+    escaped = [(key, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')) for key, value in items]
+    return "{" + ",".join(f'{key}="{value}"' for key, value in escaped) + "}"
+
+def _label_key(labels: Dict[str, str]) -> Tuple[Tuple[str, str], ...]:
+    return tuple(sorted((key, str(value)) for key, value in labels.items()))
+
+
+class Counter:
+    """Monotonically increasing count, optionally split by labels."""
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Gauge:
+    """Value that can go up and down (e.g. a cache size), optionally split by labels."""
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def set(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} gauge"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative bucketed histogram (exported as a Prometheus histogram), plus a sliding
+    window of recent observations used to report p50/p95/p99 as a summary.
+    """
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS, window: int = 1024):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self.window = window
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0, "recent": deque(maxlen=self.window)}
+                self._series[key] = series
+            series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+            series["sum"] += value
+            series["count"] += 1
+            series["recent"].append(value)
+
+    def quantiles(self, **labels) -> Dict[float, float]:
+        """Returns the reported quantiles over the recent window (empty if nothing was observed)."""
+        with self._lock:
+            series = self._series.get(_label_key(labels))
+            recent = sorted(series["recent"]) if series else []
+        if not recent:
+            return {}
+        return {q: recent[min(len(recent) - 1, int(q * len(recent)))] for q in REPORTED_QUANTILES}
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        summary_lines = [f"# HELP {self.name}_recent {self.help_text} (quantiles over the last {self.window} observations)",
+                         f"# TYPE {self.name}_recent summary"]
+        with self._lock:
+            snapshot = [(key, list(s["counts"]), s["sum"], s["count"], sorted(s["recent"])) for key, s in sorted(self._series.items())]
+        for key, counts, total, count, recent in snapshot:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(key, {'le': repr(bound)})} {cumulative}")
+            lines.append(f"{self.name}_bucket{_format_labels(key, {'le': '+Inf'})} {count}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {count}")
+            for q in REPORTED_QUANTILES:
+                value = recent[min(len(recent) - 1, int(q * len(recent)))] if recent else float('nan')
+                summary_lines.append(f"{self.name}_recent{_format_labels(key, {'quantile': str(q)})} {value}")
+            summary_lines.append(f"{self.name}_recent_sum{_format_labels(key)} {sum(recent)}")
+            summary_lines.append(f"{self.name}_recent_count{_format_labels(key)} {len(recent)}")
+        return lines + summary_lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, help_text: str) -> Counter:
+        with self._lock:
+            return self._metrics.setdefault(name, Counter(name, help_text))
+
+    def gauge(self, name: str, help_text: str) -> Gauge:
+        with self._lock:
+            return self._metrics.setdefault(name, Gauge(name, help_text))
+
+    def histogram(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        with self._lock:
+            return self._metrics.setdefault(name, Histogram(name, help_text, buckets))
+
+    def render(self) -> str:
+        """Renders every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Process-wide registry exposed on /metrics
+REGISTRY = MetricsRegistry()
+
+# --- Chat metrics ---
+CHAT_STAGE_SECONDS = REGISTRY.histogram("localrag_chat_stage_seconds", "Time spent in each stage of a /chat request.")
+CHAT_REQUESTS = REGISTRY.counter("localrag_chat_requests_total", "Number of /chat requests by outcome.")
+CHAT_TOKENS = REGISTRY.counter("localrag_chat_tokens_total", "Number of streamed response tokens (stream chunks) generated.")
+CHAT_TOKENS_PER_SECOND = REGISTRY.histogram(
+    "localrag_chat_tokens_per_second", "Generation speed of /chat responses in tokens per second.",
+    buckets=(1, 2, 5, 10, 20, 30, 50, 75, 100, 200)
+)
+
+# --- Retrieval metrics ---
+KNOWLEDGE_BASE_SEARCH_SECONDS = REGISTRY.histogram("localrag_knowledge_base_search_seconds", "Vector search time per knowledge base.")
+
+# --- Ingestion metrics ---
+INGEST_STAGE_SECONDS = REGISTRY.histogram("localrag_ingest_stage_seconds", "Time spent in each ingestion stage, per document.")
+INGEST_DOCUMENTS = REGISTRY.counter("localrag_ingest_documents_total", "Number of ingested documents by outcome.")
+INGEST_CHUNKS = REGISTRY.counter("localrag_ingest_chunks_total", "Number of chunks processed by ingestion.")
+INGEST_CHUNKS_PER_SECOND = REGISTRY.histogram(
+    "localrag_ingest_chunks_per_second", "Ingestion throughput per document in chunks per second.",
+    buckets=(1, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+)
+INGEST_PIPELINE_BUSY_SECONDS = REGISTRY.counter("localrag_ingest_pipeline_busy_seconds_total", "Worker time each ingestion pipeline stage spent working.")
+INGEST_PIPELINE_BLOCKED_SECONDS = REGISTRY.counter("localrag_ingest_pipeline_blocked_seconds_total", "Worker time each ingestion pipeline stage spent blocked on a full downstream queue.")
+INGEST_PIPELINE_ITEMS = REGISTRY.counter("localrag_ingest_pipeline_items_total", "Items (documents or chunk batches) processed by each ingestion pipeline stage.")
+
+
+class RequestTimings:
+    """
+    Per-request stage timer. Every span is recorded into a stage histogram and kept
+    locally so the request can log a one-line timing trailer when it finishes.
+    """
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+        self.spans = {}
+
+    @contextmanager
+    def span(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.record(stage, time.perf_counter() - start)
+
+    def record(self, stage: str, seconds: float):
+        self.spans[stage] = self.spans.get(stage, 0.0) + seconds
+        self.histogram.observe(seconds, stage=stage)
+
+    def summary(self) -> str:
+        return " ".join(f"{stage}={seconds * 1000:.1f}ms" for stage, seconds in self.spans.items())
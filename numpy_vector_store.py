@@ -0,0 +1,563 @@
+import os
+import json
+import array
+import threading
+import logging
+from typing import List, Dict, Any, Optional
+import numpy as np
+from vector_store import VectorStore
+
+try:
+    import fcntl # POSIX
+except ImportError:
+    fcntl = None
+    import msvcrt # Windows
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+MANIFEST_FILE = "manifest.json"
+TOMBSTONES_FILE = "tombstones.jsonl"
+LOCK_FILE = "store.lock"
+FORMAT_VERSION = 1
+
+
+class _Segment:
+    """
+    One append-only segment of the store, as three files written in this order:
+      <name>.vec   raw row-major embedding matrix (memory-mapped for search)
+      <name>.jsonl one {"document", "metadata"} record per row, read on demand
+      <name>.keys  one [id, source, chunk_index, offset, length] line per row; a row exists once its key line does
+    """
+    def __init__(self, directory: str, name: str, dimensions: int, dtype: np.dtype):
+        self.name = name
+        self.dimensions = dimensions
+        self.dtype = dtype
+        self.vectors_path = os.path.join(directory, name + ".vec")
+        self.records_path = os.path.join(directory, name + ".jsonl")
+        self.keys_path = os.path.join(directory, name + ".keys")
+        self.ids = []
+        self.offsets = array.array('q')
+        self.lengths = array.array('q')
+        self.alive = np.zeros(0, dtype=bool)
+        self.matrix = None # np.memmap of shape (rows, dimensions); None while empty
+        self._records_file = None # Read handle on the records file, opened on first read
+
+    @property
+    def rows(self) -> int:
+        return len(self.ids)
+
+    @property
+    def dead_rows(self) -> int:
+        return self.rows - int(np.count_nonzero(self.alive))
+
+    def files(self) -> List[str]:
+        return [self.vectors_path, self.records_path, self.keys_path]
+
+    def _remap(self):
+        self.matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode='r', shape=(self.rows, self.dimensions)) if self.rows else None
+
+    def load(self) -> List[list]:
+        """Reads the key lines (dropping a torn tail left by a crash mid-append) and returns them."""
+        keys = []
+        records_end = 0
+        if os.path.exists(self.keys_path):
+            with open(self.keys_path, 'rb') as f:
+                for line in f:
+                    try:
+                        key = json.loads(line)
+                    except ValueError:
+                        break
+                    keys.append(key)
+                    records_end = key[3] + key[4]
+        row_bytes = self.dimensions * self.dtype.itemsize
+        vector_rows = os.path.getsize(self.vectors_path) // row_bytes if os.path.exists(self.vectors_path) else 0
+        records_size = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+        if records_end > records_size:
+            # Key lines are written last, so this only happens if a file was damaged outside the store
+            raise RuntimeError(f"Vector store segment '{self.name}' is corrupt: records file is shorter than its keys.")
+        keys = keys[:vector_rows]
+
+        # Cut every file back to the last complete row so later appends line up again
+        for path, size in ((self.vectors_path, len(keys) * row_bytes), (self.records_path, keys[-1][3] + keys[-1][4] if keys else 0)):
+            with open(path, 'ab') as f:
+                f.truncate(size)
+        with open(self.keys_path, 'wb') as f:
+            f.writelines(json.dumps(key).encode('utf-8') + b"\n" for key in keys)
+
+        self.ids = [key[0] for key in keys]
+        self.offsets = array.array('q', (key[3] for key in keys))
+        self.lengths = array.array('q', (key[4] for key in keys))
+        self.alive = np.ones(len(keys), dtype=bool)
+        self._remap()
+        return keys
+
+    def append(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]) -> List[list]:
+        """Appends rows (vectors already normalized and in the store dtype); returns their key lines."""
+        with open(self.vectors_path, 'ab') as f:
+            f.write(np.ascontiguousarray(vectors, dtype=self.dtype).tobytes())
+        offset = os.path.getsize(self.records_path) if os.path.exists(self.records_path) else 0
+        keys = []
+        with open(self.records_path, 'ab') as f:
+            for chunk_id, document, metadata in zip(ids, documents, metadatas):
+                line = json.dumps({"document": document, "metadata": metadata}, ensure_ascii=False).encode('utf-8') + b"\n"
+                f.write(line)
+                keys.append([chunk_id, metadata.get("source"), metadata.get("chunk_index"), offset, len(line)])
+                offset += len(line)
+        with open(self.keys_path, 'ab') as f:
+            f.writelines(json.dumps(key).encode('utf-8') + b"\n" for key in keys)
+
+        self.ids.extend(ids)
+        self.offsets.extend(key[3] for key in keys)
+        self.lengths.extend(key[4] for key in keys)
+        self.alive = np.concatenate([self.alive, np.ones(len(ids), dtype=bool)])
+        self._remap()
+        return keys
+
+    def read_records(self, rows: List[int]) -> List[dict]:
+        """Reads the records of rows (in file order, returned in the order asked). Call with the store lock held."""
+        if self._records_file is None:
+            self._records_file = open(self.records_path, 'rb')
+        records = [None] * len(rows)
+        for position in sorted(range(len(rows)), key=lambda i: self.offsets[rows[i]]):
+            row = rows[position]
+            self._records_file.seek(self.offsets[row])
+            records[position] = json.loads(self._records_file.read(self.lengths[row]))
+        return records
+
+    def close(self):
+        if self._records_file is not None:
+            self._records_file.close()
+            self._records_file = None
+
+    def delete_files(self):
+        self.close()
+        self.matrix = None
+        for path in self.files():
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                # E.g. still memory-mapped by a running query on Windows; the next open removes it
+                logger.warning(f"Could not remove vector store file '{path}': {e}")
+
+
+class NumpyVectorStore(VectorStore):
+    """
+    Exact (brute-force) cosine search over memory-mapped embedding matrices, for corpora
+    small enough (up to roughly a million chunks) that scanning every vector is faster
+    than maintaining an ANN index. Embeddings are stored normalized, so a search is one
+    matrix-vector product per block of rows.
+
+    Writes are append-only: new chunks go to the last segment (a new one is started every
+    segment_max_rows rows), deletes and metadata updates mark rows dead in a tombstone log,
+    and segments with many dead rows are rewritten (compacted). Only one process may open
+    a store directory at a time; this is enforced with an exclusive lock on store.lock.
+    """
+    name = "numpy"
+
+    def __init__(self, directory: str, dtype: str = "float16", segment_max_rows: int = 100000,
+                 compact_ratio: float = 0.25, search_block_rows: int = 65536):
+        self.directory = directory
+        self.dtype = np.dtype(dtype)
+        self.segment_max_rows = max(1, segment_max_rows)
+        self.compact_ratio = compact_ratio
+        self.search_block_rows = max(1, search_block_rows)
+        self._lock = threading.RLock()
+        self._generation = 0 # Bumped whenever segment files are replaced, so in-flight searches retry
+        os.makedirs(directory, exist_ok=True)
+        self._lock_file = self._acquire_directory_lock()
+        self._load()
+
+    def _acquire_directory_lock(self):
+        # Two processes appending to the same segments would corrupt their row offsets and tombstones
+        lock_file = open(os.path.join(self.directory, LOCK_FILE), 'a+b')
+        try:
+            if fcntl is not None:
+                fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                lock_file.seek(0)
+                msvcrt.locking(lock_file.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            lock_file.close()
+            raise RuntimeError(
+                f"Vector store '{self.directory}' is already open in another process (e.g. the running server). "
+                "Stop that process first."
+            )
+        return lock_file
+
+    def close(self):
+        """Closes the segment files and releases the directory lock."""
+        with self._lock:
+            for segment in self._segments:
+                segment.close()
+            if self._lock_file is not None:
+                self._lock_file.close() # Closing the file releases the lock
+                self._lock_file = None
+
+    # --- Persistence ---
+
+    def _manifest_path(self) -> str:
+        return os.path.join(self.directory, MANIFEST_FILE)
+
+    def _write_manifest(self):
+        manifest = {
+            "version": FORMAT_VERSION,
+            "dimensions": self.dimensions,
+            "dtype": self.dtype.name,
+            "segments": [segment.name for segment in self._segments],
+            "next_segment_id": self._next_segment_id,
+        }
+        temp_path = self._manifest_path() + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(manifest, f)
+        os.replace(temp_path, self._manifest_path()) # Atomic: readers see the old or the new segment list
+
+    def _load(self):
+        self._segments = []
+        self._segments_by_name = {}
+        self._entries = {} # id -> [segment, row, source, chunk_index]
+        self._sources = {} # source -> set of ids
+        self.dimensions = None
+        self._next_segment_id = 1
+
+        if os.path.exists(self._manifest_path()):
+            with open(self._manifest_path(), 'r', encoding='utf-8') as f:
+                manifest = json.load(f)
+            if manifest.get("version") != FORMAT_VERSION:
+                raise RuntimeError(f"Unsupported vector store format version {manifest.get('version')} in '{self.directory}'.")
+            if manifest["dtype"] != self.dtype.name:
+                logger.warning(f"Vector store in '{self.directory}' uses {manifest['dtype']}, not {self.dtype.name}; keeping {manifest['dtype']}.")
+                self.dtype = np.dtype(manifest["dtype"])
+            self.dimensions = manifest["dimensions"]
+            self._next_segment_id = manifest["next_segment_id"]
+            for name in manifest["segments"]:
+                segment = _Segment(self.directory, name, self.dimensions, self.dtype)
+                for row, key in enumerate(segment.load()):
+                    self._index_put(key[0], segment, row, key[1], key[2])
+                self._segments.append(segment)
+                self._segments_by_name[name] = segment
+
+        tombstones_path = os.path.join(self.directory, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            with open(tombstones_path, 'rb') as f:
+                for line in f:
+                    try:
+                        tombstone = json.loads(line)
+                    except ValueError:
+                        break # Torn last line
+                    segment = self._segments_by_name.get(tombstone["segment"])
+                    if segment is not None:
+                        self._mark_dead(segment, [row for row in tombstone["rows"] if row < segment.rows])
+
+        self._remove_orphan_files()
+        logger.info(f"Vector store '{self.directory}' opened: {len(self._entries)} chunks in {len(self._segments)} segments.")
+
+    def _remove_orphan_files(self):
+        # Segment files left behind by an interrupted compaction or clear
+        known = {path for segment in self._segments for path in segment.files()}
+        for file_name in os.listdir(self.directory):
+            path = os.path.join(self.directory, file_name)
+            if file_name.startswith("seg_") and path not in known:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # --- In-memory index (call with self._lock held) ---
+
+    def _index_put(self, chunk_id: str, segment: _Segment, row: int, source: Optional[str], chunk_index: Optional[int]):
+        self._index_remove(chunk_id)
+        self._entries[chunk_id] = [segment, row, source, chunk_index]
+        self._sources.setdefault(source, set()).add(chunk_id)
+
+    def _index_remove(self, chunk_id: str):
+        entry = self._entries.pop(chunk_id, None)
+        if entry is not None:
+            ids = self._sources.get(entry[2])
+            if ids is not None:
+                ids.discard(chunk_id)
+                if not ids:
+                    del self._sources[entry[2]]
+        return entry
+
+    def _mark_dead(self, segment: _Segment, rows: List[int]):
+        if not rows:
+            return
+        alive = segment.alive.copy() # Copy-on-write: running searches keep their own snapshot
+        alive[rows] = False
+        segment.alive = alive
+        for row in rows:
+            entry = self._entries.get(segment.ids[row])
+            if entry is not None and entry[0] is segment and entry[1] == row:
+                self._index_remove(segment.ids[row])
+
+    def _new_segment(self) -> _Segment:
+        segment = _Segment(self.directory, f"seg_{self._next_segment_id:06d}", self.dimensions, self.dtype)
+        self._next_segment_id += 1
+        return segment
+
+    def _append(self, ids: List[str], vectors: np.ndarray, documents: List[str], metadatas: List[Dict[str, Any]]):
+        position = 0
+        while position < len(ids):
+            segment = self._segments[-1] if self._segments else None
+            if segment is None or segment.rows >= self.segment_max_rows:
+                segment = self._new_segment()
+                self._segments.append(segment)
+                self._segments_by_name[segment.name] = segment
+                self._write_manifest()
+            end = min(len(ids), position + self.segment_max_rows - segment.rows)
+            first_row = segment.rows
+            keys = segment.append(ids[position:end], vectors[position:end], documents[position:end], metadatas[position:end])
+            for offset, key in enumerate(keys):
+                self._index_put(key[0], segment, first_row + offset, key[1], key[2])
+            position = end
+
+    def _delete(self, ids: List[str]):
+        rows_by_segment = {}
+        for chunk_id in ids:
+            entry = self._entries.get(chunk_id)
+            if entry is not None:
+                rows_by_segment.setdefault(entry[0], []).append(entry[1])
+        if not rows_by_segment:
+            return
+        with open(os.path.join(self.directory, TOMBSTONES_FILE), 'ab') as f:
+            for segment, rows in rows_by_segment.items():
+                f.write(json.dumps({"segment": segment.name, "rows": rows}).encode('utf-8') + b"\n")
+        for segment, rows in rows_by_segment.items():
+            self._mark_dead(segment, rows)
+        for segment in rows_by_segment:
+            if segment.dead_rows > self.compact_ratio * segment.rows:
+                self._compact_segment(segment)
+
+    def _compact_segment(self, segment: _Segment):
+        """Rewrites a segment without its dead rows (or drops it if nothing is left)."""
+        live_rows = np.flatnonzero(segment.alive).tolist()
+        position = self._segments.index(segment)
+        replacement = None
+        if live_rows:
+            replacement = _Segment(self.directory, f"seg_{self._next_segment_id:06d}", self.dimensions, self.dtype)
+            self._next_segment_id += 1
+            records = segment.read_records(live_rows)
+            replacement.append(
+                [segment.ids[row] for row in live_rows], np.asarray(segment.matrix[live_rows]),
+                [record["document"] for record in records], [record["metadata"] for record in records]
+            )
+            self._segments[position] = replacement
+            self._segments_by_name[replacement.name] = replacement
+        else:
+            del self._segments[position]
+        del self._segments_by_name[segment.name]
+        self._write_manifest() # The replacement becomes visible atomically; the old files are now orphans
+        self._generation += 1
+
+        if replacement is not None:
+            for new_row, chunk_id in enumerate(replacement.ids):
+                entry = self._entries[chunk_id]
+                entry[0], entry[1] = replacement, new_row
+        segment.delete_files()
+        logger.info(f"Compacted vector store segment '{segment.name}': {len(live_rows)} live rows kept, {segment.rows - len(live_rows)} dead rows dropped.")
+        if all(s.dead_rows == 0 for s in self._segments):
+            # Every tombstone has been applied by rewriting its segment, so the log can start over
+            open(os.path.join(self.directory, TOMBSTONES_FILE), 'wb').close()
+
+    def _read_entries(self, entries: List[list]) -> List[dict]:
+        # Call with self._lock held; reads each segment's rows in one pass
+        rows_by_segment = {}
+        for position, entry in enumerate(entries):
+            rows_by_segment.setdefault(entry[0], []).append((position, entry[1]))
+        records = [None] * len(entries)
+        for segment, items in rows_by_segment.items():
+            for (position, _), record in zip(items, segment.read_records([row for _, row in items])):
+                records[position] = record
+        return records
+
+    def _prepare_vectors(self, embeddings) -> np.ndarray:
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        if vectors.ndim != 2:
+            raise ValueError("Embeddings must be a list of equally long vectors.")
+        if self.dimensions is None:
+            self.dimensions = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dimensions:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match the store's dimension {self.dimensions}.")
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return (vectors / norms).astype(self.dtype)
+
+    # --- VectorStore interface ---
+
+    def count(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def add(self, ids, documents, embeddings, metadatas):
+        if not ids:
+            return
+        if len(set(ids)) != len(ids):
+            raise ValueError("Chunk IDs within one add must be unique.")
+        with self._lock:
+            vectors = self._prepare_vectors(embeddings)
+            self._delete([chunk_id for chunk_id in ids if chunk_id in self._entries]) # Adding an existing ID replaces it
+            self._append(list(ids), vectors, list(documents), [dict(metadata) for metadata in metadatas])
+
+    def update_metadatas(self, ids, metadatas):
+        with self._lock:
+            found = [(chunk_id, metadata) for chunk_id, metadata in zip(ids, metadatas) if chunk_id in self._entries]
+            if not found:
+                return
+            records = self._read_entries([self._entries[chunk_id] for chunk_id, _ in found])
+            # Rows are immutable: re-append each changed chunk with its new metadata and retire the old row.
+            # Unchanged chunks (most of a re-ingest) are left alone, so they cause no tombstones or compaction.
+            changed = [(chunk_id, dict(metadata), record["document"])
+                       for (chunk_id, metadata), record in zip(found, records) if record["metadata"] != dict(metadata)]
+            if not changed:
+                return
+            vectors = []
+            for chunk_id, _, _ in changed:
+                segment, row = self._entries[chunk_id][:2]
+                vectors.append(np.asarray(segment.matrix[row]))
+            changed_ids = [chunk_id for chunk_id, _, _ in changed]
+            self._delete(changed_ids)
+            self._append(changed_ids, np.asarray(vectors), [document for _, _, document in changed], [metadata for _, metadata, _ in changed])
+
+    def delete(self, ids):
+        with self._lock:
+            self._delete(list(ids))
+
+    def delete_source(self, source):
+        with self._lock:
+            self._delete(list(self._sources.get(source, ())))
+
+    def get_ids_by_source(self, source):
+        with self._lock:
+            return set(self._sources.get(source, ()))
+
+    def _read_by_ids(self, ids: List[str]) -> List[Optional[dict]]:
+        # Call with self._lock held; None for IDs deleted in the meantime
+        present = [(position, self._entries[chunk_id]) for position, chunk_id in enumerate(ids) if chunk_id in self._entries]
+        records = [None] * len(ids)
+        for (position, _), record in zip(present, self._read_entries([entry for _, entry in present])):
+            records[position] = record
+        return records
+
+    def iter_source_chunks(self, source, start=0, page_size=500):
+        with self._lock:
+            entries = [(chunk_id, entry[3], self._segments.index(entry[0]), entry[1])
+                       for chunk_id, entry in ((chunk_id, self._entries[chunk_id]) for chunk_id in self._sources.get(source, ()))]
+        if any(chunk_index is not None for _, chunk_index, _, _ in entries):
+            ordered = sorted((item for item in entries if item[1] is not None and item[1] >= start), key=lambda item: item[1])
+        else:
+            # Chunks ingested before 'chunk_index' existed: storage order
+            ordered = sorted(entries, key=lambda item: (item[2], item[3]))[start:]
+
+        for page_start in range(0, len(ordered), page_size):
+            page_ids = [item[0] for item in ordered[page_start:page_start + page_size]]
+            with self._lock:
+                records = self._read_by_ids(page_ids)
+            for record in records:
+                if record is not None:
+                    yield {"content": record["document"], "metadata": record["metadata"]}
+
+    def iter_metadatas(self, page_size=1000):
+        with self._lock:
+            ids = list(self._entries)
+        for page_start in range(0, len(ids), page_size):
+            with self._lock:
+                records = self._read_by_ids(ids[page_start:page_start + page_size])
+            for record in records:
+                if record is not None:
+                    yield record["metadata"]
+
+    def iter_chunks(self, page_size=1000):
+        with self._lock:
+            ids = list(self._entries)
+        for page_start in range(0, len(ids), page_size):
+            page = {"ids": [], "documents": [], "metadatas": [], "embeddings": []}
+            with self._lock:
+                page_ids = [chunk_id for chunk_id in ids[page_start:page_start + page_size] if chunk_id in self._entries] # Skip ones deleted meanwhile
+                entries = [self._entries[chunk_id] for chunk_id in page_ids]
+                for chunk_id, entry, record in zip(page_ids, entries, self._read_entries(entries)):
+                    segment, row = entry[0], entry[1]
+                    page["ids"].append(chunk_id)
+                    page["documents"].append(record["document"])
+                    page["metadatas"].append(record["metadata"])
+                    page["embeddings"].append(np.asarray(segment.matrix[row], dtype=np.float32))
+            if page["ids"]:
+                page["embeddings"] = np.vstack(page["embeddings"])
+                yield page
+
+    def _search(self, snapshot, query: np.ndarray, n_results: int):
+        # Top candidates of every block, then one merge: memory stays bounded by the block size
+        scores, locations = [], []
+        for segment_position, (matrix, alive) in enumerate(snapshot):
+            for block_start in range(0, len(alive), self.search_block_rows):
+                block = np.asarray(matrix[block_start:block_start + self.search_block_rows], dtype=np.float32)
+                block_scores = block @ query
+                block_scores[~alive[block_start:block_start + len(block)]] = -np.inf
+                k = min(n_results, len(block_scores))
+                top = np.argpartition(-block_scores, k - 1)[:k]
+                scores.append(block_scores[top])
+                locations.extend((segment_position, block_start + int(row)) for row in top)
+        if not scores:
+            return []
+        scores = np.concatenate(scores)
+        order = np.argsort(-scores, kind='stable')[:n_results]
+        return [(float(scores[i]), locations[i]) for i in order if np.isfinite(scores[i])]
+
+    def query(self, embedding, n_results):
+        if n_results <= 0:
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm > 0:
+            query = query / norm
+        while True:
+            with self._lock:
+                if self.dimensions is None or not self._entries:
+                    return []
+                if query.shape[0] != self.dimensions:
+                    raise ValueError(f"Query embedding dimension {query.shape[0]} does not match the store's dimension {self.dimensions}.")
+                generation = self._generation
+                segments = [segment for segment in self._segments if segment.rows]
+                snapshot = [(segment.matrix, segment.alive) for segment in segments]
+
+            hits = self._search(snapshot, query, n_results) # The matrix scan runs without holding the lock
+
+            with self._lock:
+                if generation != self._generation:
+                    continue # A segment was compacted away meanwhile; its rows have moved, so search again
+                # Skip rows deleted while we were searching
+                hits = [(score, segments[segment_position], row) for score, (segment_position, row) in hits if segments[segment_position].alive[row]]
+                records = self._read_entries([[segment, row] for _, segment, row in hits])
+                results = []
+                for (score, segment, row), record in zip(hits, records):
+                    results.append({
+                        "id": segment.ids[row],
+                        "document": record["document"],
+                        "distance": max(0.0, 1.0 - score),
+                        "metadata": record["metadata"],
+                        "embedding": np.asarray(segment.matrix[row], dtype=np.float32),
+                    })
+                return results
+
+    def compact(self):
+        """Rewrites every segment that has dead rows."""
+        with self._lock:
+            for segment in [segment for segment in self._segments if segment.dead_rows]:
+                self._compact_segment(segment)
+
+    def clear(self):
+        with self._lock:
+            old_segments = self._segments
+            self._segments = []
+            self._segments_by_name = {}
+            self._entries = {}
+            self._sources = {}
+            self.dimensions = None
+            self._write_manifest()
+            self._generation += 1
+            open(os.path.join(self.directory, TOMBSTONES_FILE), 'wb').close()
+            for segment in old_segments:
+                segment.delete_files()
+        logger.info(f"Vector store '{self.directory}' cleared.")
@@ -1,12 +1,63 @@
+import threading
+import httpx
 import ollama
 import config # Import config to get model names
 import traceback # Import for full tracebacks
+from embedding_batcher import EmbeddingBatcher
+
+# Shared Ollama client, created on first use. Its HTTP connection pool is reused by every request.
+_client = None
+_client_lock = threading.Lock()
+_async_client = None
+
+# Coalescer for concurrent single-text embedding calls, created on first use
+_embedding_batcher = None
+_embedding_batcher_lock = threading.Lock()
+
+
+def get_ollama_client() -> ollama.Client:
+    """Returns the shared Ollama client (pooled keep-alive connections, request timeout from config)."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ollama.Client(
+                host=config.OLLAMA_HOST,
+                timeout=httpx.Timeout(config.OLLAMA_REQUEST_TIMEOUT_SECONDS, connect=config.OLLAMA_CONNECT_TIMEOUT_SECONDS),
+                limits=httpx.Limits(max_connections=config.OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=config.OLLAMA_MAX_CONNECTIONS),
+            )
+    return _client
+
+def get_ollama_async_client() -> ollama.AsyncClient:
+    """
+    Returns the shared async Ollama client used by the ASGI app. Its connection pool belongs
+    to the event loop that first uses it, so only call this from that (single) server loop.
+    """
+    global _async_client
+    if _async_client is None:
+        _async_client = ollama.AsyncClient(
+            host=config.OLLAMA_HOST,
+            timeout=httpx.Timeout(config.OLLAMA_REQUEST_TIMEOUT_SECONDS, connect=config.OLLAMA_CONNECT_TIMEOUT_SECONDS),
+            limits=httpx.Limits(max_connections=config.OLLAMA_MAX_CONNECTIONS, max_keepalive_connections=config.OLLAMA_MAX_CONNECTIONS),
+        )
+    return _async_client
+
+def warm_up_chat_model():
+    """
+    Loads the chat model into Ollama's memory (and keeps it there for OLLAMA_KEEP_ALIVE)
+    so the first real request doesn't pay the model load time. Raises if Ollama can't load it.
+    """
+    # An empty chat loads the model without generating anything
+    get_ollama_client().chat(model=config.OLLAMA_CHAT_MODEL, messages=[], keep_alive=config.OLLAMA_KEEP_ALIVE)
+
+def warm_up_embedding_model():
+    """Same as warm_up_chat_model, for the embedding model."""
+    get_ollama_client().embed(model=config.OLLAMA_EMBEDDING_MODEL, input="warm-up", keep_alive=config.OLLAMA_KEEP_ALIVE)
 
 def get_ollama_chat_stream(messages: list[dict]):
 
     try:
         # Use the chat method with streaming enabled
-        stream = ollama.chat(model=config.OLLAMA_CHAT_MODEL, messages=messages, stream=True)
+        stream = get_ollama_client().chat(model=config.OLLAMA_CHAT_MODEL, messages=messages, stream=True, keep_alive=config.OLLAMA_KEEP_ALIVE)
         for chunk in stream:
             # Check if there's content in the chunk and yield it
             if 'content' in chunk['message']:
@@ -18,14 +69,29 @@ def get_ollama_chat_stream(messages: list[dict]):
         print(f"An unexpected error occurred during Ollama chat streaming: {e}")
         yield f"ERROR: An unexpected error occurred: {e}"
 
+async def get_ollama_chat_stream_async(messages: list[dict]):
+    # Same as get_ollama_chat_stream, but streams on the event loop instead of blocking a thread
+    try:
+        stream = await get_ollama_async_client().chat(model=config.OLLAMA_CHAT_MODEL, messages=messages, stream=True, keep_alive=config.OLLAMA_KEEP_ALIVE)
+        async for chunk in stream:
+            if 'content' in chunk['message']:
+                yield chunk['message']['content']
+    except ollama.ResponseError as e:
+        print(f"Ollama Response Error (Chat): {e}")
+        yield f"ERROR: Ollama chat model responded with an error: {e}"
+    except Exception as e:
+        print(f"An unexpected error occurred during Ollama chat streaming: {e}")
+        yield f"ERROR: An unexpected error occurred: {e}"
+
 def get_ollama_completion(messages: list[dict], model: str = config.OLLAMA_CHAT_MODEL, temperature: float = 0.0) -> str:
 
     try:
-        response = ollama.chat(
+        response = get_ollama_client().chat(
             model=model,
             messages=messages,
             options={"temperature": temperature},
-            stream=False # Request a non-streaming response
+            stream=False, # Request a non-streaming response
+            keep_alive=config.OLLAMA_KEEP_ALIVE
         )
         return response['message']['content']
     except ollama.ResponseError as e:
@@ -38,9 +104,22 @@ def get_ollama_completion(messages: list[dict], model: str = config.OLLAMA_CHAT_
         return f"ERROR: An unexpected error occurred: {e}"
 
 
+def _get_embedding_batcher() -> EmbeddingBatcher:
+    global _embedding_batcher
+    with _embedding_batcher_lock:
+        if _embedding_batcher is None:
+            _embedding_batcher = EmbeddingBatcher(
+                get_ollama_embeddings, config.EMBEDDING_COALESCE_WINDOW_SECONDS,
+                config.EMBEDDING_COALESCE_MAX_BATCH_SIZE, config.EMBEDDING_COALESCE_MAX_IN_FLIGHT
+            )
+    return _embedding_batcher
+
 def get_ollama_embedding(text: str) -> list[float]:
+    # Concurrent callers (e.g. simultaneous /chat queries) are merged into one batched request
+    if config.EMBEDDING_COALESCING_ENABLED:
+        return _get_embedding_batcher().embed(text)
     try:
-        response = ollama.embeddings(model=config.OLLAMA_EMBEDDING_MODEL, prompt=text)
+        response = get_ollama_client().embeddings(model=config.OLLAMA_EMBEDDING_MODEL, prompt=text, keep_alive=config.OLLAMA_KEEP_ALIVE)
         return response['embedding']
     except ollama.ResponseError as e:
         print(f"Ollama Response Error (Embedding): {e}")
@@ -48,4 +127,24 @@ def get_ollama_embedding(text: str) -> list[float]:
     except Exception as e:
         print(f"An unexpected error occurred during Ollama embedding: {e}")
         traceback.print_exc()
-        raise RuntimeError(f"An unexpected error occurred: {e}")
\ No newline at end of file
+        raise RuntimeError(f"An unexpected error occurred: {e}")
+
+def get_ollama_embeddings(texts: list[str]) -> list[list[float]]:
+    # Embeds several texts with a single request to Ollama's /api/embed endpoint
+    if not texts:
+        return []
+    try:
+        response = get_ollama_client().embed(model=config.OLLAMA_EMBEDDING_MODEL, input=texts, keep_alive=config.OLLAMA_KEEP_ALIVE)
+        embeddings = response['embeddings']
+        if len(embeddings) != len(texts):
+            raise RuntimeError(f"Ollama returned {len(embeddings)} embeddings for {len(texts)} inputs.")
+        return embeddings
+    except ollama.ResponseError as e:
+        print(f"Ollama Response Error (Batch Embedding): {e}")
+        raise RuntimeError(f"Ollama embedding model responded with an error: {e}")
+    except RuntimeError:
+        raise
+    except Exception as e:
+        print(f"An unexpected error occurred during Ollama batch embedding: {e}")
+        traceback.print_exc()
+        raise RuntimeError(f"An unexpected error occurred: {e}")
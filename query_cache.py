@@ -0,0 +1,58 @@
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+import config
+from metrics import REGISTRY
+
+QUERY_CACHE_REQUESTS = REGISTRY.counter("localrag_query_cache_requests_total", "Query cache lookups by cache and result.")
+
+
+def normalize_query(text: str) -> str:
+    """Collapses whitespace and case so trivially different phrasings share cache entries."""
+    return " ".join(text.split()).casefold()
+
+
+class TTLLRUCache:
+    """Thread-safe LRU cache whose entries also expire ttl_seconds after they were stored."""
+    def __init__(self, name: str, max_entries: int, ttl_seconds: float):
+        self.name = name
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict() # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and time.monotonic() - entry[0] > self.ttl_seconds:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                QUERY_CACHE_REQUESTS.inc(cache=self.name, result="miss")
+                return None
+            self._entries.move_to_end(key)
+        QUERY_CACHE_REQUESTS.inc(cache=self.name, result="hit")
+        return entry[1]
+
+    def put(self, key: Hashable, value: Any):
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+
+# Query text -> embedding. Embeddings don't depend on the knowledge base, only on the model.
+query_embedding_cache = TTLLRUCache("query_embedding", config.QUERY_EMBEDDING_CACHE_SIZE, config.QUERY_CACHE_TTL_SECONDS)
+
+# (query text, n_results, knowledge-base version) -> retrieved chunks
+retrieval_cache = TTLLRUCache("retrieval", config.RETRIEVAL_CACHE_SIZE, config.QUERY_CACHE_TTL_SECONDS)
@@ -0,0 +1,68 @@
+import time
+import threading
+from typing import Dict, List, Optional
+
+# Component states reported by /readyz
+COMPONENT_PENDING = "pending"
+COMPONENT_READY = "ready"
+COMPONENT_FAILED = "failed" # Failed so far; startup keeps retrying
+COMPONENT_SKIPPED = "skipped" # Not checked at startup (e.g. model warm-up disabled); counts as ready
+
+
+class ReadinessTracker:
+    """
+    Initialization state of the components the server needs (vector store, models),
+    with how long each took, so the server can listen right away and report readiness
+    per component instead of blocking until everything is loaded.
+    """
+    def __init__(self, components: List[str]):
+        self._started_at = time.time()
+        self._start = time.perf_counter()
+        self._lock = threading.Lock()
+        self._ready_after = None
+        self._components = {
+            name: {"status": COMPONENT_PENDING, "init_seconds": None, "attempts": 0, "error": None}
+            for name in components
+        }
+
+    def _set(self, name: str, status: str, init_seconds: Optional[float] = None, error: Optional[str] = None):
+        with self._lock:
+            component = self._components[name]
+            component["status"] = status
+            component["error"] = error
+            if init_seconds is not None:
+                component["init_seconds"] = round(init_seconds, 3)
+            if status in (COMPONENT_READY, COMPONENT_FAILED):
+                component["attempts"] += 1
+            if self._ready_after is None and self._all_ready_locked():
+                self._ready_after = time.perf_counter() - self._start
+
+    def mark_ready(self, name: str, init_seconds: float):
+        self._set(name, COMPONENT_READY, init_seconds)
+
+    def mark_failed(self, name: str, error: str, init_seconds: float):
+        self._set(name, COMPONENT_FAILED, init_seconds, error)
+
+    def mark_skipped(self, name: str, reason: str = None):
+        self._set(name, COMPONENT_SKIPPED, error=reason)
+
+    def is_ready(self, name: str) -> bool:
+        with self._lock:
+            return self._components[name]["status"] in (COMPONENT_READY, COMPONENT_SKIPPED)
+
+    def _all_ready_locked(self) -> bool:
+        return all(component["status"] in (COMPONENT_READY, COMPONENT_SKIPPED) for component in self._components.values())
+
+    def all_ready(self) -> bool:
+        with self._lock:
+            return self._all_ready_locked()
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            return {
+                "ready": self._all_ready_locked(),
+                "started_at": self._started_at,
+                "uptime_seconds": round(time.perf_counter() - self._start, 3),
+                "ready_after_seconds": round(self._ready_after, 3) if self._ready_after is not None else None,
+                "components": {name: dict(component) for name, component in self._components.items()},
+            }
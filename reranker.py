@@ -0,0 +1,44 @@
+from typing import List, Sequence
+import numpy as np
+
+
+def _normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+def mmr_rerank(query_embedding: Sequence[float], candidate_embeddings: Sequence[Sequence[float]], k: int,
+               diversity_lambda: float = 0.5, max_similarity: float = 1.0) -> List[int]:
+    """
+    Maximal marginal relevance over pre-ranked candidates. Picks up to k candidates, each
+    time taking the one maximizing
+        lambda * sim(query, c) - (1 - lambda) * max(sim(c, already selected)),
+    so near-duplicates of chunks already chosen lose out to new information.
+    diversity_lambda=1.0 is pure relevance order, 0.0 is pure diversity. Candidates whose
+    similarity to an already selected chunk exceeds max_similarity are never picked.
+    Returns the indices of the chosen candidates in selection order.
+    """
+    if k <= 0 or len(candidate_embeddings) == 0:
+        return []
+    candidates = _normalize_rows(np.asarray(candidate_embeddings, dtype=np.float32))
+    query = _normalize_rows(np.asarray(query_embedding, dtype=np.float32)[np.newaxis, :])[0]
+
+    relevance = candidates @ query # cosine similarity to the query, shape (n,)
+    pairwise = candidates @ candidates.T # cosine similarity between candidates, shape (n, n)
+
+    n = len(candidates)
+    available = np.ones(n, dtype=bool)
+    redundancy = np.zeros(n, dtype=np.float32) # max similarity to any selected candidate
+    selected = []
+    for _ in range(min(k, n)):
+        scores = diversity_lambda * relevance - (1.0 - diversity_lambda) * redundancy
+        scores[~available] = -np.inf
+        best = int(np.argmax(scores))
+        if not np.isfinite(scores[best]):
+            break
+        selected.append(best)
+        available[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+        # Drop near-duplicates of what we just picked
+        available &= redundancy <= max_similarity
+    return selected
@@ -7,10 +7,18 @@ document.addEventListener('DOMContentLoaded', () => {
     const stopBtn = document.getElementById('stop-btn');
     const clearChatBtn = document.getElementById('clear-chat-btn');
     const clearKbBtn = document.getElementById('clear-kb-btn');
+    const kbSelect = document.getElementById('kb-select');
     const logContent = document.getElementById('log-content');
 
     let currentRequestController = null;
 
+    // Each browser keeps its own conversation on the server, identified by this id
+    let conversationId = localStorage.getItem('conversationId');
+    if (!conversationId) {
+        conversationId = (window.crypto && crypto.randomUUID) ? crypto.randomUUID() : `${Date.now()}-${Math.random().toString(36).slice(2)}`;
+        localStorage.setItem('conversationId', conversationId);
+    }
+
     marked.setOptions({
         gfm: true,
         breaks: true,
@@ -78,7 +86,12 @@ document.addEventListener('DOMContentLoaded', () => {
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify({ message: message }),
+                // An empty selection searches every knowledge base
+                body: JSON.stringify({
+                    message: message,
+                    conversation_id: conversationId,
+                    knowledge_bases: kbSelect.value ? [kbSelect.value] : null
+                }),
                 signal: signal
             });
 
@@ -142,6 +155,9 @@ document.addEventListener('DOMContentLoaded', () => {
 
         const formData = new FormData();
         formData.append('file', file);
+        if (kbSelect.value) {
+            formData.append('knowledge_base', kbSelect.value); // Otherwise the default knowledge base
+        }
 
         try {
             const response = await fetch('/upload_pdf', {
@@ -152,6 +168,9 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await response.json();
             if (response.ok) {
                 appendMessage('system', data.message);
+                if (data.job_id) {
+                    pollIngestionJob(data.job_id);
+                }
             } else {
                 throw new Error(data.error || 'Failed to upload document.');
             }
@@ -163,9 +182,36 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function pollIngestionJob(jobId) {
+        try {
+            const response = await fetch(`/jobs/${jobId}`);
+            const job = await response.json();
+            if (!response.ok) {
+                throw new Error(job.error || 'Failed to get job status.');
+            }
+            if (job.status === 'completed') {
+                appendMessage('system', job.message);
+                loadKnowledgeBases();
+            } else if (job.status === 'failed') {
+                appendMessage('system', `Error: ${job.message}`);
+            } else {
+                setTimeout(() => pollIngestionJob(jobId), 1000);
+            }
+        } catch (error) {
+            console.error('Error polling ingestion job:', error);
+            appendMessage('system', `Error: Could not get document processing status. ${error.message}`);
+        }
+    }
+
     async function clearChatHistory() {
         try {
-            const response = await fetch('/clear_chat_history', { method: 'POST' });
+            const response = await fetch('/clear_chat_history', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ conversation_id: conversationId })
+            });
             const data = await response.json();
             if (response.ok) {
                 chatWindow.innerHTML = '';
@@ -179,15 +225,44 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
+    async function loadKnowledgeBases() {
+        try {
+            const response = await fetch('/knowledge_bases');
+            const data = await response.json();
+            if (!response.ok) {
+                throw new Error(data.error || 'Failed to list knowledge bases.');
+            }
+            const selected = kbSelect.value;
+            kbSelect.length = 1; // Keep the "All knowledge bases" option
+            for (const kb of data.knowledge_bases) {
+                const option = document.createElement('option');
+                option.value = kb.name;
+                option.textContent = `${kb.name} (${kb.documents} docs)`;
+                kbSelect.appendChild(option);
+            }
+            kbSelect.value = selected;
+        } catch (error) {
+            console.error('Error listing knowledge bases:', error);
+        }
+    }
+
     async function clearKnowledgeBase() {
-        if (!confirm('Are you sure you want to clear the entire knowledge base? This action cannot be undone.')) {
+        const knowledgeBase = kbSelect.value || null; // null clears the default knowledge base
+        if (!confirm(`Are you sure you want to clear the knowledge base '${knowledgeBase || 'default'}'? This action cannot be undone.`)) {
             return;
         }
         try {
-            const response = await fetch('/clear_knowledge_base', { method: 'POST' });
+            const response = await fetch('/clear_knowledge_base', {
+                method: 'POST',
+                headers: {
+                    'Content-Type': 'application/json',
+                },
+                body: JSON.stringify({ knowledge_base: knowledgeBase })
+            });
             const data = await response.json();
             if (response.ok) {
                 appendMessage('system', data.message);
+                loadKnowledgeBases();
             } else {
                 throw new Error(data.error || 'Failed to clear knowledge base.');
             }
@@ -236,5 +311,6 @@ document.addEventListener('DOMContentLoaded', () => {
         userInput.style.height = (userInput.scrollHeight) + 'px';
     });
 
+    loadKnowledgeBases();
     startLogStream();
 });
\ No newline at end of file
@@ -1,22 +1,31 @@
 import os
 import shutil
+import hashlib
 
-def move_file_to_directory(source_path: str, destination_directory: str) -> bool:
-
+def move_file_to_directory(source_path: str, destination_directory: str, destination_name: str = None) -> bool:
+    # destination_name may be a relative path (e.g. a bulk-ingested 'subdir/report.pdf'); defaults to the file's name
     if not os.path.exists(source_path):
         print(f"Error: Source file '{source_path}' not found. Cannot move.")
         return False
 
     try:
-        # Ensure the destination directory exists
-        os.makedirs(destination_directory, exist_ok=True)
-
-        file_name = os.path.basename(source_path)
+        file_name = destination_name or os.path.basename(source_path)
         destination_path = os.path.join(destination_directory, file_name)
 
+        # Ensure the destination directory exists
+        os.makedirs(os.path.dirname(destination_path), exist_ok=True)
+
         shutil.move(source_path, destination_path)
         print(f"Successfully moved '{file_name}' to '{destination_directory}'.")
         return True
     except Exception as e:
         print(f"Error moving file '{source_path}' to '{destination_directory}': {e}")
-        return False
\ No newline at end of file
+        return False
+
+def hash_file(file_path: str) -> str:
+    # SHA-256 of the file content, read in blocks to keep memory flat
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
\ No newline at end of file
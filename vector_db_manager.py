@@ -1,156 +1,392 @@
-import chromadb
-from chromadb.utils import embedding_functions
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Iterator, Optional, Tuple
 import config
-from ollama_manager import get_ollama_embedding
+from ollama_manager import get_ollama_embedding, get_ollama_embeddings
+from embedding_cache import get_embedding_cache, hash_text
+from document_registry import get_document_registry
+from metrics import RequestTimings, KNOWLEDGE_BASE_SEARCH_SECONDS
+from query_cache import normalize_query, query_embedding_cache, retrieval_cache
+from vector_store import VectorStore, ChromaVectorStore
+from knowledge_bases import (
+    normalize_knowledge_base_name, is_default, list_knowledge_bases, knowledge_base_exists, create_knowledge_base,
+    chroma_collection_name, numpy_store_directory, done_directory
+)
 import traceback 
-import uuid 
+import hashlib
+import contextlib
+import itertools
+import os
+import heapq
+import utils
 import logging 
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 
 logger = logging.getLogger(__name__) # Get logger instance
 logger.setLevel(logging.INFO) # Set level for this module
 
-# Global variables for client and collection to avoid re-initialization IF already done
-_client = None
-_collection = None
+# Vector store per knowledge base name, each opened on first use
+_stores = {}
+_store_lock = threading.Lock() # Pipeline stages may ask for a store concurrently on first use
 
-# Custom embedding function wrapper for Ollama
-class OllamaEmbeddingFunction(embedding_functions.EmbeddingFunction):
-    def __call__(self, input: embedding_functions.Documents) -> embedding_functions.Embeddings:
-        embeddings = [get_ollama_embedding(doc) for doc in input]
+# Shared pool for in-flight embedding batches, created on first use
+_embedding_executor = None
+_embedding_executor_lock = threading.Lock()
+
+def _get_embedding_executor() -> ThreadPoolExecutor:
+    global _embedding_executor
+    with _embedding_executor_lock:
+        if _embedding_executor is None:
+            _embedding_executor = ThreadPoolExecutor(
+                max_workers=config.EMBEDDING_MAX_WORKERS,
+                thread_name_prefix="embedding"
+            )
+    return _embedding_executor
+
+# Shared pool for searching several knowledge bases at once, created on first use
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+def _get_search_executor() -> ThreadPoolExecutor:
+    global _search_executor
+    with _search_executor_lock:
+        if _search_executor is None:
+            _search_executor = ThreadPoolExecutor(
+                max_workers=config.KNOWLEDGE_BASE_SEARCH_WORKERS,
+                thread_name_prefix="kb-search"
+            )
+    return _search_executor
+
+def _embed_batch_with_retry(batch: List[str]) -> List[List[float]]:
+    """Embeds one batch, retrying with exponential backoff on failure."""
+    delay = config.EMBEDDING_RETRY_BACKOFF_SECONDS
+    for attempt in range(1, config.EMBEDDING_MAX_RETRIES + 1):
+        try:
+            if len(batch) == 1:
+                # Single texts (typically chat queries) go through the coalescer so concurrent ones share a request
+                return [get_ollama_embedding(batch[0])]
+            return get_ollama_embeddings(batch)
+        except RuntimeError as e:
+            if attempt == config.EMBEDDING_MAX_RETRIES:
+                logger.error(f"Embedding batch of {len(batch)} texts failed after {attempt} attempts: {e}")
+                raise
+            logger.warning(f"Embedding batch of {len(batch)} texts failed (attempt {attempt}/{config.EMBEDDING_MAX_RETRIES}), retrying in {delay:.1f}s: {e}")
+            time.sleep(delay)
+            delay *= 2
+
+def _embed_uncached(texts: List[str]) -> List[List[float]]:
+    batch_size = max(1, config.EMBEDDING_BATCH_SIZE)
+    batches = [texts[i:i + batch_size] for i in range(0, len(texts), batch_size)]
+    if len(batches) <= 1:
+        # Single batch (e.g. a query): no need to go through the pool
+        return _embed_batch_with_retry(list(texts)) if batches else []
+
+    # Batches run concurrently on the shared pool; map() keeps results in input order
+    embeddings = []
+    for batch_embeddings in _get_embedding_executor().map(_embed_batch_with_retry, batches):
+        embeddings.extend(batch_embeddings)
+    return embeddings
+
+# Custom embedding function wrapper for Ollama (follows ChromaDB's EmbeddingFunction protocol without importing chromadb)
+class OllamaEmbeddingFunction:
+    def __call__(self, input: List[str]) -> List[List[float]]:
+        texts = list(input)
+        cache = get_embedding_cache()
+        if cache is None:
+            return _embed_uncached(texts)
+
+        embeddings = cache.get_many(config.OLLAMA_EMBEDDING_MODEL, texts)
+        # Only embed each distinct missing text once
+        missing_texts = list(dict.fromkeys(text for text, emb in zip(texts, embeddings) if emb is None))
+        if missing_texts:
+            new_embeddings = _embed_uncached(missing_texts)
+            cache.put_many(config.OLLAMA_EMBEDDING_MODEL, missing_texts, new_embeddings)
+            by_text = dict(zip(missing_texts, new_embeddings))
+            embeddings = [emb if emb is not None else by_text[text] for text, emb in zip(texts, embeddings)]
+
+        if len(texts) > 1:
+            logger.info(f"Embedded {len(texts)} texts ({len(texts) - len(missing_texts)} from cache, {len(missing_texts)} via Ollama).")
         return embeddings
 
 # Initialize the custom embedding function once at module level (it's stateless)
 ollama_ef = OllamaEmbeddingFunction()
 
-def get_chroma_collection():
-    global _client, _collection
-    if _collection is None:
-        logger.info(f"Initializing ChromaDB client and collection '{config.CHROMA_COLLECTION_NAME}'...")
-        _client = chromadb.PersistentClient(path=config.CHROMA_DB_DIRECTORY)
-        _collection = _client.get_or_create_collection(
-            name=config.CHROMA_COLLECTION_NAME,
-            embedding_function=ollama_ef, # Use the custom Ollama embedding function
-            metadata={"hnsw:space": "cosine"} # Use cosine distance for similarity
+def _create_vector_store(knowledge_base: str) -> VectorStore:
+    if not is_default(knowledge_base):
+        create_knowledge_base(knowledge_base)
+    backend = config.VECTOR_STORE_BACKEND
+    if backend == "chroma":
+        collection_name = chroma_collection_name(knowledge_base)
+        logger.info(f"Initializing ChromaDB client and collection '{collection_name}'...")
+        store = ChromaVectorStore(config.CHROMA_DB_DIRECTORY, collection_name, embedding_function=ollama_ef)
+        logger.info(f"ChromaDB collection '{collection_name}' initialized.")
+        return store
+    if backend == "numpy":
+        from numpy_vector_store import NumpyVectorStore
+        directory = numpy_store_directory(knowledge_base)
+        logger.info(f"Initializing NumPy vector store in '{directory}'...")
+        return NumpyVectorStore(
+            directory, dtype=config.NUMPY_STORE_DTYPE, segment_max_rows=config.NUMPY_STORE_SEGMENT_MAX_ROWS,
+            compact_ratio=config.NUMPY_STORE_COMPACT_RATIO, search_block_rows=config.NUMPY_STORE_SEARCH_BLOCK_ROWS
         )
-        logger.info(f"ChromaDB collection '{config.CHROMA_COLLECTION_NAME}' initialized.")
-    return _collection
-
-def add_documents_to_chroma(chunks: List[str], source_filename: str):
-    collection = get_chroma_collection()
-    
-    # Generate unique IDs for each chunk
-    ids = [str(uuid.uuid4()) for _ in chunks]
-    
-    # Prepare metadata for each chunk
-    metadatas = [{"source": source_filename} for _ in chunks]
+    raise ValueError(f"Unknown VECTOR_STORE_BACKEND '{backend}' (expected 'chroma' or 'numpy').")
+
+def get_vector_store(knowledge_base: str = None) -> VectorStore:
+    """
+    Returns the vector store of a knowledge base (the default one if not given), using the
+    backend selected by config.VECTOR_STORE_BACKEND. A knowledge base that doesn't exist yet is created.
+    """
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    store = _stores.get(knowledge_base)
+    if store is None:
+        with _store_lock:
+            store = _stores.get(knowledge_base)
+            if store is None:
+                store = _stores[knowledge_base] = _create_vector_store(knowledge_base)
+    return store
+
+def get_knowledge_base_stats(knowledge_base: str = None) -> Dict[str, Any]:
+    """Chunk and document counts of one knowledge base."""
+    knowledge_base = normalize_knowledge_base_name(knowledge_base)
+    store = get_vector_store(knowledge_base)
+    registry = get_document_registry(knowledge_base)
+    return {
+        "name": knowledge_base,
+        "default": is_default(knowledge_base),
+        "backend": store.name,
+        "chunks": store.count(),
+        "documents": registry.count_documents(),
+        "kb_version": registry.get_kb_version(),
+    }
+
+def make_chunk_ids(chunks: List[str], source_filename: str, occurrences: Dict[str, int] = None) -> List[str]:
+    """
+    Derives deterministic chunk IDs from the source filename and the chunk content hash,
+    so re-ingesting a file maps unchanged chunks onto the IDs they already have.
+    Identical chunks within one source are told apart by their occurrence number;
+    pass the same occurrences dict for every batch of a source to keep them consistent.
+    """
+    occurrences = {} if occurrences is None else occurrences
+    ids = []
+    for chunk in chunks:
+        content_hash = hash_text(chunk)
+        occurrence = occurrences.get(content_hash, 0)
+        occurrences[content_hash] = occurrence + 1
+        ids.append(hashlib.sha256(f"{source_filename}\x00{content_hash}\x00{occurrence}".encode('utf-8')).hexdigest())
+    return ids
+
+def _add_stage_time(stage_seconds: Dict[str, float], stage: str, start: float):
+    if stage_seconds is not None:
+        stage_seconds[stage] = stage_seconds.get(stage, 0.0) + time.perf_counter() - start
+
+def add_chunks_to_chroma(chunks: List[str], metadatas: List[Dict[str, Any]], ids: List[str], stage_seconds: Dict[str, float] = None,
+                         embeddings: List[List[float]] = None, knowledge_base: str = None) -> List[str]:
+    """
+    Adds chunks that may come from several source files in a single write;
+    every metadata dict must contain the chunk's 'source' filename. Returns the chunk IDs.
+    Chunks are embedded here unless their embeddings are passed in.
+    Time spent embedding and writing is added to stage_seconds['embed'] / ['write'] if given.
+    """
+    if not chunks:
+        return []
+    store = get_vector_store(knowledge_base)
+    source_names = ", ".join(sorted({metadata["source"] for metadata in metadatas}))
 
     try:
-        collection.add(
-            documents=chunks,
-            metadatas=metadatas,
-            ids=ids
-        )
-        logger.info(f"Added {len(chunks)} documents from '{source_filename}' to ChromaDB.")
+        # Embed explicitly (rather than inside the store) so embedding and writing can be timed apart
+        if embeddings is None:
+            start = time.perf_counter()
+            embeddings = ollama_ef(chunks)
+            _add_stage_time(stage_seconds, "embed", start)
+
+        start = time.perf_counter()
+        try:
+            store.add(ids, chunks, embeddings, metadatas)
+        finally:
+            # Bumped after the write (even a partial one), never before: a query running in between
+            # would otherwise cache the old results under the new version
+            get_document_registry(knowledge_base).bump_kb_version()
+        _add_stage_time(stage_seconds, "write", start)
+        logger.info(f"Added {len(chunks)} documents from '{source_names}' to the vector store.")
+        return ids
     except Exception as e:
-        logger.error(f"Error adding documents to ChromaDB from '{source_filename}': {e}")
+        logger.error(f"Error adding documents to the vector store from '{source_names}': {e}")
         traceback.print_exc()
         raise
 
-def query_chroma_for_context(query_text: str, n_results: int = 4) -> List[Dict[str, Any]]:
-    collection = get_chroma_collection()
-    
-    if not collection.count():
-        logger.warning("ChromaDB collection is empty. No context to retrieve.")
-        return []
+def update_chunk_metadatas(ids: List[str], metadatas: List[Dict[str, Any]], stage_seconds: Dict[str, float] = None,
+                           knowledge_base: str = None):
+    # Metadata-only update: the stored documents and embeddings are left untouched
+    if ids:
+        start = time.perf_counter()
+        try:
+            get_vector_store(knowledge_base).update_metadatas(ids, metadatas)
+        finally:
+            get_document_registry(knowledge_base).bump_kb_version()
+        _add_stage_time(stage_seconds, "write", start)
+
+def get_chunk_ids_by_source(source_filename: str, knowledge_base: str = None) -> set:
+    return get_vector_store(knowledge_base).get_ids_by_source(source_filename)
+
+def delete_chunks_from_chroma(ids: List[str], knowledge_base: str = None):
+    if ids:
+        try:
+            get_vector_store(knowledge_base).delete(ids)
+        finally:
+            get_document_registry(knowledge_base).bump_kb_version()
 
+def delete_source_from_chroma(source_filename: str, knowledge_base: str = None):
+    """Deletes every chunk of a source file and removes it from the knowledge base's document registry."""
+    registry = get_document_registry(knowledge_base)
     try:
-        # ChromaDB queries using the configured embedding function
-        results = collection.query(
-            query_texts=[query_text],
-            n_results=n_results,
-            include=['documents', 'distances', 'metadatas'] # Include metadata for debugging
-        )
+        get_vector_store(knowledge_base).delete_source(source_filename)
+        registry.remove_document(source_filename)
+    finally:
+        registry.bump_kb_version()
+
+def rebuild_document_registry(page_size: int = 1000, knowledge_base: str = None):
+    """
+    Rebuilds a knowledge base's document registry from chunk metadata, one page of metadata at a time.
+    Only needed for knowledge bases created before the registry existed. Hashes and
+    sizes are taken from the copies in the done-documents directory when they are still there.
+    """
+    chunk_counts = {}
+    total_chunks = 0
+    for metadata in get_vector_store(knowledge_base).iter_metadatas(page_size):
+        total_chunks += 1
+        source = metadata.get('source')
+        if source:
+            chunk_counts[source] = chunk_counts.get(source, 0) + 1
+
+    registry = get_document_registry(knowledge_base)
+    for source, chunk_count in chunk_counts.items():
+        done_file_path = os.path.join(done_directory(normalize_knowledge_base_name(knowledge_base)), source)
+        if os.path.exists(done_file_path):
+            registry.record_document(source, utils.hash_file(done_file_path), chunk_count, os.path.getsize(done_file_path))
+        else:
+            registry.record_document(source, None, chunk_count, None)
+    logger.info(f"Document registry rebuilt from {total_chunks} chunks: {len(chunk_counts)} documents.")
+
+def embed_query(query_text: str) -> List[float]:
+    """Embeds a search query, reusing the embedding of an identical recent query."""
+    if not config.QUERY_CACHE_ENABLED:
+        return ollama_ef([query_text])[0]
+    cache_key = (config.OLLAMA_EMBEDDING_MODEL, normalize_query(query_text))
+    embedding = query_embedding_cache.get(cache_key)
+    if embedding is None:
+        embedding = ollama_ef([query_text])[0]
+        query_embedding_cache.put(cache_key, embedding)
+    return embedding
+
+def _search_knowledge_base(knowledge_base: str, query_embedding: List[float], n_results: int) -> List[Dict[str, Any]]:
+    start = time.perf_counter()
+    results = get_vector_store(knowledge_base).query(query_embedding, n_results)
+    KNOWLEDGE_BASE_SEARCH_SECONDS.observe(time.perf_counter() - start, knowledge_base=knowledge_base)
+    for result in results:
+        result["knowledge_base"] = knowledge_base
+    return results
+
+def query_chroma_for_context(query_text: str, n_results: int = 4, timings: RequestTimings = None,
+                             knowledge_bases: List[str] = None) -> Tuple[List[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Returns (results, query_embedding): the n_results chunks closest to query_text across the given
+    knowledge bases (every knowledge base if not given), closest first, and the query's embedding so
+    callers can reuse it. Each result names its 'knowledge_base'. The embedding is None if nothing was searched.
+    """
+    names = [normalize_knowledge_base_name(name) for name in knowledge_bases] if knowledge_bases else list_knowledge_bases()
+    names = [name for name in dict.fromkeys(names) if knowledge_base_exists(name) and get_vector_store(name).count()]
+
+    if not names:
+        logger.warning("Vector store is empty. No context to retrieve.")
+        return [], None
+
+    query_embedding = None
+    try:
+        # Results are only reused while the searched knowledge bases are unchanged: any write bumps their version
+        cache_key = None
+        if config.QUERY_CACHE_ENABLED:
+            versions = tuple((name, get_document_registry(name).get_kb_version()) for name in names)
+            cache_key = (normalize_query(query_text), n_results, versions)
+            cached = retrieval_cache.get(cache_key)
+            if cached is not None:
+                query_embedding, cached_chunks = cached
+                logger.info(f"Retrieval cache hit for '{query_text[:50]}...' ({len(cached_chunks)} chunks).")
+                return [dict(chunk) for chunk in cached_chunks], query_embedding
+
+        # Embed the query ourselves so embedding and vector search show up as separate stages
+        with (timings.span("embed_query") if timings else contextlib.nullcontext()):
+            query_embedding = embed_query(query_text)
+
+        with (timings.span("search") if timings else contextlib.nullcontext()):
+            # Each result also carries the chunk's embedding, which the MMR re-ranker reuses
+            if len(names) == 1:
+                retrieved_chunks = _search_knowledge_base(names[0], query_embedding, n_results)
+            else:
+                # Every knowledge base returns its own top n_results in parallel; the global top n_results is among them
+                per_knowledge_base = _get_search_executor().map(
+                    lambda name: _search_knowledge_base(name, query_embedding, n_results), names
+                )
+                retrieved_chunks = heapq.nsmallest(n_results, itertools.chain.from_iterable(per_knowledge_base),
+                                                   key=lambda chunk: chunk['distance'])
         
-        retrieved_chunks = []
-        if results and results.get('documents') and results['documents'][0]:
-            logger.info(f"ChromaDB raw query results for '{query_text[:50]}...':")
-            for i in range(len(results['documents'][0])):
-                doc_content = results['documents'][0][i]
-                doc_distance = results['distances'][0][i]
-                doc_metadata = results['metadatas'][0][i]
-                
+        if retrieved_chunks:
+            logger.info(f"Vector store raw query results for '{query_text[:50]}...' ({len(names)} knowledge bases):")
+            for i, chunk in enumerate(retrieved_chunks):
                 # Log full details of each retrieved chunk before filtering
-                logger.info(f"  Chunk {i+1}: Distance={doc_distance:.4f}, Source='{doc_metadata.get('source', 'N/A')}', Content='{doc_content[:100]}...'")
-                
-                retrieved_chunks.append({
-                    "document": doc_content,
-                    "distance": doc_distance,
-                    "metadata": doc_metadata
-                })
+                logger.info(f"  Chunk {i+1}: Distance={chunk['distance']:.4f}, Knowledge base='{chunk['knowledge_base']}', Source='{chunk['metadata'].get('source', 'N/A')}', Content='{chunk['document'][:100]}...'")
         else:
-            logger.info(f"ChromaDB query for '{query_text[:50]}...' returned no documents.")
+            logger.info(f"Vector store query for '{query_text[:50]}...' returned no documents.")
+
+        if cache_key is not None:
+            retrieval_cache.put(cache_key, (query_embedding, [dict(chunk) for chunk in retrieved_chunks]))
 
         # The calling function (app.py) will handle filtering by RAG_SCORE_THRESHOLD
         # and re-ranking based on config.RAG_N_RESULTS
-        return retrieved_chunks
+        return retrieved_chunks, query_embedding
 
     except Exception as e:
-        logger.error(f"Error querying ChromaDB: {e}")
+        logger.error(f"Error querying the vector store: {e}")
         traceback.print_exc()
-        return []
+        return [], query_embedding
 
-def clear_all_knowledge_base() -> bool:
+def clear_all_knowledge_base(knowledge_base: str = None) -> bool:
     """
-    Deletes all data from the ChromaDB collection.
+    Deletes all data of one knowledge base (the default one if not given); other knowledge bases are untouched.
     """
-    global _client, _collection
     try:
-        if _client:
-            _client.delete_collection(name=config.CHROMA_COLLECTION_NAME)
-            logger.info(f"ChromaDB collection '{config.CHROMA_COLLECTION_NAME}' deleted.")
-            # Re-initialize the collection to ensure it's ready for new data
-            _collection = _client.get_or_create_collection(
-                name=config.CHROMA_COLLECTION_NAME,
-                embedding_function=ollama_ef,
-                metadata={"hnsw:space": "cosine"}
-            )
-            logger.info(f"ChromaDB collection '{config.CHROMA_COLLECTION_NAME}' re-created after clearing.")
-        else:
-            # If client wasn't initialized, just try to get/create to ensure it's clean
-            get_chroma_collection() # This will ensure a fresh collection is created if one didn't exist
-            logger.info("ChromaDB client not initialized, ensured collection is clean by attempting get_or_create.")
+        registry = get_document_registry(knowledge_base)
+        try:
+            registry.clear()
+            get_vector_store(knowledge_base).clear()
+        finally:
+            registry.bump_kb_version() # Only after the store is cleared, so no query can cache deleted chunks under the new version
         return True
     except Exception as e:
-        logger.error(f"Error clearing ChromaDB knowledge base: {e}")
+        logger.error(f"Error clearing the knowledge base: {e}")
         traceback.print_exc()
         return False
 
-def get_chunks_by_source(source_filename: str) -> List[Dict[str, Any]]:
+def iter_chunks_by_source(source_filename: str, start: int = 0, page_size: int = None, knowledge_base: str = None) -> Iterator[Dict[str, Any]]:
     """
-    Retrieves all document chunks that originated from a specific source file.
+    Yields the chunks of a source file in original document order, starting at chunk
+    ordinal 'start'. Chunks are read one page at a time without any embedding call or
+    vector search, so memory stays bounded by the page size.
     """
-    try:
-        collection = get_chroma_collection()
-        # Query for all documents where the 'source' metadata matches the filename
-        results = collection.query(
-            query_texts=[""], # Empty query text, we're filtering by metadata
-            where={"source": source_filename},
-            n_results=10000, # Retrieve a large number to get (practically) all
-            include=['documents', 'metadatas']
-        )
+    return get_vector_store(knowledge_base).iter_source_chunks(source_filename, start=start, page_size=page_size or config.CHUNK_FETCH_PAGE_SIZE)
 
-        file_chunks = []
-        if results and results.get('documents') and results.get('documents')[0]: # Adjusted to access first element of documents list
-            for i in range(len(results['documents'][0])):
-                doc_content = results['documents'][0][i]
-                doc_metadata = results['metadatas'][0][i]
-                file_chunks.append({"content": doc_content, "metadata": doc_metadata})
-        
+def get_chunks_by_source(source_filename: str, offset: int = 0, limit: int = None, knowledge_base: str = None) -> List[Dict[str, Any]]:
+    """
+    Retrieves the document chunks that originated from a specific source file, in document order.
+    Use iter_chunks_by_source to walk very large documents without materializing them.
+    """
+    try:
+        chunks = iter_chunks_by_source(source_filename, start=offset, page_size=min(limit, config.CHUNK_FETCH_PAGE_SIZE) if limit else None,
+                                       knowledge_base=knowledge_base)
+        file_chunks = list(itertools.islice(chunks, limit))
         logger.info(f"Found {len(file_chunks)} chunks for source: {source_filename}")
         return file_chunks
 
     except Exception as e:
         logger.error(f"Error retrieving chunks for source '{source_filename}': {e}")
         traceback.print_exc()
-        return []
\ No newline at end of file
+        return []
@@ -0,0 +1,195 @@
+import logging
+from abc import ABC, abstractmethod
+import numpy as np
+from typing import List, Dict, Any, Iterator, Set
+
+logger = logging.getLogger(__name__) # Get logger instance
+logger.setLevel(logging.INFO) # Set level for this module
+
+
+class VectorStore(ABC):
+    """
+    Storage interface behind vector_db_manager: chunks with their embedding, document text
+    and metadata (which always contains the chunk's 'source' filename). Distances are
+    cosine distances (0 = identical), so RAG_SCORE_THRESHOLD means the same for every backend.
+    Embeddings are always computed by the caller; backends never call Ollama themselves.
+    A backend that misses a method fails when it is instantiated, not when the method is first called.
+    """
+    name = "base"
+
+    @abstractmethod
+    def count(self) -> int:
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, ids: List[str], documents: List[str], embeddings: List[List[float]], metadatas: List[Dict[str, Any]]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_metadatas(self, ids: List[str], metadatas: List[Dict[str, Any]]):
+        """Replaces the metadata of existing chunks, leaving their text and embedding untouched."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete_source(self, source: str):
+        """Deletes every chunk of a source file."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def get_ids_by_source(self, source: str) -> Set[str]:
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_source_chunks(self, source: str, start: int = 0, page_size: int = 500) -> Iterator[Dict[str, Any]]:
+        """Yields {"content", "metadata"} for a source's chunks in document order, starting at chunk ordinal start."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_metadatas(self, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """Yields the metadata of every stored chunk, one page at a time."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def iter_chunks(self, page_size: int = 1000) -> Iterator[Dict[str, Any]]:
+        """
+        Yields every stored chunk in pages of {"ids", "documents", "metadatas", "embeddings"},
+        with the embeddings of a page as one float32 matrix.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def query(self, embedding: List[float], n_results: int) -> List[Dict[str, Any]]:
+        """Returns up to n_results nearest chunks as {"id", "document", "distance", "metadata", "embedding"}, closest first."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def clear(self):
+        """Deletes every chunk."""
+        raise NotImplementedError
+
+
+class ChromaVectorStore(VectorStore):
+    """The ChromaDB collection (HNSW index, cosine space) as a VectorStore."""
+    name = "chroma"
+
+    def __init__(self, path: str, collection_name: str, embedding_function=None):
+        import chromadb
+        self.collection_name = collection_name
+        self._embedding_function = embedding_function
+        self._client = chromadb.PersistentClient(path=path)
+        self._collection = self._get_or_create_collection()
+
+    def _get_or_create_collection(self):
+        return self._client.get_or_create_collection(
+            name=self.collection_name,
+            embedding_function=self._embedding_function,
+            metadata={"hnsw:space": "cosine"} # Use cosine distance for similarity
+        )
+
+    def count(self) -> int:
+        return self._collection.count()
+
+    def add(self, ids, documents, embeddings, metadatas):
+        self._collection.add(documents=documents, embeddings=embeddings, metadatas=metadatas, ids=ids)
+
+    def update_metadatas(self, ids, metadatas):
+        self._collection.update(ids=ids, metadatas=metadatas)
+
+    def delete(self, ids):
+        self._collection.delete(ids=ids)
+
+    def delete_source(self, source):
+        self._collection.delete(where={"source": source})
+
+    def get_ids_by_source(self, source):
+        return set(self._collection.get(where={"source": source}, include=[])['ids'])
+
+    def iter_source_chunks(self, source, start=0, page_size=500):
+        # Metadata-only gets, one page of 'chunk_index' values at a time, so no ANN search is made
+        position = start
+        while True:
+            results = self._collection.get(
+                where={"$and": [
+                    {"source": source},
+                    {"chunk_index": {"$gte": position}},
+                    {"chunk_index": {"$lt": position + page_size}}
+                ]},
+                include=['documents', 'metadatas']
+            )
+            if not results['ids']:
+                break
+            page = sorted(zip(results['documents'], results['metadatas']), key=lambda item: item[1]['chunk_index'])
+            for doc_content, doc_metadata in page:
+                yield {"content": doc_content, "metadata": doc_metadata}
+            position += page_size
+
+        if position == start:
+            # Nothing was indexed by ordinal: chunks ingested before 'chunk_index' existed.
+            # Fall back to plain paging in storage order.
+            offset = start
+            while True:
+                results = self._collection.get(
+                    where={"source": source},
+                    include=['documents', 'metadatas'],
+                    limit=page_size,
+                    offset=offset
+                )
+                if not results['ids']:
+                    break
+                for doc_content, doc_metadata in zip(results['documents'], results['metadatas']):
+                    yield {"content": doc_content, "metadata": doc_metadata}
+                offset += len(results['ids'])
+
+    def iter_metadatas(self, page_size=1000):
+        offset = 0
+        while True:
+            results = self._collection.get(include=['metadatas'], limit=page_size, offset=offset)
+            if not results['ids']:
+                break
+            for metadata in results['metadatas']:
+                yield metadata or {}
+            offset += len(results['ids'])
+
+    def iter_chunks(self, page_size=1000):
+        offset = 0
+        while True:
+            results = self._collection.get(include=['documents', 'metadatas', 'embeddings'], limit=page_size, offset=offset)
+            if not results['ids']:
+                break
+            yield {
+                "ids": results['ids'],
+                "documents": results['documents'],
+                "metadatas": [metadata or {} for metadata in results['metadatas']],
+                "embeddings": np.asarray(results['embeddings'], dtype=np.float32),
+            }
+            offset += len(results['ids'])
+
+    def query(self, embedding, n_results):
+        results = self._collection.query(
+            query_embeddings=[embedding],
+            n_results=n_results,
+            include=['documents', 'distances', 'metadatas', 'embeddings'] # Embeddings are reused by the MMR re-ranker
+        )
+        if not results or not results.get('documents') or not results['documents'][0]:
+            return []
+        return [
+            {
+                "id": results['ids'][0][i],
+                "document": results['documents'][0][i],
+                "distance": results['distances'][0][i],
+                "metadata": results['metadatas'][0][i],
+                "embedding": results['embeddings'][0][i],
+            }
+            for i in range(len(results['documents'][0]))
+        ]
+
+    def clear(self):
+        self._client.delete_collection(name=self.collection_name)
+        logger.info(f"ChromaDB collection '{self.collection_name}' deleted.")
+        # Re-create the collection right away so it's ready for new data
+        self._collection = self._get_or_create_collection()
+        logger.info(f"ChromaDB collection '{self.collection_name}' re-created after clearing.")